@@ -0,0 +1,321 @@
+import mmap
+import re
+import struct
+from dataclasses import dataclass, field
+
+# VCD timescale (e.g. '1ps' or '1 ps')
+TIMESCALE_RE = re.compile(r"(\d+)\s*([munpf]?s)")
+
+# binary summary: magic, version, timescale (value, unit), duration, clock cycles, number of bits,
+# then for each bit: name length, name, t0, t1, tx, tc, glitches
+SUMMARY_MAGIC = b"APPA"
+SUMMARY_VERSION = 1
+SUMMARY_HEADER = struct.Struct("<4sHI2sQQI")
+SUMMARY_BIT = struct.Struct("<QQQQQ")
+
+
+@dataclass
+class BitActivity:
+    """Switching activity of one bit (durations in timescale units, as in SAIF)"""
+    t0: int = 0
+    t1: int = 0
+    tx: int = 0
+    tc: int = 0
+
+    # toggles beyond the first within a single clock period
+    glitches: int = 0
+
+    @property
+    def static_probability(self):
+        """Fraction of the (known) time the bit is 1"""
+        known = self.t0 + self.t1
+        return self.t1 / known if known else 0.0
+
+
+@dataclass
+class ActivityReport:
+    """Switching activity of every bit of a VCD"""
+    timescale: tuple = (1, "ns")
+    duration: int = 0
+    clock_cycles: int = 0
+
+    # hierarchical bit name (e.g. ('task1_tb', 'pcpi_rs1[3]')) -> BitActivity
+    signals: dict = field(default_factory=dict)
+
+    @property
+    def toggles(self):
+        return sum(activity.tc for activity in self.signals.values())
+
+    @property
+    def glitches(self):
+        return sum(activity.glitches for activity in self.signals.values())
+
+    def score(self):
+        """Toggles per clock cycle over all bits, a cheap proxy of dynamic power to rank designs"""
+        return self.toggles / self.clock_cycles if self.clock_cycles else float(self.toggles)
+
+    def top(self, n=10):
+        """The n bits which toggle the most"""
+        return sorted(self.signals.items(), key=lambda item: item[1].tc, reverse=True)[:n]
+
+
+def _expand(value, width):
+    """Left-extend a VCD vector value to the width of the signal (MSB first)"""
+    if len(value) >= width:
+        return value[-width:]
+
+    # 'b1' means 0...01, but 'bx' means x...x
+    pad = value[:1] if value[:1] in (b"x", b"z") else b"0"
+    return pad * (width - len(value)) + value
+
+
+def _lines(mm):
+    """Iterate over the lines of a memory-mapped file without copying the whole file"""
+    pos = 0
+    size = len(mm)
+
+    while pos < size:
+        end = mm.find(b"\n", pos)
+        if end == -1:
+            end = size
+        yield mm[pos:end]
+        pos = end + 1
+
+
+def analyze(vcd_path, clock="clk"):
+    """Stream a VCD and compute the switching activity of every bit
+
+    The file is memory-mapped and read line by line, and only the current value and
+    the counters of each signal are kept, so memory is bounded by the number of
+    signals rather than the size of the VCD.
+
+    Args:
+        vcd_path: Path of the VCD (e.g. the one produced by sim in the work directory)
+
+    Kwargs:
+        clock: Name of the clock signal which defines the windows for glitch counting.
+               The shallowest signal with this name is used
+
+    Returns an ActivityReport
+    """
+    report = ActivityReport()
+
+    with open(vcd_path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return report
+
+        with mm:
+            lines = _lines(mm)
+
+            variables, clock_code = _read_header(lines, report, clock)
+            _read_changes(lines, report, variables, clock_code)
+
+    return report
+
+
+def merge(reports):
+    """Combine the activity of simulations which ran one after the other (e.g. the shards of sim)
+
+    Durations, toggles and clock cycles add up, so the result is the activity of the
+    concatenation of the simulations. The reports must have the same timescale
+    """
+    merged = ActivityReport()
+
+    for report in reports:
+        if merged.signals and report.timescale != merged.timescale:
+            raise ValueError("Activity reports have different timescales", merged.timescale, report.timescale)
+
+        merged.timescale = report.timescale
+        merged.duration += report.duration
+        merged.clock_cycles += report.clock_cycles
+
+        for name, activity in report.signals.items():
+            total = merged.signals.setdefault(name, BitActivity())
+            total.t0 += activity.t0
+            total.t1 += activity.t1
+            total.tx += activity.tx
+            total.tc += activity.tc
+            total.glitches += activity.glitches
+
+    return merged
+
+
+def _read_header(lines, report, clock):
+    """Parse the VCD declarations up to $enddefinitions"""
+
+    # VCD identifier code -> list of (scope, name, msb, lsb), several vars can share a code
+    variables = {}
+    scopes = []
+    clock_code = None
+    clock_depth = None
+
+    tokens = []
+    for line in lines:
+        tokens += line.split()
+        if b"$enddefinitions" in line:
+            break
+
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        end = tokens.index(b"$end", i)
+
+        if token == b"$timescale":
+            match = TIMESCALE_RE.match(b"".join(tokens[i+1:end]).decode())
+            if match:
+                report.timescale = (int(match.group(1)), match.group(2))
+        elif token == b"$scope":
+            scopes.append(tokens[i+2].decode())
+        elif token == b"$upscope":
+            scopes.pop()
+        elif token == b"$var" and tokens[i+1] not in (b"real", b"realtime"):
+            width, code, name = int(tokens[i+2]), tokens[i+3], tokens[i+4].decode()
+            msb, lsb = width - 1, 0
+            if end > i + 5:
+                bounds = tokens[i+5].decode().strip("[]").split(":")
+                msb = int(bounds[0])
+                lsb = int(bounds[-1])
+            variables.setdefault(code, []).append((tuple(scopes), name, msb, lsb))
+
+            if name == clock and width == 1 and (clock_depth is None or len(scopes) < clock_depth):
+                clock_code = code
+                clock_depth = len(scopes)
+
+        i = end + 1
+
+    return variables, clock_code
+
+
+def _read_changes(lines, report, variables, clock_code):
+    """Accumulate the value changes of the VCD body into the report"""
+
+    widths = {code: abs(entries[0][2] - entries[0][3]) + 1 for code, entries in variables.items()}
+    values = {code: b"x" * width for code, width in widths.items()}
+    stats = {code: [BitActivity() for _ in range(width)] for code, width in widths.items()}
+    last_change = dict.fromkeys(variables, 0)
+
+    # (toggles, time of the last toggle) of each bit since the last rising edge of the clock
+    window = {}
+
+    now = 0
+
+    def change(code, value):
+        if code not in values:
+            return
+        old = values[code]
+        value = _expand(value, widths[code])
+        if value == old and now == last_change[code]:
+            return
+        elapsed = now - last_change[code]
+
+        for bit in range(len(old)):
+            before = old[bit]
+            activity = stats[code][bit]
+            if before == 48:    # '0'
+                activity.t0 += elapsed
+            elif before == 49:  # '1'
+                activity.t1 += elapsed
+            else:
+                activity.tx += elapsed
+
+            after = value[bit]
+            if before != after and before in (48, 49) and after in (48, 49):
+                activity.tc += 1
+                if code != clock_code:
+                    toggles = window.setdefault((code, bit), [0, now])
+                    toggles[0] += 1
+                    toggles[1] = now
+
+        values[code] = value
+        last_change[code] = now
+
+        if code == clock_code and old == b"0" and value == b"1":
+            report.clock_cycles += 1
+            close_window()
+
+    def close_window():
+        # changes at the time of the edge are registered outputs, which belong to the next period
+        carried = {}
+        for key, (toggles, last) in window.items():
+            if last == now:
+                toggles -= 1
+                carried[key] = [1, now]
+            if toggles > 1:
+                stats[key[0]][key[1]].glitches += toggles - 1
+        window.clear()
+        window.update(carried)
+
+    pending = None
+    for line in lines:
+        for token in line.split():
+            head = token[:1]
+            # the identifier code of a vector change (which can start with any character)
+            if pending is not None:
+                if pending != b"r":
+                    change(token, pending)
+                pending = None
+            elif head == b"#":
+                now = int(token[1:])
+            elif head in (b"0", b"1", b"x", b"X", b"z", b"Z"):
+                change(token[1:], head.lower())
+            elif head in (b"b", b"B"):
+                pending = token[1:].lower()
+            elif head in (b"r", b"R"):
+                # real values are skipped, along with their identifier code
+                pending = b"r"
+
+    # account for the time between the last change of each signal and the end
+    for code in variables:
+        change(code, values[code])
+    close_window()
+
+    report.duration = now
+
+    for code, entries in variables.items():
+        for scope, name, msb, lsb in entries:
+            step = -1 if msb >= lsb else 1
+            for bit, index in enumerate(range(msb, lsb + step, step)):
+                bit_name = name if widths[code] == 1 and msb == lsb == 0 else f"{name}[{index}]"
+                report.signals[(*scope, bit_name)] = stats[code][bit]
+
+
+def write_summary(report, path):
+    """Write an ActivityReport as a compact binary file"""
+    unit = report.timescale[1].encode().ljust(2, b"\0")
+
+    with open(path, "wb") as f:
+        f.write(SUMMARY_HEADER.pack(SUMMARY_MAGIC, SUMMARY_VERSION, report.timescale[0], unit,
+                                    report.duration, report.clock_cycles, len(report.signals)))
+
+        for path_, activity in report.signals.items():
+            name = "/".join(path_).encode()
+            f.write(struct.pack("<H", len(name)) + name)
+            f.write(SUMMARY_BIT.pack(activity.t0, activity.t1, activity.tx,
+                                     activity.tc, activity.glitches))
+
+
+def read_summary(path):
+    """Read back a binary summary written by write_summary"""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    magic, version, scale, unit, duration, cycles, count = SUMMARY_HEADER.unpack_from(data)
+    if magic != SUMMARY_MAGIC or version != SUMMARY_VERSION:
+        raise ValueError("Not an activity summary", path)
+
+    report = ActivityReport(timescale=(scale, unit.rstrip(b"\0").decode()),
+                            duration=duration, clock_cycles=cycles)
+
+    offset = SUMMARY_HEADER.size
+    for _ in range(count):
+        (length,) = struct.unpack_from("<H", data, offset)
+        offset += 2
+        name = tuple(data[offset:offset+length].decode().split("/"))
+        offset += length
+        report.signals[name] = BitActivity(*SUMMARY_BIT.unpack_from(data, offset))
+        offset += SUMMARY_BIT.size
+
+    return report
@@ -1,12 +1,20 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
+import asyncio
 import json
-import tiktoken
+import time
+import os
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from dataclasses import dataclass
 from enum import Enum
 from dotenv import load_dotenv
-from .sim import sim
-from .synth import synth
-from .power import power
+from .pipeline import evaluate, rank, screen, not_promoted, HeadStart, STAGES, METRIC_STAGE
+from .pareto import ParetoFront, FRONT_DIR
+from .compaction import Compactor, summarize
+from . import compaction, profiling
+from .engine import AskUser, find_module_end, iterate
 
 load_dotenv()
 
@@ -53,48 +61,168 @@ class Message:
 
 class LLM:
     def __init__(self, system_prompt=SYSTEM_PROMPT, max_context_len=100000, model="gpt-5-mini"):
-        """Wrapper around OpenAI model which keeps context (memory)"""
+        """Wrapper around OpenAI model which keeps context (memory)
+        
+        The context is a sliding window of turns (a user message and the replies to it),
+        and the oldest turns are dropped as a whole when it exceeds max_context_len.
+        The token count of each message is computed once when it is added. The system
+        prompt and the best design so far (see pin) are never dropped.
+        """
         
         super().__init__()
         
         self.system_prompt = system_prompt
-
-        self.messages = []
         self.max_context_len = max_context_len
-        self.curr_context_len = 0 
         
         self.model = model
-        self.enc = tiktoken.encoding_for_model(model)
         
-        self.add_to_context(self.system_prompt, "system")
+        # loaded on first use (tiktoken reads its encoding files)
+        self._enc = None
+        self._system_len = None
+        
+        # each turn is a list of [message, tokens, turn number], turn_lens holds the total of each turn
+        self.turns = deque()
+        self.turn_lens = deque()
+        self.window_len = 0
+        
+        # number of turns dropped since the start of the session
+        self.dropped_turns = 0
+        
+        # (message, tokens, turn number) of the best design so far
+        self.pinned = None
+        
+        # input and output tokens reported by the API over the session
+        self.used_tokens = 0
+        
+        # entries of the last prompt and of the last reply of __call__
+        self.last_prompt = None
+        self.last_reply = None
         
-        self.client = OpenAI()
+        # created in the event loop which uses it
+        self._client = None
+        self._client_loop = None
         
-    def add_to_context(self, message, role="user", update_len=True):
-        """Helper function to add to context and truncate if necessary"""
+    @property
+    def enc(self):
+        if self._enc is None:
+            import tiktoken
+            self._enc = tiktoken.encoding_for_model(self.model)
+        return self._enc
+    
+    @property
+    def system_len(self):
+        if self._system_len is None:
+            self._system_len = len(self.enc.encode(self.system_prompt))
+        return self._system_len
+    
+    def pinned_in_context(self):
+        """The pinned design is only repeated once the turn which produced it was dropped"""
+        return self.pinned is not None and self.pinned[2] < self.dropped_turns
+    
+    @property
+    def curr_context_len(self):
+        length = self.system_len + self.window_len
+        if self.pinned_in_context():
+            length += self.pinned[1]
+        return length
+    
+    @property
+    def messages(self):
+        """Input of the next request: system prompt, pinned design and the window of turns"""
+        messages = [{"role": "system", "content": self.system_prompt}]
+        
+        if self.pinned_in_context():
+            messages.append(self.pinned[0])
+        
+        for turn in self.turns:
+            messages.extend(entry[0] for entry in turn)
+        
+        return messages
+        
+    def add_to_context(self, message, role="user", tokens=None):
+        """Helper function to add to context and truncate if necessary
+        
+        A user message starts a new turn. 'tokens' can be given when the
+        length of the message is already known (e.g. from the API usage)
+        
+        Returns the entry of the message, which can be given to rewrite
+        """
         
-        self.messages.append({"role": role, "content": message})
+        if tokens is None:
+            tokens = len(self.enc.encode(message))
         
-        if update_len:
-            self.curr_context_len += len(self.enc.encode(message))
+        if role == "user" or not self.turns:
+            self.turns.append([])
+            self.turn_lens.append(0)
+        
+        # the turn number is kept to find the turn of the entry in rewrite
+        entry = [{"role": role, "content": message}, tokens, self.dropped_turns + len(self.turns) - 1]
+        self.turns[-1].append(entry)
+        self.turn_lens[-1] += tokens
+        self.window_len += tokens
             
         if self.curr_context_len > self.max_context_len:
             self.truncate()
         
+        return entry
+    
+    def rewrite(self, entry, message):
+        """Replace the content of a message of the context (e.g. with a summary)
+        
+        Args:
+            entry: The entry returned by add_to_context (nothing is done if its turn was dropped)
+            message: The new content
+        """
+        position = entry[2] - self.dropped_turns
+        if position < 0 or entry[0]["content"] == message:
+            return
+        
+        tokens = len(self.enc.encode(message))
+        entry[0] = {**entry[0], "content": message}
+        
+        self.turn_lens[position] += tokens - entry[1]
+        self.window_len += tokens - entry[1]
+        entry[1] = tokens
+    
+    def pin(self, design):
+        """Keep a design (the best one so far) in the context even after its turn is dropped
+        
+        Should be called after the design was added to the context
+        """
+        message = {"role": "user", "content": f"CURRENT BEST DESIGN (from an earlier iteration):\n{design}"}
+        turn = self.dropped_turns + len(self.turns) - 1
+        self.pinned = (message, len(self.enc.encode(message["content"])), turn)
+        
+        if self.curr_context_len > self.max_context_len:
+            self.truncate()
+        
+    @property
+    def client(self):
+        """Async OpenAI client of the running event loop (its connections can't be shared between loops)"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = AsyncOpenAI()
+            self._client_loop = loop
+        return self._client
         
-    def __call__(self, message):
-        """Run the inference"""
+    async def __call__(self, message):
+        """Run the inference (async generator of the output text deltas)"""
         
-        self.add_to_context(message)
+        self.last_prompt = self.add_to_context(message)
         
-        stream = self.client.responses.create(
+        start = time.perf_counter()
+        first_token = None
+        input_tokens = self.curr_context_len
+        
+        stream = await self.client.responses.create(
             model=self.model,
             input=self.messages,
             stream=True
         )
         
         output_text = []
-        for event in stream:
+        output_tokens = None
+        async for event in stream:
             
             if event.type == 'error':
                 raise Exception("Error generating text during LLM inference", event)
@@ -103,6 +231,8 @@ class LLM:
                 raise Exception("Max output tokens reached when running inference")
                         
             if event.type == 'response.output_text.delta':
+                if first_token is None:
+                    first_token = time.perf_counter()
                 output_text.append(event.delta)
                 yield event.delta
             
@@ -110,51 +240,100 @@ class LLM:
                 # this includes reasoning tokens, so we can't just tokenize the output text
                 # to get the token amount. also note that input_tokens length is slightly different than tiktoken expects
                 # (probably due to assistant/user role tokens)
-                self.curr_context_len += event.response.usage.output_tokens
+                output_tokens = event.response.usage.output_tokens
+                self.used_tokens += event.response.usage.total_tokens
         
-        self.add_to_context("".join(output_text), "assistant", update_len=False)
+        self.last_reply = self.add_to_context("".join(output_text), "assistant", tokens=output_tokens)
         
+        # time to first token, then the generation rate of the rest of the output
+        end = time.perf_counter()
+        if first_token is not None:
+            profiling.record("llm.first_token", start, first_token, model=self.model,
+                             input_tokens=input_tokens)
+            profiling.record("llm.stream", first_token, end, model=self.model, output_tokens=output_tokens,
+                             tokens_per_s=round(output_tokens / (end - first_token), 1)
+                                          if output_tokens and end > first_token else None)
         
-    def truncate(self):
-        """Chop off previous context if length exceeds limit"""
+    async def sample(self, message, n):
+        """Request n independent completions of the same context concurrently
         
-        curr_context_len = 0
-        for i in range(len(self.messages)-1, -1, -1):
-            
-            tokenized_message = self.enc.encode(self.messages[i]['content'])
-            curr_message_len = len(tokenized_message)
+        Unlike __call__, the outputs are not added to the context: the caller
+        decides which one to keep with add_to_context
+        """
+        
+        self.last_prompt = self.add_to_context(message)
+        
+        messages = self.messages
+        
+        async def request():
+            response = await self.client.responses.create(
+                model=self.model,
+                input=messages
+            )
             
-            curr_context_len += curr_message_len
+            if response.error:
+                raise Exception("Error generating text during LLM inference", response.error)
             
-            remaining_tokens = self.max_context_len - curr_context_len
+            self.used_tokens += response.usage.total_tokens
             
-            if remaining_tokens < 0 :
-                
-                # first truncate all messages before this index
-                self.messages = self.messages[i:]
-                
-                # then partially truncate this message
-                self.messages[-1]['content'] = self.enc.decode(tokenized_message[-remaining_tokens:])
-                
-                self.curr_context_len = self.max_context_len
-                
-                return
+            return response.output_text
+        
+        with profiling.span("llm.sample", model=self.model, n=n):
+            return list(await asyncio.gather(*(request() for _ in range(n))))
+        
+        
+    def truncate(self):
+        """Drop the oldest turns until the context fits (each turn is dropped once, so amortized O(1))
+        
+        The latest turn is never dropped. If it doesn't fit on its own, the beginning
+        of its first message is chopped off
+        """
+        
+        while self.curr_context_len > self.max_context_len and len(self.turns) > 1:
+            self.turns.popleft()
+            self.window_len -= self.turn_lens.popleft()
+            self.dropped_turns += 1
+        
+        excess = self.curr_context_len - self.max_context_len
+        if excess <= 0:
+            return
+        
+        entry = self.turns[-1][0]
+        tokenized_message = self.enc.encode(entry[0]["content"])
+        remaining_tokens = max(len(tokenized_message) - excess, 0)
+        
+        entry[0] = {**entry[0], "content": self.enc.decode(tokenized_message[len(tokenized_message)-remaining_tokens:])}
+        
+        removed = entry[1] - remaining_tokens
+        entry[1] = remaining_tokens
+        self.turn_lens[-1] -= removed
+        self.window_len -= removed
 
 class Agent:
     def __init__(self, task_num, debug=False,
                  system_prompt=None,
                  initial_prompt=None, max_context_len=100000,
-                 max_iters=5):
+                 max_iters=5, use_cache=True, candidates=1, front_dir=None, promote=2):
         
         """AI agent which tries to optimize Verilog HDL code for a given task
         
         In this initialization, we load the task information from the metadata,
         create the LLM model to perform inference, and then prepare the initial
         prompt passed which will kick off the AI agent loop
+        
+        With several candidates per iteration, they are all screened at the fast
+        fidelity and only the 'promote' best ones go through the complete flow
+        (None to run the complete flow on every candidate)
         """
 
         self.debug = debug
         self.max_iters = max_iters
+        self.use_cache = use_cache
+        self.candidates = candidates
+        self.promote = promote
+        
+        # processes which evaluate the candidates, for the duration of run()
+        self.pool = None
         
         with open('benchmark/metadata.json') as f:
             task_info = json.load(f)
@@ -168,6 +347,9 @@ class Agent:
         with open(f"benchmark/task{task_num}.v", "r") as f:
             testbench_code = f.read()
         
+        # once a design passed, the baseline code is superseded by the best design
+        self.compact_initial_prompt = None
+        
         if initial_prompt:
             self.initial_prompt = initial_prompt
         else:
@@ -177,11 +359,87 @@ class Agent:
                 f"BASELINE VERILOG CODE:\n{baseline_code}\n\n"
                 f"TESTBENCH VERILOG CODE:\n\n{testbench_code}\n"
             )
+            self.compact_initial_prompt = (
+                f"\nTASK DESCRIPTION:\n{self.task['description']}\n\n"
+                f"BASELINE METRIC:\n{self.task['baseline']} {self.task['units']}\n\n"
+                f"BASELINE VERILOG CODE:\n[removed to save space, the best design so far is given instead]\n\n"
+                f"TESTBENCH VERILOG CODE:\n\n{testbench_code}\n"
+            )
             
         self.model = LLM(system_prompt=system_prompt if system_prompt else SYSTEM_PROMPT,
                          max_context_len=max_context_len)
         
-    def __call__(self):
+        # best design so far (and its evaluation), which is pinned in the LLM context
+        self.best = None
+        self.best_design = None
+        
+        # evaluation of the design kept at the last iteration
+        self.evaluation = None
+        self.iteration = None
+        
+        # old designs and tool feedback in the LLM context are replaced with summaries
+        self.compactor = Compactor(self.model)
+        self.initial_entry = None
+        self.last_summary = None
+        
+        # every design which passed is offered to the front, which is written after each iteration
+        self.front = ParetoFront()
+        self.front_dir = front_dir if front_dir else os.path.join(FRONT_DIR, f"task{task_num}")
+        
+    def update_best(self, design, evaluation):
+        """Pin the design in the LLM context if it beats the best one so far"""
+        self.front.add(design, evaluation, self.iteration)
+        
+        if not evaluation.passed:
+            return
+        
+        if self.best is not None and rank([self.best, evaluation], self.task['metric'])[0] == 0:
+            return
+        
+        self.best = evaluation
+        self.best_design = design
+        self.model.pin(design)
+        
+    def compact(self, design_entry, evaluation, summary):
+        """Summarize the parts of the LLM context which this iteration superseded
+        
+        Args:
+            design_entry: Context entry of the design kept at this iteration
+            evaluation: Its evaluation
+            summary: Summary of the feedback of this iteration, used once it is superseded
+        """
+        prompt_entry = self.model.last_prompt
+        
+        if self.iteration == 0:
+            self.initial_entry = prompt_entry
+        elif self.last_summary is not None:
+            self.compactor.add_feedback(prompt_entry, self.last_summary)
+        self.last_summary = summary
+        
+        self.compactor.add_design(design_entry, evaluation)
+        self.compactor.compact(self.best.design_hash if self.best is not None else None)
+        
+        if self.best is not None and self.compact_initial_prompt and self.initial_entry is not None:
+            self.model.rewrite(self.initial_entry, self.compact_initial_prompt)
+        
+    def improvement(self):
+        """Improvement of the best design over the baseline of the task in percent (None if no design passed)"""
+        if self.best is None:
+            return None
+        
+        baseline = float(self.task['baseline'])
+        value = self.best.metric(METRIC_STAGE[self.task['metric']])
+        return 100 * (baseline - value) / baseline
+        
+    def __call__(self, stop_policy=None):
+        """Run the optimization task with an LLM in a loop
+        
+        This is a synchronous generator of the messages of run(), by default the
+        user is asked on the terminal whether to continue after each iteration
+        """
+        yield from iterate(self.run(stop_policy if stop_policy else AskUser()))
+        
+    async def run(self, stop_policy=None):
         """Run the optimization task with an LLM in a loop
         
         The LLM will output Verilog code which will then be tested with
@@ -189,62 +447,183 @@ class Agent:
         with PPA information. The agent will then decide whether or not to 
         keep iterating on the design so as to achieve the best optimization.
         
-        The iterations stop when we reach 'max_iters' or the user manually 
-        stops the loop.
+        The iterations stop when we reach 'max_iters' or when the stop policy
+        (an awaitable, see engine.py) says so.
+        
+        As soon as the streamed LLM output contains a complete module, its
+        pre-screen and simulation are started (speculatively) while the rest
+        of the response is still being generated.
+        
+        If 'candidates' is more than 1, each iteration asks for that many
+        independent designs which are evaluated in parallel, and the LLM
+        is given a ranked summary of all of them.
         
         The best LLM output (with respect to PPA) is saved. At the end of the loop,
         we output this module again, along with the PPA metrics.
         
-        This function is a generator which yields a tuple. The first element is the
-        output 'role' (system/user/assistant/tool), and the second element is the 
-        actual message.
+        This function is an async generator which yields Messages. The 'role' is the
+        output type (system/user/assistant/tool) and 'content' the actual message.
         """
+        
+        stop_policy = stop_policy if stop_policy else AskUser()
+        
+        profiling.annotate(task=self.task_num)
 
         yield Message(Role.SYSTEM, self.model.system_prompt) 
 
         user_prompt = self.initial_prompt
         
-        for i in range(self.max_iters):
+        with ExitStack() as stack:
+            if self.candidates > 1:
+                # the tools are CPU bound, so the candidates are spread across the cores. The pool (and
+                # the Yosys and OpenSTA processes of its workers) is kept from one iteration to the next
+                workers = min(self.candidates, os.cpu_count() or 1)
+                self.pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+                stack.callback(setattr, self, "pool", None)
             
-            if self.debug:
-                print(f"ITERATION {i}/{self.max_iters}")
-            
-            result = []
-            yield Message(Role.USER, user_prompt)
-
-            messages = self.model(user_prompt)
+            for i in range(self.max_iters):
+                
+                if self.debug:
+                    print(f"ITERATION {i}/{self.max_iters}")
+                
+                self.iteration = i
+                profiling.annotate(iteration=i)
+                yield Message(Role.USER, user_prompt)
+                
+                feedback = []
+                step = self.step_candidates if self.candidates > 1 else self.step
+                
+                async for message in step(user_prompt, feedback):
+                    yield message
+                
+                user_prompt = "".join(feedback)
+                
+                self.front.write(self.front_dir)
 
-            for message in messages:
-                result.append(message)
-                yield Message(Role.ASSISTANT, message)
+                if not await stop_policy(self, i, self.evaluation):
+                    break
                 
-            result = "".join(result)
+            else:
+                print("Max iters reached. Exiting agent loop.")    
+        
+        if self.best is not None:
+            yield Message(Role.ASSISTANT, f"// BEST DESIGN ({self.improvement():+.2f}% over the baseline)\n"
+                                          f"{self.best_design}\n")
+            yield Message(Role.TOOL, str(self.best) + "\n")
             
-            if self.debug:
-                print(f"\nCURRENT CONTEXT WINDOW LENGTH: {self.model.curr_context_len} tokens\n")
+    async def step(self, user_prompt, feedback):
+        """Run one iteration with a single design
+        
+        This is an async generator (used by run) which yields the messages, and
+        appends the feedback prompt for the next iteration to 'feedback'
+        """
+        result = []
+        head_start = None
+        
+        # end of the output so far, long enough to see an 'endmodule' split across deltas
+        recent = ""
+        
+        async for delta in self.model(user_prompt):
+            result.append(delta)
+            yield Message(Role.ASSISTANT, delta)
             
-            user_prompt = ["Feedback from compilation, simulation, synthesis, and power tools:\n\n"]
-            yield Message(Role.TOOL, user_prompt[-1])
+            recent = recent[-len("endmodule"):] + delta
             
-            sim_result = sim(result, task=self.task_num, debug=self.debug)
-            user_prompt.append(sim_result + "\n")
-            yield Message(Role.TOOL, user_prompt[-1])
+            if head_start is None and "endmodule" in recent:
+                text = "".join(result)
+                end = find_module_end(text)
+                
+                # a complete module: start checking it while the LLM is still streaming
+                if end is not None:
+                    head_start = HeadStart(text[:end], task=self.task_num, debug=self.debug,
+                                           use_cache=self.use_cache)
             
-            synth_result = synth(result, debug=self.debug)
-            user_prompt.append(synth_result + "\n")
-            yield Message(Role.TOOL, user_prompt[-1])
+        result = "".join(result)
+        
+        if self.debug:
+            print(f"\nCURRENT CONTEXT WINDOW LENGTH: {self.model.curr_context_len} tokens\n")
+        
+        feedback.append("Feedback from compilation, simulation, synthesis, and power tools:\n\n")
+        yield Message(Role.TOOL, feedback[-1])
+        
+        # sim and synth run concurrently, then power. the evaluation blocks on the
+        # tools, so it runs in a thread and the event loop is free in the meantime
+        evaluation = await asyncio.to_thread(partial(evaluate, result, task=self.task_num, debug=self.debug,
+                                                     use_cache=self.use_cache, head_start=head_start))
+        self.update_best(result, evaluation)
+        self.evaluation = evaluation
+        self.compact(self.model.last_reply, evaluation, summarize(evaluation))
+        
+        for stage in STAGES:
+            feedback.append(compaction.feedback(evaluation.results[stage]) + "\n")
+            yield Message(Role.TOOL, feedback[-1])
             
-            power_result = power(result, task=self.task_num, debug=self.debug)
-            user_prompt.append(power_result + "\n")
-            yield Message(Role.TOOL, user_prompt[-1])
+    async def step_candidates(self, user_prompt, feedback):
+        """Run one iteration where several designs are generated and evaluated at once
+        
+        This is an async generator (used by run) which yields the messages, and
+        appends the feedback prompt for the next iteration to 'feedback'. The
+        designs are evaluated in the process pool of run()
+        """
+        
+        designs = await self.model.sample(user_prompt, self.candidates)
+        
+        for k, design in enumerate(designs):
+            yield Message(Role.ASSISTANT, f"// CANDIDATE {k+1}/{len(designs)}\n{design}\n\n")
+        
+        loop = asyncio.get_running_loop()
+        
+        def run(design, fidelity):
+            return loop.run_in_executor(self.pool, profiling.bind(evaluate, design, task=self.task_num,
+                                                                  debug=self.debug, use_cache=self.use_cache,
+                                                                  fidelity=fidelity))
+        
+        if self.promote is None or self.promote >= len(designs):
+            evaluations = await asyncio.gather(*(run(design, "signoff") for design in designs))
+        
+        else:
+            # cheap ranking first, then the liberty mapping and power analysis of the best ones
+            # (their pre-screen and simulation are cache hits)
+            evaluations = await asyncio.gather(*(run(design, "fast") for design in designs))
+            promoted = screen(evaluations, self.task['metric'], self.promote)
             
-            user_prompt = "".join(user_prompt)
-
-            print("Agent step done.")
-            cont = input("Continue? [y/n] ")
-            if cont.lower() != "y":
-                break
+            signoff = await asyncio.gather(*(run(designs[k], "signoff") for k in promoted))
             
-        else:
-            print("Max iters reached. Exiting agent loop.")    
+            for k in range(len(designs)):
+                if k not in promoted:
+                    not_promoted(evaluations[k], self.promote)
+            for k, evaluation in zip(promoted, signoff):
+                evaluations[k] = evaluation
         
+        ranking = rank(evaluations, self.task['metric'])
+        best = ranking[0]
+        
+        for design, evaluation in zip(designs, evaluations):
+            self.front.add(design, evaluation, self.iteration)
+        
+        # only the best design is kept in the context so that it doesn't grow N times faster
+        entry = self.model.add_to_context(designs[best], "assistant")
+        self.update_best(designs[best], evaluations[best])
+        self.evaluation = evaluations[best]
+        self.compact(entry, evaluations[best],
+                     "; ".join(f"candidate {k+1}: {summarize(evaluations[k])}" for k in ranking))
+        
+        feedback.append(f"{len(designs)} candidate designs were generated. "
+                        f"The best one (candidate {best+1}) was kept. Ranked feedback from "
+                        f"compilation, simulation, synthesis, and power tools:\n\n")
+        yield Message(Role.TOOL, feedback[-1])
+        
+        for position, k in enumerate(ranking):
+            summary = [f"RANK {position+1}: CANDIDATE {k+1}\n"]
+            
+            for stage in STAGES:
+                result = evaluations[k].results[stage]
+                
+                # full feedback for the kept design, but only the metric or the error for the others
+                if k == best or result.passed:
+                    summary.append(compaction.feedback(result) + "\n")
+                else:
+                    summary.append(result.error + "\n")
+                
+            feedback.append("".join(summary) + "\n")
+            yield Message(Role.TOOL, feedback[-1])
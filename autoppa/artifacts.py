@@ -0,0 +1,72 @@
+import os
+import shutil
+import uuid
+from .utils import evict_dirs, touch
+
+ARTIFACT_DIR = os.path.join("build", "artifacts")
+
+# upper bound on the on-disk size of the store, least recently used artifacts are evicted first
+MAX_ARTIFACT_BYTES = 1024 * 1024 * 1024
+
+
+def _artifact_path(design_hash, stage, key):
+    # the files of every stage of a design are next to each other, and the stage key
+    # (see cache.cache_key) tells apart the outputs of different tool inputs
+    return os.path.join(ARTIFACT_DIR, design_hash, f"{stage}-{key[:16]}")
+
+
+def get(design_hash, stage, key):
+    """Directory of the files a stage produced for a design, or None if they aren't stored"""
+    path = _artifact_path(design_hash, stage, key)
+
+    if not os.path.isdir(path) or not touch(path):
+        return None
+
+    return path
+
+
+def put(design_hash, stage, key, files):
+    """Move the files produced by a stage into the store
+
+    Args:
+        design_hash: Hash of the design (utils.design_hash)
+        stage: Name of the tool which produced the files (sim/synth)
+        key: Content address of the tool run (cache.cache_key)
+        files: Dictionary of name in the store -> path of the file
+
+    The files are moved into a temporary directory which is then renamed, so
+    that readers only ever see complete artifacts. If another process stored
+    the same artifact in the meantime, its copy is kept. The files are gone
+    from the work directory afterwards, so they are only stored once.
+
+    Returns the directory of the artifact
+    """
+    path = _artifact_path(design_hash, stage, key)
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+
+    os.makedirs(tmp_path)
+
+    # moved rather than linked, since the CLI steps re-use their work directories and
+    # the tools truncate their outputs in place (which would change a linked artifact).
+    # Within build/ this is a rename, across file systems a copy
+    for name, source in files.items():
+        shutil.move(source, os.path.join(tmp_path, name))
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    evict()
+
+    return path
+
+
+def evict(max_bytes=MAX_ARTIFACT_BYTES):
+    """Remove least recently used artifacts until the store fits in max_bytes"""
+    evict_dirs(ARTIFACT_DIR, max_bytes)
+
+
+def clear():
+    """Remove every artifact of the store"""
+    evict(max_bytes=0)
@@ -1,9 +1,25 @@
-from .sim import sim
-from .synth import synth
-from .power import power
+from .pipeline import evaluate, METRIC_STAGE, SCREEN_STAGE
+from concurrent.futures import ProcessPoolExecutor
+import csv
 import json 
+import os
+import sys
 
-def benchmark(task_num=1, baseline="reference", debug=False):
+# columns of the benchmark matrix table
+COLUMNS = ["task", "baseline", "metric", "fidelity", "status",
+           "performance_ns", "area_cells", "power_mw",
+           "slack_ns", "fmax_mhz", "time_at_fmax_ns",
+           "reference", "delta_pct"]
+
+# column of the table holding the metric of each stage
+STAGE_COLUMN = {"sim": "performance_ns", "synth": "area_cells", "power": "power_mw"}
+
+# kinds of metric which the fast tier ranks with a stand-in for the signoff metric. For the
+# others both tiers report the same number (the simulation, and the cell count of 'synth'),
+# so their agreement would be perfect by construction and isn't reported (see fidelity_report)
+PROXY_METRICS = [metric for metric in METRIC_STAGE if SCREEN_STAGE[metric] != METRIC_STAGE[metric]]
+
+def benchmark(task_num=1, baseline="reference", debug=False, use_cache=True):
     """Runs the specified benchmark task and associated baseline"""
     
     if task_num not in range(1, 6):
@@ -28,9 +44,205 @@ def benchmark(task_num=1, baseline="reference", debug=False):
     with open(f"baseline/{baseline}/task{task_num}.v", "r") as f:
         code = f.read()
                 
-    print(sim(code, task=task_num, debug=debug))
-    print()
-    print(synth(code, debug=debug))
-    print()
-    print(power(code, task=task_num, debug=debug))
-    
\ No newline at end of file
+    evaluation = evaluate(code, task=task_num, debug=debug, use_cache=use_cache)
+    
+    print(evaluation)
+
+
+def baseline_dirs():
+    """All the baseline directories shipped with the benchmark"""
+    return sorted(os.path.join("baseline", name) for name in os.listdir("baseline")
+                  if os.path.isdir(os.path.join("baseline", name)))
+
+
+def benchmark_cell(task_num, directory, debug=False, use_cache=True, fidelity="signoff"):
+    """Evaluate one design of the matrix and return its table row (see pipeline.evaluate for the fidelity)"""
+    
+    with open('benchmark/metadata.json') as f:
+        task_info = json.load(f)[task_num-1]
+    
+    row = dict.fromkeys(COLUMNS)
+    row.update(task=task_num,
+               baseline=os.path.basename(os.path.normpath(directory)),
+               metric=task_info['metric'],
+               fidelity=fidelity,
+               reference=float(task_info['baseline']))
+    
+    path = os.path.join(directory, f"task{task_num}.v")
+    if not os.path.isfile(path):
+        row["status"] = "missing"
+        return row
+    
+    with open(path, "r") as f:
+        code = f.read()
+    
+    evaluation = evaluate(code, task=task_num, debug=debug, use_cache=use_cache, fidelity=fidelity)
+    
+    row["status"] = "passed" if evaluation.passed else "failed"
+    row["performance_ns"] = evaluation.metric("sim")
+    row["area_cells"] = evaluation.metric("synth")
+    row["power_mw"] = evaluation.metric("power")
+    
+    # timing of the power analysis run, and the execution time at the max frequency
+    power = evaluation.results.get("power")
+    if power is not None and power.passed:
+        row["slack_ns"] = power.slack
+        row["fmax_mhz"] = round(power.fmax, 2) if power.fmax is not None else None
+        time_at_fmax = evaluation.time_at_fmax()
+        row["time_at_fmax_ns"] = round(time_at_fmax, 2) if time_at_fmax is not None else None
+    
+    value = evaluation.metric(METRIC_STAGE[task_info['metric']])
+    if value is not None:
+        row["delta_pct"] = round(100 * (value - row["reference"]) / row["reference"], 2)
+    
+    return row
+
+
+def benchmark_matrix(directories=None, tasks=range(1, 6), jobs=None, debug=False, use_cache=True,
+                     promote=None, fidelity="signoff"):
+    """Runs every task against every baseline directory on a pool of processes
+    
+    Kwargs:
+        directories: Directories containing task{N}.v designs (defaults to all of baseline/)
+        tasks: Which benchmark tasks to run
+        jobs: Number of worker processes (defaults to the number of cores)
+        debug: Output additional information from the tools
+        use_cache: Return stored results for designs which were already evaluated
+        promote: Screen every design at the fast fidelity first, and only run the complete flow
+                 on the 'promote' best designs of each task (the others have the status 'screened')
+        fidelity: Fidelity of the evaluations when not screening ('signoff' or 'fast')
+    
+    Returns a list of rows (one per task and directory) with the performance, area
+    and power, and the delta of the task metric against the metadata baseline in percent
+    (negative is better since every metric is minimized)
+    """
+    
+    if directories is None:
+        directories = baseline_dirs()
+    
+    cells = [(task_num, directory) for task_num in tasks for directory in directories]
+    
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        
+        def run(cells, fidelity):
+            futures = [pool.submit(benchmark_cell, task_num, directory, debug=debug, use_cache=use_cache,
+                                   fidelity=fidelity)
+                       for task_num, directory in cells]
+            return [future.result() for future in futures]
+        
+        if promote is None:
+            return run(cells, fidelity)
+        
+        rows = run(cells, "fast")
+        
+        # the best designs of each task on the metric of the fast tier
+        promoted = []
+        for task_num in tasks:
+            passed = [i for i, row in enumerate(rows) if row["task"] == task_num and row["status"] == "passed"]
+            passed.sort(key=lambda i: rows[i][STAGE_COLUMN[SCREEN_STAGE[rows[i]["metric"]]]])
+            promoted += passed[:promote]
+        
+        for i, row in enumerate(rows):
+            if row["status"] == "passed" and i not in promoted:
+                row["status"] = "screened"
+        
+        for i, row in zip(promoted, run([cells[i] for i in promoted], "signoff")):
+            rows[i] = row
+        
+        return rows
+
+
+def _ranks(values):
+    """Rank of each value (1 is the smallest), ties get the average of their ranks"""
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0.0] * len(values)
+    
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2 + 1
+        i = j + 1
+    
+    return ranks
+
+
+def spearman(xs, ys):
+    """Spearman rank correlation of two lists of values (None if it is undefined)"""
+    if len(xs) < 2:
+        return None
+    
+    rx, ry = _ranks(xs), _ranks(ys)
+    mx, my = sum(rx) / len(rx), sum(ry) / len(ry)
+    
+    cov = sum((x - mx) * (y - my) for x, y in zip(rx, ry))
+    sx = sum((x - mx) ** 2 for x in rx) ** 0.5
+    sy = sum((y - my) ** 2 for y in ry) ** 0.5
+    
+    if sx == 0 or sy == 0:
+        return None
+    
+    return cov / (sx * sy)
+
+
+def fidelity_report(directories=None, tasks=range(1, 6), jobs=None, debug=False, use_cache=True):
+    """How well the ranking of the fast tier agrees with the signoff tier
+    
+    Every design is evaluated at both fidelities. For each kind of metric which the fast
+    tier ranks with a stand-in (PROXY_METRICS, i.e. power ranked by the cell count), the metric
+    of the fast tier (SCREEN_STAGE) is compared with the signoff metric over all the designs
+    which passed both: their Spearman rank correlation, and the fraction of the pairs of
+    designs of a same task which both tiers order the same way
+    
+    Returns a list of rows, one per kind of metric
+    """
+    fast = benchmark_matrix(directories, tasks, jobs=jobs, debug=debug, use_cache=use_cache, fidelity="fast")
+    full = benchmark_matrix(directories, tasks, jobs=jobs, debug=debug, use_cache=use_cache)
+    
+    report = []
+    for metric in PROXY_METRICS:
+        points = []
+        for screened, signoff in zip(fast, full):
+            x = screened[STAGE_COLUMN[SCREEN_STAGE[metric]]]
+            y = signoff[STAGE_COLUMN[METRIC_STAGE[metric]]]
+            if x is not None and y is not None:
+                points.append((screened["task"], x, y))
+        
+        pairs = [(a, b) for i, a in enumerate(points) for b in points[i+1:] if a[0] == b[0]]
+        agree = sum((a[1] - b[1]) * (a[2] - b[2]) > 0 or (a[1] == b[1] and a[2] == b[2]) for a, b in pairs)
+        
+        report.append({"metric": metric,
+                       "fast": STAGE_COLUMN[SCREEN_STAGE[metric]],
+                       "signoff": STAGE_COLUMN[METRIC_STAGE[metric]],
+                       "designs": len(points),
+                       "spearman": spearman([p[1] for p in points], [p[2] for p in points]),
+                       "pairs_agreeing": f"{agree}/{len(pairs)}"})
+    
+    return report
+
+
+# columns of the fidelity report
+REPORT_COLUMNS = ["metric", "fast", "signoff", "designs", "spearman", "pairs_agreeing"]
+
+
+def write_table(rows, fmt="csv", file=None, columns=COLUMNS):
+    """Write the benchmark matrix (or another table) as CSV or JSON (to stdout by default)"""
+    
+    if fmt not in {"csv", "json"}:
+        raise ValueError("Invalid format", fmt)
+    
+    f = open(file, "w", newline="") if file else sys.stdout
+    
+    try:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=4)
+            f.write("\n")
+    finally:
+        if file:
+            f.close()
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import time
+from functools import lru_cache
+from .utils import normalize_verilog, touch
+from .results import StageResult
+
+CACHE_DIR = os.path.join("build", "cache")
+
+# bumped whenever the format of the stored results changes
+CACHE_VERSION = 3
+
+# upper bound on the on-disk size of the cache, least recently used entries are evicted first
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path, mtime_ns, size):
+    """Hash a file's content (memoized on mtime/size since the liberty file is large)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_digest(path):
+    """Hash of a file used as an input of a tool, or a marker if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return "missing"
+
+    return _file_digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+def cache_key(stage, code, *, files=(), extra=()):
+    """Content address of an evaluation
+
+    Args:
+        stage: Name of the tool which is being cached (sim/synth/power)
+        code: Verilog code of the design, normalized before hashing
+
+    Kwargs:
+        files: Paths of the other inputs of the tool (testbench, liberty, scripts...)
+        extra: Any other strings which influence the result (e.g. tool commands)
+    """
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}".encode("utf-8"))
+    h.update(stage.encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize_verilog(code).encode("utf-8"))
+
+    for path in files:
+        h.update(b"\0")
+        h.update(path.encode("utf-8"))
+        h.update(file_digest(path).encode("utf-8"))
+
+    for item in extra:
+        h.update(b"\0")
+        h.update(str(item).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.json")
+
+
+def get(key):
+    """Return the cached result for this key, or None on a miss"""
+    path = _entry_path(key)
+
+    try:
+        with open(path, "r") as f:
+            entry = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+    touch(path)
+
+    return entry["result"]
+
+
+def put(key, result, *, stage=None):
+    """Store a result in the cache, then evict old entries if it grew too large"""
+    path = _entry_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # write then rename so that concurrent readers never see a partial entry
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"stage": stage, "result": result}, f)
+    os.replace(tmp_path, path)
+
+    evict()
+
+
+def cached_stage(key, stage, run, *, span, debug=False, use_cache=True, reuse=None):
+    """Return the stored result of a stage, or run the stage and store its result
+
+    Args:
+        key: Content address of the stage (see cache_key)
+        stage: Name of the stage (prescreen/sim/synth/power)
+        run: Function which runs the tool (uncached) and returns a StageResult
+
+    Kwargs:
+        span: Attributes of the profiling span of the stage, marked as cached on a hit
+        debug: Print the cache hits
+        use_cache: Look up the stored result (the new result is stored either way)
+        reuse: Function which gets the stored result and returns it if it can still be
+               used (e.g. with the files it refers to), or None to run the stage again
+
+    A returned stored result has the wall_time of the lookup. The result of a tool
+    which ran out of time isn't stored, since the timeout may only be due to the
+    load of the machine, and neither is the result of a tool which crashed
+    """
+    start = time.perf_counter()
+    entry = get(key) if use_cache else None
+
+    if entry is not None:
+        result = StageResult.from_dict(entry)
+        if reuse is not None:
+            result = reuse(result)
+
+        if result is not None:
+            if debug:
+                print(f"Cache hit for {stage} ({key[:12]})")
+            # the cost of this lookup, not the one of the run which stored the result
+            result.wall_time = time.perf_counter() - start
+            result.cached = True
+            span["cached"] = True
+            return result
+
+    start = time.perf_counter()
+    result = run()
+    result.wall_time = time.perf_counter() - start
+
+    if not (result.timed_out or result.crashed):
+        put(key, result.to_dict(), stage=stage)
+
+    return result
+
+
+def evict(max_bytes=MAX_CACHE_BYTES):
+    """Remove least recently used entries until the cache fits in max_bytes"""
+    entries = []
+    total = 0
+
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    if total <= max_bytes:
+        return
+
+    for _, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+def clear():
+    """Remove every entry of the cache"""
+    evict(max_bytes=0)
@@ -0,0 +1,99 @@
+import re
+from .pareto import OBJECTIVES
+from .pipeline import METRIC_STAGE
+
+# lines of a tool log which explain a failure
+RELEVANT_RE = re.compile(r"error|warning|fail|timeout|syntax|unknown|undefined|not found|"
+                         r"cannot|unable|illegal|invalid|mismatch", re.IGNORECASE)
+
+# at most this many lines of a log are shown to the LLM
+MAX_LOG_LINES = 30
+
+UNITS = {"performance": "ns", "area": "cells", "power": "mW"}
+
+
+def clip_log(text, max_lines=MAX_LOG_LINES):
+    """Keep the lines of a tool log which explain the failure, without repeats
+
+    Repeated lines are counted rather than shown again. If no line looks
+    relevant, the end of the log is kept
+    """
+    lines = [line.rstrip() for line in text.splitlines() if line.strip()]
+
+    relevant = [line for line in lines if RELEVANT_RE.search(line)] or lines[-max_lines:]
+
+    counts = {}
+    for line in relevant:
+        counts[line] = counts.get(line, 0) + 1
+
+    clipped = [line if count == 1 else f"{line} [repeated {count} times]"
+               for line, count in counts.items()]
+
+    if len(clipped) > max_lines:
+        omitted = len(clipped) - max_lines
+        clipped = clipped[:max_lines] + [f"[... {omitted} more diagnostics omitted]"]
+
+    return "\n".join(clipped)
+
+
+def feedback(result):
+    """Feedback of one stage for the LLM: the success message, or the error with the clipped log"""
+    if result.passed or not result.output:
+        return str(result)
+
+    return f"{result.error}\n{clip_log(result.output)}"
+
+
+def summarize(evaluation):
+    """One line summary of an evaluation (its metrics, or the first stage which failed)"""
+    for stage, result in evaluation.results.items():
+        if not result.passed:
+            return f"failed at {stage}: {result.error}"
+
+    return ", ".join(f"{objective} {evaluation.metric(METRIC_STAGE[objective]):g} {UNITS[objective]}"
+                     for objective in OBJECTIVES)
+
+
+class Compactor:
+    """Rewrites the old messages of an LLM context into short summaries
+
+    Designs which were superseded are replaced with their metrics (only the
+    best and the latest designs are kept in full), and the tool feedback of past
+    iterations with a summary, so the input of each request stays roughly the
+    same size instead of growing with the number of iterations
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+        # [entry, design hash, summary] of the designs in the context which weren't compacted yet
+        self.designs = []
+
+        # [entry, summary] of the feedback messages which weren't compacted yet
+        self.feedback = []
+
+    def add_design(self, entry, evaluation):
+        """Register the context entry (see LLM.add_to_context) of a design"""
+        summary = f"[Earlier design {evaluation.design_hash[:12]} removed to save space: {summarize(evaluation)}]"
+        self.designs.append([entry, evaluation.design_hash, summary])
+
+    def add_feedback(self, entry, summary):
+        """Register the context entry of a tool feedback message"""
+        self.feedback.append([entry, f"[Earlier tool feedback removed to save space: {summary}]"])
+
+    def compact(self, best_hash=None):
+        """Summarize every design but the best and the latest one, and every feedback but the latest one
+
+        The latest design is kept since the next feedback is about it
+        """
+        kept = []
+        for i, (entry, design_hash, summary) in enumerate(self.designs):
+            if design_hash == best_hash or i == len(self.designs) - 1:
+                kept.append([entry, design_hash, summary])
+            else:
+                self.model.rewrite(entry, summary)
+        self.designs = kept
+
+        for entry, summary in self.feedback[:-1]:
+            self.model.rewrite(entry, summary)
+        self.feedback = self.feedback[-1:]
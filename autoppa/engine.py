@@ -0,0 +1,124 @@
+import asyncio
+import re
+import time
+
+# a complete module in the streamed LLM output, which is enough to start evaluating it
+ENDMODULE_RE = re.compile(r"\bendmodule\b")
+
+
+class StopPolicy:
+    """Decides after each iteration of the agent whether it keeps going
+
+    Policies are awaited by the agent loop, so they can wait on a user (or a UI)
+    without blocking the LLM stream and the tools of other tasks
+    """
+
+    async def __call__(self, agent, iteration, evaluation):
+        """Return True to run another iteration
+
+        Args:
+            agent: The Agent which is running
+            iteration: Index of the iteration which just finished
+            evaluation: Evaluation of the design kept at this iteration
+        """
+        raise NotImplementedError
+
+
+class KeepGoing(StopPolicy):
+    """Run until the maximum number of iterations of the agent"""
+
+    async def __call__(self, agent, iteration, evaluation):
+        return True
+
+
+class AskUser(StopPolicy):
+    """Ask on the terminal (the prompt is read in a thread, so the event loop keeps running)"""
+
+    async def __call__(self, agent, iteration, evaluation):
+        print("Agent step done.")
+        answer = await asyncio.to_thread(input, "Continue? [y/n] ")
+        return answer.lower() == "y"
+
+
+class QueuePolicy(StopPolicy):
+    """Wait for the decision to be put in an asyncio queue (e.g. by a UI button)"""
+
+    def __init__(self):
+        self.decisions = asyncio.Queue()
+
+    async def __call__(self, agent, iteration, evaluation):
+        return await self.decisions.get()
+
+
+class StopCriteria(StopPolicy):
+    """Unattended mode: stop as soon as one of the criteria is met (None disables a criterion)
+
+    Kwargs:
+        target: Improvement of the best design over the baseline of the task, in percent
+        time_limit: Wall-clock time in seconds since the policy was created
+        token_budget: Total LLM tokens (input and output) of the session
+        patience: Number of iterations in a row without improvement of the best design
+    """
+
+    def __init__(self, *, target=None, time_limit=None, token_budget=None, patience=None):
+        self.target = target
+        self.time_limit = time_limit
+        self.token_budget = token_budget
+        self.patience = patience
+
+        self.start = time.monotonic()
+        self.best = None
+        self.stale = 0
+
+        # why the agent was stopped
+        self.reason = None
+
+    async def __call__(self, agent, iteration, evaluation):
+        improvement = agent.improvement()
+
+        if improvement is not None and (self.best is None or improvement > self.best):
+            self.best = improvement
+            self.stale = 0
+        else:
+            self.stale += 1
+
+        if self.target is not None and improvement is not None and improvement >= self.target:
+            self.reason = f"target improvement reached ({improvement:.2f}% >= {self.target}%)"
+        elif self.time_limit is not None and time.monotonic() - self.start >= self.time_limit:
+            self.reason = f"time limit of {self.time_limit} s reached"
+        elif self.token_budget is not None and agent.model.used_tokens >= self.token_budget:
+            self.reason = f"token budget reached ({agent.model.used_tokens} >= {self.token_budget})"
+        elif self.patience is not None and self.stale >= self.patience:
+            self.reason = f"no improvement in the last {self.stale} iterations"
+
+        if self.reason:
+            print(f"Stopping the agent: {self.reason}")
+            return False
+
+        return True
+
+
+def find_module_end(text):
+    """Index right after the first complete 'endmodule' in the text, or None"""
+    match = ENDMODULE_RE.search(text)
+    return match.end() if match else None
+
+
+def iterate(agen):
+    """Drive an async generator from synchronous code (a plain generator of its items)
+
+    The event loop runs while the next item is awaited, background threads
+    (e.g. the tools) keep running in between
+    """
+    loop = asyncio.new_event_loop()
+
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
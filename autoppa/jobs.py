@@ -0,0 +1,269 @@
+import multiprocessing
+import queue
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from .engine import KeepGoing, StopCriteria, StopPolicy
+
+# agent runs which execute at once, each one in its own process
+MAX_WORKERS = 2
+
+# agent runs which can wait for a worker, beyond these submit() refuses new ones
+MAX_QUEUED = 4
+
+
+class QueueFull(Exception):
+    """The job server has too many runs waiting for a worker"""
+
+
+class CancelPolicy(StopPolicy):
+    """Stop when the job is cancelled, otherwise ask the wrapped policy"""
+
+    def __init__(self, cancelled, policy):
+        self.cancelled = cancelled
+        self.policy = policy
+
+    async def __call__(self, agent, iteration, evaluation):
+        if self.cancelled.is_set():
+            print("Stopping the agent: the job was cancelled")
+            return False
+
+        return await self.policy(agent, iteration, evaluation)
+
+
+def _run(task_num, agent_args, stop_args, progress, cancelled):
+    """Body of a job, in a worker process: run an agent and send its messages to the progress queue
+
+    The agent is created here, so each run has its own LLM context, client and
+    module state. Returns a summary of the run
+    """
+    from .agent import Agent
+
+    agent = Agent(task_num, **agent_args)
+
+    policy = StopCriteria(**stop_args) if stop_args else KeepGoing()
+
+    try:
+        for message in agent(CancelPolicy(cancelled, policy)):
+            progress.put(message)
+    finally:
+        # end of the stream, also when the run failed
+        progress.put(None)
+
+    return {"improvement": agent.improvement(),
+            "reason": getattr(policy, "reason", None),
+            "used_tokens": agent.model.used_tokens}
+
+
+def _main(outcome, *args):
+    """Entry point of the process of a job: send the summary of _run, or its exception, to the parent"""
+    try:
+        result = (True, _run(*args))
+    except BaseException as e:
+        result = (False, e)
+
+    try:
+        outcome.send(result)
+    except Exception:
+        # the exception can't be pickled
+        outcome.send((False, RuntimeError(repr(result[1]))))
+    finally:
+        outcome.close()
+
+
+class Job:
+    """One agent run submitted to the JobServer
+
+    The messages of the run are collected in self.messages as they arrive, so a
+    page which is reloaded can show the run again from the start
+    """
+
+    def __init__(self, job_id, task_num, progress, cancelled, args):
+        self.id = job_id
+        self.task_num = task_num
+        self.progress = progress
+        self.cancelled = cancelled
+
+        # arguments of _run after the task, and the outcome which the JobServer sets
+        self.args = args
+        self.future = Future()
+
+        self.messages = []
+        self.finished = False
+        self.lock = threading.Lock()
+
+    @property
+    def status(self):
+        """queued, running, cancelled, failed or done"""
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.exception() is not None:
+            return "failed"
+        return "done"
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        """Summary of the run (see _run), raises the exception of the run if it failed"""
+        return self.future.result()
+
+    def cancel(self):
+        """Cancel the job: a queued one never starts, a running one stops after its current iteration"""
+        self.cancelled.set()
+        self.future.cancel()
+
+    def poll(self, timeout=0.1):
+        """Move the messages which arrived into self.messages, returns True once the run is over"""
+        with self.lock:
+            while not self.finished:
+                try:
+                    message = self.progress.get(timeout=timeout)
+                except queue.Empty:
+                    # a run which never started (or crashed) doesn't send the end of its stream
+                    if self.future.done() and self.progress.empty():
+                        self.finished = True
+                    break
+
+                if message is None:
+                    self.finished = True
+                else:
+                    self.messages.append(message)
+
+                # don't wait for the following messages, only drain them
+                timeout = 0
+
+            return self.finished
+
+    def stream(self, interval=0.1):
+        """Generator of all the messages of the run, from the start, until it is over"""
+        seen = 0
+        while True:
+            finished = self.poll(interval)
+
+            while seen < len(self.messages):
+                yield self.messages[seen]
+                seen += 1
+
+            if finished:
+                return
+
+
+class JobServer:
+    """Runs agents for several users at once, in a bounded number of worker processes
+
+    Each run gets a fresh process (the agent, its LLM context and the module
+    state aren't shared between runs), its messages are streamed back through a
+    queue. When MAX_WORKERS runs are going and MAX_QUEUED are waiting, submit()
+    raises QueueFull instead of piling up work
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_queued=MAX_QUEUED):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+
+        # the server lives in a multithreaded process (e.g. Streamlit), which isn't safe to fork
+        self.context = multiprocessing.get_context("spawn")
+
+        self.manager = self.context.Manager()
+
+        self.jobs = {}
+        self.waiting = deque()
+        self.running = 0
+        self.watchers = []
+        self.lock = threading.Lock()
+
+    def pending(self):
+        """Number of runs which are queued or running"""
+        return sum(not job.done for job in self.jobs.values())
+
+    def submit(self, task_num, *, stop_args=None, **agent_args):
+        """Queue an agent run, returns its Job
+
+        Args:
+            task_num: Task which is optimized
+        Kwargs:
+            stop_args: Arguments of a StopCriteria for the run (runs until max_iters if not given)
+            agent_args: Arguments of the Agent (max_iters, candidates, front_dir...)
+        """
+        with self.lock:
+            if self.pending() >= self.max_workers + self.max_queued:
+                raise QueueFull(f"{self.pending()} agent runs are already queued or running, try again later")
+
+            progress, cancelled = self.manager.Queue(), self.manager.Event()
+            job = Job(uuid.uuid4().hex[:12], task_num, progress, cancelled,
+                      (agent_args, stop_args or {}, progress, cancelled))
+
+            self.jobs[job.id] = job
+            self.waiting.append(job)
+            self._dispatch()
+
+        return job
+
+    def _dispatch(self):
+        """Start the waiting jobs while there are free workers (called with the lock held)"""
+        while self.running < self.max_workers and self.waiting:
+            job = self.waiting.popleft()
+
+            # False if the job was cancelled while it was waiting
+            if not job.future.set_running_or_notify_cancel():
+                continue
+
+            receiver, sender = self.context.Pipe(duplex=False)
+            process = self.context.Process(target=_main, args=(sender, job.task_num, *job.args), daemon=True)
+            process.start()
+
+            # the child holds the only sending end, so the receiver sees EOF if it dies
+            sender.close()
+
+            self.running += 1
+            self.watchers = [watcher for watcher in self.watchers if watcher.is_alive()]
+            watcher = threading.Thread(target=self._watch, args=(job, process, receiver), daemon=True)
+            watcher.start()
+            self.watchers.append(watcher)
+
+    def _watch(self, job, process, receiver):
+        """Wait for the process of a job, set the outcome of the job and start the next one"""
+        try:
+            passed, value = receiver.recv()
+        except EOFError:
+            passed, value = False, None
+        finally:
+            receiver.close()
+
+        process.join()
+
+        if value is None and not passed:
+            value = RuntimeError(f"The worker process of the job exited with code {process.exitcode}")
+
+        if passed:
+            job.future.set_result(value)
+        else:
+            job.future.set_exception(value)
+
+        with self.lock:
+            self.running -= 1
+            self._dispatch()
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def forget(self, job_id):
+        """Drop a job which is over (its messages were saved elsewhere)"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.done:
+                del self.jobs[job_id]
+
+    def shutdown(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+
+        for watcher in list(self.watchers):
+            watcher.join()
+
+        self.manager.shutdown()
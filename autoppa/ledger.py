@@ -0,0 +1,111 @@
+import fcntl
+import json
+import os
+import time
+
+LEDGER_PATH = os.path.join("build", "ledger.jsonl")
+
+# byte offsets of the records by task and by design hash, brought up to date on lookup
+INDEX_PATH = os.path.join("build", "ledger.index.json")
+
+
+def record(evaluation, **extra):
+    """Compact ledger record of an evaluation (the tool outputs are left in the log files)"""
+    stages = {}
+    for stage, result in evaluation.results.items():
+        stages[stage] = {"passed": result.passed,
+                         "metric": result.metric,
+                         "wall_time": round(result.wall_time, 3),
+                         "cached": result.cached,
+                         "timed_out": result.timed_out,
+                         "log_path": result.log_path,
+                         **result.details()}
+
+    return {"time": round(time.time(), 3),
+            "task": evaluation.task,
+            "design_hash": evaluation.design_hash,
+            "work_dir": evaluation.work_dir,
+            "fidelity": evaluation.fidelity,
+            "stages": stages,
+            **extra}
+
+
+def append(evaluation, path=LEDGER_PATH, **extra):
+    """Append an evaluation to the JSON Lines ledger
+
+    Several processes can append at once: the file is locked for each line
+    """
+    line = json.dumps(record(evaluation, **extra), separators=(",", ":")) + "\n"
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(line)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def update_index(path=LEDGER_PATH, index_path=INDEX_PATH):
+    """Index the records appended since the last update and return the index"""
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        index = {"size": 0, "task": {}, "design_hash": {}}
+
+    if not os.path.isfile(path):
+        return index
+
+    # the ledger is append-only, so a smaller file means it was deleted and re-created
+    if os.path.getsize(path) < index["size"]:
+        index = {"size": 0, "task": {}, "design_hash": {}}
+
+    with open(path, "rb") as f:
+        f.seek(index["size"])
+        offset = index["size"]
+
+        for line in f:
+            # a line which is still being written
+            if not line.endswith(b"\n"):
+                break
+
+            entry = json.loads(line)
+            index["task"].setdefault(str(entry["task"]), []).append(offset)
+            index["design_hash"].setdefault(entry["design_hash"], []).append(offset)
+            offset += len(line)
+
+        index["size"] = offset
+
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+    return index
+
+
+def lookup(task=None, design_hash=None, path=LEDGER_PATH, index_path=INDEX_PATH):
+    """Return the ledger records of a task and/or a design hash, oldest first"""
+    if not os.path.isfile(path):
+        return []
+    
+    index = update_index(path, index_path)
+
+    offsets = None
+    if task is not None:
+        offsets = set(index["task"].get(str(task), []))
+    if design_hash is not None:
+        matches = set(index["design_hash"].get(design_hash, []))
+        offsets = matches if offsets is None else offsets & matches
+    if offsets is None:
+        offsets = {offset for offsets in index["task"].values() for offset in offsets}
+
+    records = []
+    with open(path, "rb") as f:
+        for offset in sorted(offsets):
+            f.seek(offset)
+            records.append(json.loads(f.readline()))
+
+    return records
@@ -1,11 +1,14 @@
 import argparse
 import sys
 import os 
-from .sim import sim
-from .synth import synth
-from .power import power
-from .benchmark import benchmark
-from .agent import Agent, Role
+import json
+from .process import BUDGETS
+from .simulators import SIMULATORS
+from . import simulators, profiling
+
+# the modules of each step are imported in its branch of main(), so that the
+# tool steps (which scripts call many times) don't pay for the agent stack
+# (openai, tiktoken, dotenv). scripts/import_time.py checks the startup time
 
 
 def main():
@@ -18,6 +21,39 @@ def main():
                         action="store_true",
                         help="Print additional output for debugging purposes")    
 
+    parser.add_argument("--no-cache",
+                        action="store_true",
+                        help="Always re-run the tools instead of returning cached results")
+
+    parser.add_argument("--budget",
+                        action="append",
+                        default=[],
+                        metavar="STAGE=SECONDS",
+                        help=f"Wall-clock budget of a stage, after which its tool is stopped "
+                             f"(can be repeated). Defaults: {BUDGETS}")
+
+    parser.add_argument("--simulator",
+                        choices=list(SIMULATORS),
+                        default=simulators.DEFAULT_SIMULATOR,
+                        help="Simulator backend of the sim stage (verilator builds its runtime once per task)")
+
+    parser.add_argument("--shards",
+                        type=int,
+                        default=simulators.DEFAULT_SHARDS,
+                        metavar="N",
+                        help="Split the operations of the testbench across N simulator processes ran in parallel\n"
+                             "(the reported time is the sum of the shards, the same as a single run, but the\n"
+                             "power is an approximation since each shard repeats the reset of the testbench)")
+
+    parser.add_argument("--trace",
+                        default=profiling.TRACE_PATH,
+                        metavar="FILE",
+                        help="Trace file which receives the profiling spans of the stages (Chrome trace format)")
+
+    parser.add_argument("--no-trace",
+                        action="store_true",
+                        help="Don't record profiling spans")
+
     subparsers = parser.add_subparsers(dest="step", metavar="STEP", help="Step to run (run STEP -h for more info)",
                                        required=True)
     
@@ -30,6 +66,14 @@ def main():
         help="Path to Verilog source code file for optimization"
     )
     
+    work_dir_arg = dict(
+        type=str,
+        default=None,
+        metavar="DIR",
+        help="Build directory of the evaluation (defaults to a new one in build/runs, "
+             "use the same one for sim, synth and power)"
+    )
+    
     tasks = range(1, 6)
     task_arg = dict(
         type=int,
@@ -39,6 +83,29 @@ def main():
         help=f"Benchmark task to run. Choices: {list(tasks)}"
     )
     
+    # stop criteria of the unattended agent (agent --auto and sweep)
+    stop_args = {
+        "--target": dict(type=float, default=None, metavar="PERCENT",
+                         help="Stop once the best design improves on the baseline metric by this much"),
+        "--time-limit": dict(type=float, default=None, metavar="SECONDS",
+                             help="Stop after this much wall-clock time"),
+        "--token-budget": dict(type=int, default=None, metavar="TOKENS",
+                               help="Stop once the LLM used this many tokens (input and output)"),
+        "--patience": dict(type=int, default=None, metavar="N",
+                           help="Stop after N iterations in a row without improvement"),
+        "--front-dir": dict(default=None, metavar="DIR",
+                            help="Where the Pareto front of the designs is written (defaults to build/pareto/task{N})"),
+    }
+
+    #############
+    # Pre-screen
+    #############
+    
+    subparser = subparsers.add_parser('prescreen', help='Check the port list, parsing and elaboration of a design')
+    subparser.add_argument("task", **task_arg)
+    subparser.add_argument("file", **file_arg)
+    subparser.add_argument("-w", "--work-dir", **work_dir_arg)
+
     #############
     # Simulation
     #############
@@ -46,6 +113,10 @@ def main():
     subparser = subparsers.add_parser('sim', help='Simulate with Icarus Verilog')
     subparser.add_argument("task", **task_arg)
     subparser.add_argument("file", **file_arg)
+    subparser.add_argument("-w", "--work-dir", **work_dir_arg)
+    subparser.add_argument("--dump-dut",
+                           action="store_true",
+                           help="Also dump the nets inside of the DUT in the VCD (for the activity step)")
 
     #############
     # Synthesis
@@ -53,6 +124,7 @@ def main():
 
     subparser = subparsers.add_parser('synth', help='Synthesize with Yosys')
     subparser.add_argument("file", **file_arg)
+    subparser.add_argument("-w", "--work-dir", **work_dir_arg)
 
     #############
     # Power
@@ -61,20 +133,109 @@ def main():
     subparser = subparsers.add_parser('power', help='Power with OpenSTA')
     subparser.add_argument("task", **task_arg)
     subparser.add_argument("file", **file_arg)
+    subparser.add_argument("-w", "--work-dir", **work_dir_arg)
+    subparser.add_argument("--activity",
+                           choices=["vcd", "saif"],
+                           default="vcd",
+                           help="Give OpenSTA the VCD, or a compact SAIF converted from it")
+
+
+    #############
+    # Activity
+    #############
 
+    subparser = subparsers.add_parser('activity', help='Analyze the switching activity of a VCD')
+    subparser.add_argument("vcd",
+                           metavar="VCD",
+                           help="Path to a VCD produced by the sim step")
+    subparser.add_argument("--top",
+                           type=int,
+                           default=10,
+                           help="Number of most active nets to print")
+    subparser.add_argument("-o", "--output",
+                           default=None,
+                           metavar="FILE",
+                           help="Also write a compact binary summary of the activity to this file")
 
     #############
     # Benchmark
     #############
 
     subparser = subparsers.add_parser('benchmark', help='Run complete benchmark test')
-    subparser.add_argument("task", **task_arg)
+    subparser.add_argument("task", nargs="?", **task_arg)
     
     baselines = ["reference", "optimized"]
     subparser.add_argument("baseline",
+                           nargs="?",
                            choices=baselines,
                            help=f"Which baseline to run. Choices: {list(baselines)}",
                            metavar="BASELINE",)
+    subparser.add_argument("-a", "--all",
+                           action="store_true",
+                           help="Run every task against every baseline directory (ignores TASK and BASELINE)")
+    subparser.add_argument("--dirs",
+                           nargs="+",
+                           default=[],
+                           metavar="DIR",
+                           help="With --all, extra directories of task{N}.v designs to benchmark")
+    subparser.add_argument("-j", "--jobs",
+                           type=int,
+                           default=None,
+                           help="With --all, number of worker processes (defaults to the number of cores)")
+    subparser.add_argument("--promote",
+                           type=int,
+                           default=None,
+                           metavar="K",
+                           help="With --all, screen the designs with a fast synthesis and only run the\n"
+                                "complete flow (liberty mapping and power) on the K best ones of each task")
+    subparser.add_argument("--fidelity-report",
+                           action="store_true",
+                           help="With --all, evaluate every design with the fast and the complete flow, and\n"
+                                "report how well the ranking of the fast one agrees (instead of the matrix)")
+    subparser.add_argument("-f", "--format",
+                           choices=["csv", "json"],
+                           default="csv",
+                           help="With --all, format of the output table")
+    subparser.add_argument("-o", "--output",
+                           default=None,
+                           metavar="FILE",
+                           help="With --all, write the table to this file instead of stdout")
+
+    #############
+    # Ledger
+    #############
+    
+    subparser = subparsers.add_parser('ledger', help='Query the ledger of past evaluations')
+    subparser.add_argument("-t", "--task",
+                           type=int,
+                           default=None,
+                           choices=tasks,
+                           help="Only show the evaluations of this task")
+    subparser.add_argument("--hash",
+                           default=None,
+                           help="Only show the evaluations of this design hash (or of this file's design)")
+
+    #############
+    # Profile
+    #############
+    
+    subparser = subparsers.add_parser('profile', help='Summarize the profiling spans of past runs per stage')
+    subparser.add_argument("traces",
+                           nargs="*",
+                           metavar="TRACE",
+                           help="Trace files to summarize (defaults to the one of --trace)")
+    subparser.add_argument("-s", "--stage",
+                           default=None,
+                           help="Only show the spans whose name starts with this (e.g. sim, synth, llm)")
+    subparser.add_argument("-t", "--task",
+                           type=int,
+                           default=None,
+                           choices=tasks,
+                           help="Only show the spans of this task")
+    subparser.add_argument("-f", "--format",
+                           choices=["text", "csv", "json"],
+                           default="text",
+                           help="Format of the output table")
 
     #############
     # Agent
@@ -89,10 +250,74 @@ def main():
                            type=int,
                            default=100000,
                            help="Max size of context window in tokens (excess is truncated from start)")
+    subparser.add_argument("-n", "--candidates",
+                           type=int,
+                           default=1,
+                           help="Number of designs generated and evaluated in parallel at each iteration")
+    subparser.add_argument("--promote",
+                           type=int,
+                           default=2,
+                           metavar="K",
+                           help="With several candidates, screen them with a fast synthesis and only run\n"
+                                "the complete flow (liberty mapping and power) on the K best ones")
+    subparser.add_argument("-i", "--max-iters",
+                           type=int,
+                           default=5,
+                           help="Maximum number of iterations")
+    subparser.add_argument("--auto",
+                           action="store_true",
+                           help="Unattended mode: don't ask whether to continue, stop on the criteria below")
+    for name, spec in stop_args.items():
+        subparser.add_argument(name, **spec)
+    
+    #############
+    # Sweep
+    #############
+    
+    subparser = subparsers.add_parser('sweep', help='Run the agent unattended on several tasks, one after the other')
+    subparser.add_argument("--tasks",
+                           type=int,
+                           nargs="+",
+                           default=[1, 2, 3, 4, 5],
+                           choices=range(1, 6),
+                           metavar="TASK",
+                           help="Tasks to optimize (defaults to all of them)")
+    subparser.add_argument("-n", "--candidates",
+                           type=int,
+                           default=1,
+                           help="Number of designs generated and evaluated in parallel at each iteration")
+    subparser.add_argument("--promote",
+                           type=int,
+                           default=2,
+                           metavar="K",
+                           help="With several candidates, screen them with a fast synthesis and only run\n"
+                                "the complete flow (liberty mapping and power) on the K best ones")
+    subparser.add_argument("-i", "--max-iters",
+                           type=int,
+                           default=50,
+                           help="Maximum number of iterations of each task")
+    for name, spec in stop_args.items():
+        subparser.add_argument(name, **spec)
     
     # if no arguments specified, then print help 
     args = parser.parse_args(args=None if sys.argv[1:] else ['--help'])
     
+    simulators.DEFAULT_SIMULATOR = args.simulator
+    
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    simulators.DEFAULT_SHARDS = args.shards
+    profiling.TRACE_PATH = None if args.no_trace else args.trace
+    
+    for budget in args.budget:
+        stage, _, seconds = budget.partition("=")
+        if stage not in BUDGETS:
+            parser.error(f"--budget: unknown stage '{stage}' (choices: {list(BUDGETS)})")
+        try:
+            BUDGETS[stage] = float(seconds)
+        except ValueError:
+            parser.error(f"--budget: invalid number of seconds '{seconds}'")
+    
 
     # because LLM will call tools with just strings,
     # but if we call these from command lines we have filepaths
@@ -104,36 +329,167 @@ def main():
             code = f.read()
             
 
-    if args.step == "sim":
-        result = sim(code, task=args.task, debug=args.debug)
+    if args.step == "prescreen":
+        from .prescreen import prescreen
+        
+        result = prescreen(code, task=args.task, debug=args.debug, use_cache=not args.no_cache,
+                           work_dir=args.work_dir)
+        print(result)
+        
+    elif args.step == "sim":
+        from .sim import sim
+        
+        result = sim(code, task=args.task, debug=args.debug, use_cache=not args.no_cache,
+                     work_dir=args.work_dir, dump_dut=args.dump_dut)
         print(result)
         
     elif args.step == "synth":
-        result = synth(code, debug=args.debug)
+        from .synth import synth
+        
+        result = synth(code, debug=args.debug, use_cache=not args.no_cache,
+                       work_dir=args.work_dir)
         print(result)
     
     elif args.step == "power":
-        result = power(code, task=args.task, debug=args.debug)
+        from .power import power
+        
+        result = power(code, task=args.task, debug=args.debug, use_cache=not args.no_cache,
+                       work_dir=args.work_dir, activity=args.activity)
         print(result)
 
     elif args.step == "benchmark":
-        benchmark(task_num=args.task, baseline=args.baseline, debug=args.debug)
+        from .benchmark import (benchmark, benchmark_matrix, baseline_dirs, fidelity_report,
+                                write_table, REPORT_COLUMNS)
+        
+        if args.all and args.fidelity_report:
+            report = fidelity_report(baseline_dirs() + args.dirs, jobs=args.jobs,
+                                     debug=args.debug, use_cache=not args.no_cache)
+            write_table(report, fmt=args.format, file=args.output, columns=REPORT_COLUMNS)
+        
+        elif args.all:
+            rows = benchmark_matrix(baseline_dirs() + args.dirs, jobs=args.jobs,
+                                    debug=args.debug, use_cache=not args.no_cache, promote=args.promote)
+            write_table(rows, fmt=args.format, file=args.output)
+            
+        elif args.task is None or args.baseline is None:
+            parser.error("benchmark requires TASK and BASELINE (or --all)")
+            
+        else:
+            benchmark(task_num=args.task, baseline=args.baseline, debug=args.debug,
+                      use_cache=not args.no_cache)
     
   
+    elif args.step == "activity":
+        from .activity import analyze, write_summary
+        
+        report = analyze(args.vcd)
+        
+        print(f"Duration: {report.duration} x {report.timescale[0]} {report.timescale[1]}")
+        print(f"Clock cycles: {report.clock_cycles}")
+        print(f"Toggles: {report.toggles} ({report.score():.2f} per cycle)")
+        print(f"Glitches: {report.glitches}")
+        print(f"\nMost active nets:")
+        for name, activity in report.top(args.top):
+            print(f"{'/'.join(name):<50} toggles={activity.tc:<8} glitches={activity.glitches:<8} "
+                  f"p1={activity.static_probability:.3f}")
+        
+        if args.output:
+            write_summary(report, args.output)
+
+    elif args.step == "ledger":
+        from .utils import design_hash
+        from . import ledger
+        
+        design = args.hash
+        if design and os.path.isfile(design):
+            with open(design, "r") as f:
+                design = design_hash(f.read())
+        
+        for record in ledger.lookup(task=args.task, design_hash=design):
+            print(json.dumps(record))
+  
+    elif args.step == "profile":
+        import csv
+        
+        events = []
+        for path in args.traces or [args.trace]:
+            if not os.path.isfile(path):
+                parser.error(f"profile: no trace file at '{path}'")
+            events.extend(profiling.read_trace(path))
+        
+        rows = profiling.summarize(events, prefix=args.stage, task=args.task)
+        
+        if args.format == "csv":
+            writer = csv.DictWriter(sys.stdout, fieldnames=profiling.SUMMARY_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        elif args.format == "json":
+            print(json.dumps(rows, indent=4))
+        else:
+            print(f"{'stage':<28} {'count':>7} {'cached':>7} {'p50 (ms)':>11} {'p95 (ms)':>11} "
+                  f"{'max (ms)':>11} {'total (s)':>10}")
+            for row in rows:
+                print(f"{row['stage']:<28} {row['count']:>7} {row['cached']:>7} {row['p50_ms']:>11.1f} "
+                      f"{row['p95_ms']:>11.1f} {row['max_ms']:>11.1f} {row['total_s']:>10.2f}")
+  
     elif args.step == "agent":
+        from .agent import Agent
+        from .engine import StopCriteria
+        
         agent = Agent(args.task, debug=args.debug,
                        system_prompt=args.prompt,
-                       max_context_len=args.context_len)
-        
-        messages = agent()
-        current_role = None
-        for message in messages:
-            if message.role != current_role:
-                current_role = message.role 
-                print(f"\n\n--------------------- {current_role.name.upper()} ------------------------\n\n")
+                       max_context_len=args.context_len,
+                       max_iters=args.max_iters,
+                       use_cache=not args.no_cache,
+                       candidates=args.candidates,
+                       promote=args.promote,
+                       front_dir=args.front_dir)
+        
+        policy = None
+        if args.auto:
+            policy = StopCriteria(target=args.target, time_limit=args.time_limit,
+                                  token_budget=args.token_budget, patience=args.patience)
+        
+        print_messages(agent(policy))
+        
+    elif args.step == "sweep":
+        from .agent import Agent
+        from .engine import StopCriteria
+        
+        for task in args.tasks:
+            front_dir = os.path.join(args.front_dir, f"task{task}") if args.front_dir else None
+            agent = Agent(task, debug=args.debug,
+                          max_iters=args.max_iters,
+                          use_cache=not args.no_cache,
+                          candidates=args.candidates,
+                          promote=args.promote,
+                          front_dir=front_dir)
+            policy = StopCriteria(target=args.target, time_limit=args.time_limit,
+                                  token_budget=args.token_budget, patience=args.patience)
             
-            print(message.content, end="")
-        print()
+            # the conversation goes to a file next to the front, only a summary is printed
+            os.makedirs(agent.front_dir, exist_ok=True)
+            with open(os.path.join(agent.front_dir, "transcript.txt"), "w") as f:
+                print_messages(agent(policy), file=f)
+            
+            improvement = agent.improvement()
+            print(f"Task {task}: "
+                  f"{'no design passed' if improvement is None else f'{improvement:+.2f}% over the baseline'}, "
+                  f"{len(agent.front)} design(s) on the Pareto front in {agent.front_dir} "
+                  f"({policy.reason or 'max iterations reached'})")
+
+
+def print_messages(messages, file=None):
+    """Print the messages of the agent, with a header whenever the role changes"""
+    current_role = None
+    for message in messages:
+        if message.role != current_role:
+            current_role = message.role 
+            print(f"\n\n--------------------- {current_role.name.upper()} ------------------------\n\n", file=file)
+        
+        print(message.content, end="", file=file, flush=True)
+    print(file=file)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,92 @@
+import json
+import os
+from dataclasses import dataclass
+from .pipeline import METRIC_STAGE
+from .utils import write_atomic
+
+# the objectives of the front, all of them are minimized
+OBJECTIVES = ["performance", "area", "power"]
+
+FRONT_DIR = os.path.join("build", "pareto")
+
+
+@dataclass
+class Candidate:
+    """A design which passed the whole flow, with its metrics"""
+    design: str
+    evaluation: object
+    iteration: int = None
+
+    @property
+    def objectives(self):
+        return tuple(self.evaluation.metric(METRIC_STAGE[objective]) for objective in OBJECTIVES)
+
+    def dominates(self, other):
+        """No worse on every objective and better on at least one"""
+        mine, theirs = self.objectives, other.objectives
+        return all(a <= b for a, b in zip(mine, theirs)) and mine != theirs
+
+
+class ParetoFront:
+    """Designs which aren't dominated on performance, area and power by any other evaluated design"""
+
+    def __init__(self):
+        self.candidates = []
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def add(self, design, evaluation, iteration=None):
+        """Offer an evaluated design to the front
+
+        Designs which failed a stage are ignored. Returns True if the design is
+        on the front (the designs it dominates are removed)
+        """
+        if not evaluation.passed:
+            return False
+
+        candidate = Candidate(design, evaluation, iteration)
+
+        for other in self.candidates:
+            if other.dominates(candidate) or other.evaluation.design_hash == evaluation.design_hash:
+                return False
+
+        self.candidates = [other for other in self.candidates if not candidate.dominates(other)]
+        self.candidates.append(candidate)
+
+        return True
+
+    def best(self, metric):
+        """Design of the front with the best value of one metric (performance/area/power)"""
+        if not self.candidates:
+            return None
+
+        stage = METRIC_STAGE[metric]
+        return min(self.candidates, key=lambda candidate: candidate.evaluation.metric(stage))
+
+    def write(self, directory):
+        """Write the designs of the front and a front.json index of their metrics
+
+        Designs which left the front since the last write are removed
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        entries = []
+        for candidate in sorted(self.candidates, key=lambda candidate: candidate.objectives):
+            file = f"{candidate.evaluation.design_hash[:12]}.v"
+            if not os.path.isfile(os.path.join(directory, file)):
+                write_atomic(os.path.join(directory, file), candidate.design)
+
+            entries.append({"file": file,
+                            "design_hash": candidate.evaluation.design_hash,
+                            "iteration": candidate.iteration,
+                            **dict(zip(OBJECTIVES, candidate.objectives)),
+                            "fmax": candidate.evaluation.results["power"].fmax,
+                            "time_at_fmax": candidate.evaluation.time_at_fmax()})
+
+        kept = {entry["file"] for entry in entries}
+        for file in os.listdir(directory):
+            if file.endswith(".v") and file not in kept:
+                os.remove(os.path.join(directory, file))
+
+        write_atomic(os.path.join(directory, "front.json"), json.dumps(entries, indent=4) + "\n")
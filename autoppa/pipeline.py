@@ -0,0 +1,193 @@
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from .sim import sim
+from .synth import synth
+from .power import power
+from .prescreen import prescreen
+from .results import Evaluation, SimResult, SynthResult, PowerResult
+from .utils import extract_module_name, new_work_dir, design_hash
+from . import ledger, profiling
+
+# which tool reports the metric of each kind of task
+METRIC_STAGE = {
+    "performance": "sim",
+    "area": "synth",
+    "power": "power",
+}
+
+# which metric ranks the candidates of each kind of task at the fast fidelity (see screen).
+# There is no power analysis at that tier, so the cell count stands in for the power
+SCREEN_STAGE = {
+    "performance": "sim",
+    "area": "synth",
+    "power": "synth",
+}
+
+STAGES = ["prescreen", "sim", "synth", "power"]
+
+
+class HeadStart:
+    """Pre-screen and simulation of a design, started in the background
+
+    The agent starts one as soon as the streamed LLM output contains a complete
+    module, before the response is finished (speculative evaluation). evaluate()
+    then picks it up if the final design is the same (same design_hash), and
+    otherwise it is cancelled and the design is evaluated from scratch.
+    """
+
+    def __init__(self, code, *, task=1, debug=False, use_cache=True):
+        self.code = code
+        self.design_hash = design_hash(code)
+        self.cancelled = False
+
+        # each evaluation gets its own build directory, so nothing is shared between them
+        try:
+            self.work_dir = new_work_dir(task, extract_module_name(code))
+        except Exception:
+            # the pre-screen reports the missing module name
+            self.work_dir = None
+
+        # a single thread, so that sim only starts once the pre-screen is done
+        pool = ThreadPoolExecutor(max_workers=1)
+        self.prescreen = pool.submit(prescreen, code, task=task, debug=debug, use_cache=use_cache,
+                                     work_dir=self.work_dir)
+        self.sim = pool.submit(self._sim, task=task, debug=debug, use_cache=use_cache)
+        pool.shutdown(wait=False)
+
+    def _sim(self, **kwargs):
+        if self.cancelled or not self.prescreen.result().passed:
+            return None
+        return sim(self.code, work_dir=self.work_dir, **kwargs)
+
+    def cancel(self):
+        """Don't start the simulation if it wasn't yet (a running one is left to finish)
+
+        The work directory is removed once the simulation is done, what the next
+        evaluation of the same design needs is in the cache and the artifact store
+        """
+        self.cancelled = True
+
+        if self.work_dir is not None:
+            self.sim.add_done_callback(lambda _: shutil.rmtree(self.work_dir, ignore_errors=True))
+
+
+def evaluate(code: str, *, task:int=1, debug:bool=False, use_cache:bool=True,
+             record:bool=True, head_start:HeadStart=None, fidelity:str="signoff") -> Evaluation:
+    """Runs simulation, synthesis and power analysis on a design
+
+    The design first goes through the pre-screen checks (port list, parse and
+    elaboration), and the other tools are skipped if it fails them. Simulation
+    and synthesis are independent so they run concurrently, and power analysis
+    starts as soon as both are done. If either of them failed, power analysis
+    is skipped since it needs both the VCD and the netlist.
+
+    At the 'fast' fidelity, synthesis only counts the cells of the generic
+    synthesis and power analysis isn't ran (there is no 'power' result if
+    the other stages passed). This is the screening tier of the candidates.
+
+    This is a top-level function (rather than an Agent method) so that it can be
+    sent to a process pool to evaluate several designs at once.
+
+    Args:
+        code: A string representing the Verilog code to evaluate
+
+    Kwargs:
+        task: Which benchmark optimization task to run
+        debug: Output additional information from the tools
+        use_cache: Return stored results for designs which were already evaluated
+        record: Append the evaluation to the run ledger
+        head_start: Pre-screen and simulation which were started early on (a prefix of) the code
+        fidelity: 'signoff' for the complete flow, 'fast' to screen candidates (see synth.FIDELITIES)
+
+    Returns an Evaluation with the result of each stage (prescreen/sim/synth/power)
+    """
+    with profiling.span("evaluate", task=task, design_hash=design_hash(code), fidelity=fidelity):
+        return _evaluate(code, task=task, debug=debug, use_cache=use_cache, record=record,
+                         head_start=head_start, fidelity=fidelity)
+
+
+def _evaluate(code: str, *, task:int=1, debug:bool=False, use_cache:bool=True,
+              record:bool=True, head_start:HeadStart=None, fidelity:str="signoff") -> Evaluation:
+    """Runs the evaluation flow (see evaluate)"""
+    evaluation = Evaluation(task=task, design_hash=design_hash(code), fidelity=fidelity)
+
+    if head_start is not None and head_start.design_hash != evaluation.design_hash:
+        head_start.cancel()
+        head_start = None
+
+    # the pre-screen and then sim run in the background, while synth runs in this thread
+    if head_start is None:
+        head_start = HeadStart(code, task=task, debug=debug, use_cache=use_cache)
+
+    evaluation.work_dir = head_start.work_dir
+    evaluation.results["prescreen"] = head_start.prescreen.result()
+
+    if not evaluation.results["prescreen"].passed:
+        error = "{} was skipped because the pre-screen checks failed"
+        evaluation.results["sim"] = SimResult(passed=False, error=error.format("Simulation"))
+        evaluation.results["synth"] = SynthResult(passed=False, error=error.format("Synthesis"))
+        evaluation.results["power"] = PowerResult(passed=False, error=error.format("Power analysis"))
+
+        if record:
+            ledger.append(evaluation)
+
+        return evaluation
+
+    # the tools are separate processes, so threads are enough to overlap them
+    synth_result = synth(code, debug=debug, use_cache=use_cache, work_dir=evaluation.work_dir,
+                         fidelity=fidelity)
+
+    evaluation.results["sim"] = head_start.sim.result()
+    evaluation.results["synth"] = synth_result
+
+    failed = [stage for stage in ("sim", "synth") if not evaluation.results[stage].passed]
+
+    if failed:
+        evaluation.results["power"] = PowerResult(
+            passed=False, error=f"Power analysis was skipped because {' and '.join(failed)} failed")
+
+    # the fast tier stops before power analysis, which needs the mapped netlist
+    elif fidelity == "signoff":
+        # the netlist and the VCD which sim and synth just stored are found by the design hash
+        evaluation.results["power"] = power(code, task=task, debug=debug, use_cache=use_cache,
+                                            work_dir=evaluation.work_dir)
+
+    if record:
+        ledger.append(evaluation)
+
+    return evaluation
+
+
+def rank(evaluations, metric, stages=METRIC_STAGE):
+    """Sort candidate indices from best to worst for the task metric (lower is better)
+
+    Kwargs:
+        stages: Which stage reports the metric of each kind of task (SCREEN_STAGE for fast evaluations)
+
+    Candidates for which any tool failed are ranked last
+    """
+    def key(i):
+        if not evaluations[i].passed:
+            return (1, 0.0)
+        return (0, evaluations[i].metric(stages[metric]))
+
+    return sorted(range(len(evaluations)), key=key)
+
+
+def screen(evaluations, metric, promote):
+    """Indices of the candidates promoted from the fast tier to the signoff tier
+
+    The candidates which passed the fast evaluation are ranked on the metric of the
+    fast tier (SCREEN_STAGE), and the 'promote' best ones are kept
+    """
+    ranking = rank(evaluations, metric, SCREEN_STAGE)
+    return [i for i in ranking[:promote] if evaluations[i].passed]
+
+
+def not_promoted(evaluation, promote):
+    """Mark a fast evaluation which wasn't promoted, so that it reads as a complete evaluation"""
+    if "power" not in evaluation.results:
+        evaluation.results["power"] = PowerResult(
+            passed=False, error=f"Power analysis was skipped because the design didn't rank in the "
+                                f"best {promote} of the fast synthesis tier")
+    return evaluation
@@ -1,6 +1,79 @@
-import subprocess
+import glob
 import os
-from .utils import extract_module_name
+import re
+import shutil
+import subprocess
+import uuid
+from .utils import extract_module_name, design_hash, new_work_dir
+from .results import PowerResult
+from .synth import LIBERTY, YOSYS_SCRIPT, synth, synth_key
+from .saif import vcd_to_saif, vcds_to_saif
+from .sim import sim, sim_key
+from .worker import Worker, WorkerCrashed, WorkerTimeout, ProcessLocal
+from .process import BUDGETS
+from . import artifacts, cache, profiling, simulators
+
+
+# period of the clock of the testbenches (ns), which the power and the slack are computed at
+CLOCK_PERIOD = 10
+
+# 'worst slack -1.2345' (or INF when the design has no constrained path)
+SLACK_RE = re.compile(r"^worst slack\s+(\S+)", re.MULTILINE)
+
+
+class StaWorker(Worker):
+    """OpenSTA process which loads the liberty once and then analyzes designs one after the other
+    
+    The native 'sta' binary is used if it is on the PATH, otherwise a single
+    'opensta' container is kept alive with the working directory mounted.
+    Killing the 'docker run' client doesn't stop its container, so each
+    container gets a unique name and is killed through docker
+    """
+    
+    name = "sta"
+    
+    def __init__(self, debug=False):
+        self.docker = shutil.which("sta") is None
+        self.container = None
+        
+        super().__init__(["sta", "-no_init", "-no_splash"], setup=f"read_liberty {LIBERTY}", debug=debug)
+        
+    def start(self):
+        if self.docker:
+            # --init forwards the signals to sta, and a new name since the old container may still be removed
+            self.container = f"autoppa-sta-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            self.command = ["docker", "run", "-i", "--rm", "--init",
+                            "--name", self.container,
+                            "-v", f"{os.getcwd()}:/autoppa",
+                            "-w", "/autoppa",
+                            "opensta", "-no_init", "-no_splash"]
+        
+        super().start()
+        
+    def kill(self):
+        if self.container is not None:
+            try:
+                subprocess.run(["docker", "kill", self.container], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, timeout=30)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        
+        super().kill()
+        
+    def wrap(self, script, marker):
+        # the marker is computed by Tcl so that it can't be matched by an echo of the command,
+        # and stdout must be flushed since it is a pipe (fully buffered)
+        tag, _, suffix = marker.rpartition("_")
+        return (f"if {{[catch {{\n{script}\n}} err]}} {{ puts \"AUTOPPA_ERROR: $err\" }}\n"
+                f"puts \"[string toupper {tag.lower()}]_{suffix}\"\n"
+                f"flush stdout")
+    
+    def reported_error(self, line):
+        return "AUTOPPA_ERROR" in line
+
+
+# one OpenSTA process per Python process, started on first use
+_sta_worker = ProcessLocal(StaWorker)
 
 
 def extract_power(string):
@@ -15,8 +88,87 @@ def extract_power(string):
         
     raise Exception("Couldn't find total power")
 
-def power(code: str, *, task:int=1, debug:bool=False) -> str:
-    """Runs OpenSTA power analysis on input code string (synth must be ran first)
+
+def extract_slack(string):
+    """Extract the worst setup slack (ns) from the OpenSTA output, None if no path is constrained"""
+    match = SLACK_RE.search(string)
+    
+    # some versions of OpenSTA print nothing when there is no constrained path
+    if match is None:
+        return None
+
+    try:
+        slack = float(match.group(1))
+    except ValueError:
+        return None
+
+    # an infinite slack means there is no register to register path
+    return slack if abs(slack) != float("inf") else None
+
+
+def fmax(slack, period=CLOCK_PERIOD):
+    """Max clock frequency (MHz) of a design which has this worst slack at this clock period"""
+    if slack is None or period - slack <= 0:
+        return None
+
+    return 1000 / (period - slack)
+
+def resolve_inputs(code, *, task=1, debug=False, work_dir=None):
+    """Netlist and VCD(s) of a design from the artifact store, produced on demand if missing
+    
+    Returns the path of the netlist and the list of VCDs (one per shard of the simulation),
+    or a failed PowerResult if synth or sim failed on the design (or left no files, even when ran again)
+    """
+    code_hash = design_hash(code)
+    
+    netlist_dir = artifacts.get(code_hash, "synth", synth_key(code))
+    
+    # the second time without the cache: a stored result can outlive its files (e.g. evicted meanwhile)
+    for use_cache in (True, False):
+        if netlist_dir is not None:
+            break
+        result = synth(code, debug=debug, use_cache=use_cache, work_dir=work_dir)
+        if not result.passed:
+            return PowerResult(passed=False, error="Power analysis was skipped because synthesis failed:",
+                               output=str(result))
+        netlist_dir = artifacts.get(code_hash, "synth", synth_key(code))
+    
+    if netlist_dir is None:
+        return PowerResult(passed=False, crashed=True, error="Power analysis was skipped because the netlist "
+                                                             "of the design is missing from the artifact store")
+    
+    key = sim_key(code, task, simulators.DEFAULT_SIMULATOR, simulators.DEFAULT_SHARDS)
+    
+    vcd_dir = artifacts.get(code_hash, "sim", key)
+    
+    for use_cache in (True, False):
+        if vcd_dir is not None:
+            break
+        result = sim(code, task=task, debug=debug, use_cache=use_cache, work_dir=work_dir)
+        if not result.passed:
+            return PowerResult(passed=False, error="Power analysis was skipped because simulation failed:",
+                               output=str(result))
+        vcd_dir = artifacts.get(code_hash, "sim", key)
+    
+    if vcd_dir is None:
+        return PowerResult(passed=False, crashed=True, error="Power analysis was skipped because the VCD "
+                                                             "of the design is missing from the artifact store")
+    
+    vcds = glob.glob(os.path.join(vcd_dir, "*.vcd"))
+    
+    # the VCD of a single simulation, or the VCDs of the shards in order
+    vcds.sort(key=lambda path: int(os.path.basename(path)[len("shard"):-len(".vcd")])
+              if os.path.basename(path).startswith("shard") else -1)
+    
+    return os.path.join(netlist_dir, "netlist.v"), vcds
+
+
+def power(code: str, *, task:int=1, debug:bool=False, use_cache:bool=True,
+          work_dir:str=None, activity:str="vcd") -> PowerResult:
+    """Runs OpenSTA power analysis on input code string
+    
+    The netlist and the VCD are taken from the artifact store by design hash, so they
+    always match the code. If either is missing, synth or sim is ran first
     
     Args:
         task: Which benchmark optimization task to run
@@ -24,55 +176,113 @@ def power(code: str, *, task:int=1, debug:bool=False) -> str:
         
     Kwargs:
         debug: Output additional information from OpenSTA
+        use_cache: Return the stored result if this design was already analyzed
+        work_dir: Directory for the OpenSTA script, report and log (defaults to a new one, see utils.new_work_dir),
+                  also given to sim and synth if they have to be ran
+        activity: How the switching activity is given to OpenSTA: 'vcd' reads the VCD directly,
+                  'saif' first converts it to a compact SAIF of toggle counts and durations.
+                  The VCDs of a sharded simulation are always merged into a SAIF, which only
+                  approximates the activity of a single run (see PowerResult.shards)
         
-    Returns a string indicating either success with
-    power estimation (mW), or failure with an error message
-    """    
+    The same OpenSTA run also reports the critical path and the worst slack at the
+    clock of the testbench, from which the max frequency of the design is computed
+    
+    Returns a PowerResult indicating either success with power estimation (mW),
+    worst slack (ns) and max frequency (MHz), or failure with an error message (str() gives the message for the LLM)
+    """
+    # power depends on the netlist (synth) and on the switching activity (sim)
+    key = cache.cache_key("power", code,
+                          files=[f"benchmark/task{task}.v", LIBERTY, "benchmark/power.tcl"],
+                          extra=[*YOSYS_SCRIPT, activity, CLOCK_PERIOD,
+                                 simulators.DEFAULT_SIMULATOR, simulators.DEFAULT_SHARDS])
+    
+    def run():
+        return _power(code, task=task, debug=debug, work_dir=work_dir, activity=activity)
+    
+    with profiling.span("power", task=task, design_hash=design_hash(code)) as span:
+        return cache.cached_stage(key, "power", run, span=span, debug=debug, use_cache=use_cache)
+
+
+def _power(code: str, *, task:int=1, debug:bool=False, work_dir:str=None,
+           activity:str="vcd") -> PowerResult:
+    """Runs the OpenSTA power analysis (uncached)"""
+    
+    if activity not in {"vcd", "saif"}:
+        raise ValueError("Invalid activity format", activity)
     
     dut_name = extract_module_name(code)
     
-    build_dir = os.path.join("build", f"task{task}")
+    # a directory of its own, so that concurrent runs of the CLI don't overwrite each other's files
+    build_dir = work_dir if work_dir else new_work_dir(task, dut_name)
+    os.makedirs(build_dir, exist_ok=True)
     
-    if not os.path.isfile(f"{build_dir}/{dut_name}.vcd"):
-        raise FileNotFoundError(f"Simulation must be ran first before power analysis")
+    inputs = resolve_inputs(code, task=task, debug=debug, work_dir=build_dir)
+    if isinstance(inputs, PowerResult):
+        return inputs
     
-    if not os.path.isfile(f"build/synth/synth_{dut_name}.v"):
-        raise FileNotFoundError(f"Synthesis must be ran first before power analysis")
+    netlist, vcds = inputs
+
+    if len(vcds) > 1:
+        # OpenSTA reads a single VCD, but the toggle counts and durations of the shards add up
+        saif = f"{build_dir}/{dut_name}.saif"
+        with profiling.span("power.saif", shards=len(vcds)):
+            vcds_to_saif(vcds, saif)
+        read_activity = f"read_saif {saif}"
+    elif activity == "saif":
+        saif = f"{build_dir}/{dut_name}.saif"
+        with profiling.span("power.saif"):
+            vcd_to_saif(vcds[0], saif)
+        read_activity = f"read_saif {saif}"
+    else:
+        read_activity = f"read_vcd {vcds[0]}"
 
-    # because we can't specify commands to opensta via command line
+    # the script is kept in the build directory so that it can be re-ran by hand
     with open("benchmark/power.tcl", "r") as f:
         content = f.read()
 
     content = content.replace("{MODULE_NAME}", dut_name)
     content = content.replace("{TASK_NUM}", str(task))
+    content = content.replace("{NETLIST}", netlist)
+    content = content.replace("{READ_ACTIVITY}", read_activity)
+    content = content.replace("{CLOCK_PERIOD}", str(CLOCK_PERIOD))
+    content = content.replace("{REPORT}", f"{build_dir}/{dut_name}.rpt")
     
     with open(f"{build_dir}/{dut_name}.tcl", "w") as f:
         f.write(content)    
     
+    worker = _sta_worker.get()
+    worker.debug = debug
+    
+    log_path = f"{build_dir}/{dut_name}.power.log"
+    
+    # only the tail of the output is kept, so the lines of the reports are picked as they are read
+    reports = []
+    
+    def on_line(line):
+        if line.strip().startswith("Total") or SLACK_RE.match(line):
+            reports.append(line)
+    
     try:
-        command = ["docker",
-                   "run",
-                   "--rm",
-                   "-v",
-                   f"{os.getcwd()}:/autoppa",
-                   "opensta",
-                   "-no_init",
-                   "-no_splash",
-                   f"autoppa/{build_dir}/{dut_name}.tcl"]
+        output, failed = worker.run(content, timeout=BUDGETS["power"], log_path=log_path, on_line=on_line)
         
-        if debug:
-            print(" ".join(command))
-            
-        power_result = subprocess.run(command,
-                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                           check=True, encoding="utf-8")
+    except WorkerTimeout as e:
+        return PowerResult(passed=False, output=e.output, log_path=log_path, timed_out=True,
+                           error=f"OpenSTA exceeded the power analysis time budget of {BUDGETS['power']} s "
+                                 "and was stopped:")
         
-        
-        power = extract_power(power_result.stdout)
-        
-        return (f"The power analysis completed successfully\n"
-                f"Power (mW) == {power}")
-        
-    except subprocess.CalledProcessError as e:
-        return f"OpenSTA gave an error during power analysis. Please investigate and fix:\n{e.stdout}"
-          
\ No newline at end of file
+    except WorkerCrashed as e:
+        # e.g. the docker daemon is down or the opensta image is missing
+        return PowerResult(passed=False, output=e.output, log_path=log_path, crashed=True,
+                           error="OpenSTA exited unexpectedly during power analysis:")
+    
+    if failed:
+        return PowerResult(passed=False, output=output, log_path=log_path,
+                           error="OpenSTA gave an error during power analysis. Please investigate and fix:")
+    
+    power = extract_power("".join(reports))
+    
+    # the timing reports come from the same loaded design, so they cost no extra OpenSTA run
+    slack = extract_slack("".join(reports))
+    
+    return PowerResult(passed=True, metric=float(power), log_path=log_path,
+                       slack=slack, fmax=fmax(slack), clock_period=CLOCK_PERIOD, shards=len(vcds))
@@ -0,0 +1,267 @@
+import ast
+import re
+import os
+import operator
+import time
+from .utils import extract_module_name, design_hash, new_work_dir, normalize_verilog, write_atomic
+from .results import PrescreenResult
+from .synth import run_yosys
+from .process import BUDGETS, run_streamed
+from .worker import WorkerCrashed, WorkerTimeout
+from . import cache, profiling
+
+DIRECTION_RE = re.compile(r"^(input|output|inout)\b")
+RANGE_RE = re.compile(r"\[([^\]]+)\]")
+
+
+def _matching_paren(text, start):
+    """Index of the parenthesis closing the one at text[start]"""
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "(":
+            depth += 1
+        elif text[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+
+    raise Exception("Unbalanced parentheses in the module header")
+
+
+# operators allowed in the bounds of a constant range (see _constant)
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+}
+
+# larger bounds aren't widths of a real port, and the products would grow without limit
+MAX_BOUND = 1 << 32
+
+
+def _constant(node):
+    """Value of an expression made of int constants, + - * and parentheses, or None"""
+    if isinstance(node, ast.Constant) and type(node.value) is int:
+        value = node.value
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        value = _constant(node.operand)
+        if value is not None and isinstance(node.op, ast.USub):
+            value = -value
+    elif isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+        left, right = _constant(node.left), _constant(node.right)
+        value = None if left is None or right is None else OPERATORS[type(node.op)](left, right)
+    else:
+        return None
+
+    if value is None or abs(value) > MAX_BOUND:
+        return None
+
+    return value
+
+
+def _width(range_):
+    """Width of a '[msb:lsb]' range, or the range text if it isn't made of constants"""
+    if range_ is None:
+        return 1
+
+    bounds = range_.replace(" ", "").split(":")
+    if len(bounds) == 2:
+        try:
+            msb, lsb = (_constant(ast.parse(bound, mode="eval").body) for bound in bounds)
+        except (SyntaxError, ValueError, RecursionError):
+            msb, lsb = None, None
+
+        if msb is not None and lsb is not None:
+            return abs(msb - lsb) + 1
+
+    return range_.replace(" ", "")
+
+
+def extract_ports(code):
+    """Parse the port list of the first module of the code
+
+    Returns a dictionary of port name -> (direction, width) which handles both
+    ANSI headers ('input [31:0] a, b') and port declarations in the module body
+    """
+    code = normalize_verilog(code)
+
+    match = re.search(r"\bmodule\s+\w+\s*", code)
+    if match is None:
+        raise Exception("Module header could not be found")
+
+    pos = match.end()
+
+    # skip the parameter list
+    if code.startswith("#", pos):
+        pos = _matching_paren(code, code.index("(", pos)) + 1
+        pos = len(code) - len(code[pos:].lstrip())
+
+    if not code.startswith("(", pos):
+        return {}
+
+    end = _matching_paren(code, pos)
+    header = code[pos+1:end]
+    body = code[end+1:]
+
+    ports = {}
+    direction, range_ = None, None
+    for item in header.split(","):
+        item = item.strip()
+        if not item:
+            continue
+
+        declaration = DIRECTION_RE.match(item)
+        if declaration:
+            direction = declaration.group(1)
+            found = RANGE_RE.search(item)
+            range_ = found.group(1) if found else None
+
+        name = item.split()[-1]
+        if "]" in name:
+            name = name.split("]")[-1]
+
+        ports[name] = (direction, _width(range_) if direction else None)
+
+    # non-ANSI style: the directions are declared in the body
+    if any(direction is None for direction, _ in ports.values()):
+        for statement in body.split(";"):
+            statement = statement.strip()
+            declaration = DIRECTION_RE.match(statement)
+            if not declaration:
+                continue
+
+            found = RANGE_RE.search(statement)
+            width = _width(found.group(1) if found else None)
+            names = statement[found.end():] if found else statement[declaration.end():]
+
+            for name in names.split(","):
+                name = name.split()[-1] if name.split() else ""
+                if name in ports:
+                    ports[name] = (declaration.group(1), width)
+
+    return ports
+
+
+def check_interface(code, reference):
+    """Compare the module name and ports of a design with the reference design
+
+    Returns a list of problems (empty if the interface matches)
+    """
+    problems = []
+
+    try:
+        ports = extract_ports(code)
+    except Exception as e:
+        return [str(e)]
+
+    expected = extract_ports(reference)
+
+    for name, (direction, width) in expected.items():
+        if name not in ports:
+            problems.append(f"Port '{name}' is missing (expected {direction} of width {width})")
+            continue
+
+        actual_direction, actual_width = ports[name]
+        if actual_direction != direction:
+            problems.append(f"Port '{name}' should be an {direction}, not {actual_direction}")
+        elif actual_width != width:
+            problems.append(f"Port '{name}' should have a width of {width}, not {actual_width}")
+
+    for name in ports:
+        if name not in expected:
+            problems.append(f"Port '{name}' is not part of the reference port list")
+
+    return problems
+
+
+def prescreen(code: str, *, task:int=1, debug:bool=False, use_cache:bool=True,
+              work_dir:str=None) -> PrescreenResult:
+    """Runs cheap checks which reject broken designs before the full flow
+
+    1. The module name can be extracted and the port list matches the reference design
+    2. The design and testbench are parsed and elaborated by Icarus Verilog (iverilog -t null)
+    3. The design is elaborated by Yosys (read_verilog; hierarchy; proc)
+
+    Args:
+        code: A string representing the Verilog code to check
+
+    Kwargs:
+        task: Which benchmark optimization task to run
+        debug: Output additional information from the tools
+        use_cache: Return the stored result if this design was already checked
+        work_dir: Directory for the design file (defaults to a new one, see utils.new_work_dir)
+
+    Returns a PrescreenResult which contains concise diagnostics on failure
+    """
+    key = cache.cache_key("prescreen", code,
+                          files=[f"benchmark/task{task}.v", f"baseline/reference/task{task}.v"])
+
+    def run():
+        return _prescreen(code, task=task, debug=debug, work_dir=work_dir)
+
+    with profiling.span("prescreen", task=task, design_hash=design_hash(code)) as span:
+        return cache.cached_stage(key, "prescreen", run, span=span, debug=debug, use_cache=use_cache)
+
+
+def _prescreen(code: str, *, task:int=1, debug:bool=False, work_dir:str=None) -> PrescreenResult:
+    """Runs the pre-screen checks (uncached)"""
+
+    try:
+        dut_name = extract_module_name(code)
+    except Exception as e:
+        return PrescreenResult(passed=False, error="The design was rejected by the pre-screen checks:",
+                               output=f"{e}. The output should start with the module port list")
+
+    if dut_name == f"task{task}_tb":
+        return PrescreenResult(passed=False, error="The design was rejected by the pre-screen checks:",
+                               output=f"The module can't be named {dut_name}, which is the testbench")
+
+    with open(f"baseline/reference/task{task}.v", "r") as f:
+        reference = f.read()
+
+    problems = check_interface(code, reference)
+    if problems:
+        return PrescreenResult(passed=False, error="The port list doesn't match the reference design:",
+                               output="\n".join(problems))
+
+    # a directory of its own, so that concurrent runs of the CLI don't overwrite each other's files
+    build_dir = work_dir if work_dir else new_work_dir(task, dut_name)
+    os.makedirs(build_dir, exist_ok=True)
+
+    source = f"{build_dir}/{dut_name}.v"
+    write_atomic(source, code)
+
+    log_path = f"{build_dir}/{dut_name}.prescreen.log"
+    deadline = time.monotonic() + BUDGETS["prescreen"]
+
+    command = ["iverilog", "-t", "null", f"-DDUT_NAME={dut_name}", source, f"benchmark/task{task}.v"]
+    parse = run_streamed(command, log_path, budget=deadline - time.monotonic(), debug=debug)
+
+    if parse.timed_out:
+        return PrescreenResult(passed=False, output=parse.tail, log_path=log_path, timed_out=True,
+                               error=f"Icarus Verilog exceeded the pre-screen time budget of {BUDGETS['prescreen']} s:")
+
+    if parse.returncode != 0:
+        return PrescreenResult(passed=False, output=parse.tail, log_path=log_path,
+                               error="Icarus Verilog gave an error while parsing the design. Please investigate and fix:")
+
+    # the result points to the log of the step which failed
+    yosys_log_path = f"{build_dir}/{dut_name}.prescreen.yosys.log"
+
+    try:
+        output, failed = run_yosys(f"read_verilog {source}\nhierarchy -check -top {dut_name}\nproc",
+                                   debug=debug, budget=deadline - time.monotonic(), log_path=yosys_log_path)
+    except WorkerTimeout as e:
+        return PrescreenResult(passed=False, output=e.output, log_path=yosys_log_path, timed_out=True,
+                               error=f"Yosys exceeded the pre-screen time budget of {BUDGETS['prescreen']} s:")
+    except WorkerCrashed as e:
+        return PrescreenResult(passed=False, output=e.output, log_path=yosys_log_path, crashed=True,
+                               error="Yosys exited unexpectedly during the pre-screen:")
+
+    if failed:
+        # only the error lines, the rest of the Yosys log is noise at this point
+        errors = [line for line in output.splitlines() if "ERROR" in line or "Warning" in line]
+        return PrescreenResult(passed=False, output="\n".join(errors) or output, log_path=yosys_log_path,
+                               error="Yosys gave an error while elaborating the design. Please investigate and fix:")
+
+    return PrescreenResult(passed=True, log_path=log_path)
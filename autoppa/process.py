@@ -0,0 +1,109 @@
+import collections
+import os
+import signal
+import subprocess
+import threading
+from dataclasses import dataclass
+
+# wall-clock budget of each stage in seconds, after which the tool is killed
+# (can be changed from the command line with --budget STAGE=SECONDS)
+BUDGETS = {
+    "prescreen": 30,
+    "sim": 60,
+    "synth": 300,
+    "power": 300,
+}
+
+# lines of tool output kept in memory and shown to the LLM, the full output is in the log file
+TAIL_LINES = 100
+
+
+@dataclass
+class Streamed:
+    """Outcome of a command ran with run_streamed"""
+    returncode: int
+
+    # the last TAIL_LINES lines of output
+    tail: str
+
+    # the line which matched the abort pattern, if the process was killed because of it
+    aborted: str = None
+    timed_out: bool = False
+
+
+def run_streamed(command, log_path, *, budget=None, abort=None, lines=TAIL_LINES, debug=False):
+    """Run a command while streaming its output line by line to a log file
+
+    Only the last lines of the output are kept in memory, so a very verbose
+    process (e.g. a simulation with $monitor) doesn't grow the Python process.
+
+    Args:
+        command: Command line to run
+        log_path: File which receives the complete output (stdout and stderr)
+
+    Kwargs:
+        budget: Wall-clock time in seconds after which the process is killed
+        abort: Compiled regular expression, the process is killed on the first line matching it
+        lines: Number of lines of output to keep in memory
+        debug: Print the command line
+
+    Returns a Streamed with the return code and the tail of the output
+    """
+    if debug:
+        print(" ".join(command))
+
+    process = subprocess.Popen(command,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT,
+                               encoding="utf-8",
+                               errors="replace",
+                               bufsize=1,
+                               start_new_session=True)
+
+    expired = threading.Event()
+
+    def kill():
+        # iverilog runs the preprocessor and the compiler as child processes, which hold the pipe too
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def expire():
+        expired.set()
+        kill()
+
+    # killing the process closes its stdout, which ends the loop below
+    timer = threading.Timer(budget, expire) if budget is not None else None
+    if timer is not None:
+        timer.start()
+
+    output = collections.deque(maxlen=lines)
+    omitted = 0
+    aborted = None
+
+    try:
+        with open(log_path, "w") as log:
+            for line in process.stdout:
+                log.write(line)
+
+                if len(output) == output.maxlen:
+                    omitted += 1
+                output.append(line)
+
+                if abort is not None and abort.search(line):
+                    aborted = line.strip()
+                    kill()
+                    break
+    finally:
+        if timer is not None:
+            timer.cancel()
+        process.stdout.close()
+        process.wait()
+
+    text = "".join(output)
+    if omitted:
+        text = f"[... {omitted} lines omitted, see {log_path}]\n" + text
+
+    return Streamed(returncode=process.returncode, tail=text, aborted=aborted,
+                    timed_out=expired.is_set())
@@ -0,0 +1,180 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
+# spans are appended to this file in the Chrome trace format (JSON array), which can be
+# opened in chrome://tracing or Perfetto. None disables the tracing
+# (can be changed from the command line with --trace FILE and --no-trace)
+TRACE_PATH = os.path.join("build", "trace.json")
+
+# columns of the summary of the spans (see summarize)
+SUMMARY_COLUMNS = ["stage", "count", "cached", "p50_ms", "p95_ms", "max_ms", "total_s"]
+
+# attributes of every span of this process (e.g. the task and iteration of the agent)
+ATTRIBUTES = {}
+
+# the spans which are open in each thread, so that nested spans inherit their attributes
+_local = threading.local()
+
+
+def annotate(**attributes):
+    """Add attributes to every span recorded from now on by this process"""
+    ATTRIBUTES.update(attributes)
+
+
+def _call_with(attributes, func, *args, **kwargs):
+    ATTRIBUTES.update(attributes)
+    return func(*args, **kwargs)
+
+
+def bind(func, *args, **kwargs):
+    """Like functools.partial, but the call also gets the attributes of this process
+
+    This is what should be sent to a process pool, since a spawned worker doesn't
+    inherit the attributes of its parent
+    """
+    return partial(_call_with, dict(ATTRIBUTES), func, *args, **kwargs)
+
+
+def _parent():
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else {}
+
+
+def record(name, start, end, **args):
+    """Write a complete span to the trace
+
+    Args:
+        name: Name of the span, its first dotted part is the category (e.g. 'sim.compile')
+        start: time.perf_counter() when the span started
+        end: time.perf_counter() when it ended
+
+    Kwargs:
+        Attributes of the span (task, iteration, design_hash, ...) on top of the inherited ones
+    """
+    if TRACE_PATH is None:
+        return
+
+    # perf_counter has no defined origin, so the span is placed relative to the wall clock
+    offset = time.time() - time.perf_counter()
+
+    event = {"name": name,
+             "cat": name.split(".")[0],
+             "ph": "X",
+             "ts": round((start + offset) * 1e6),
+             "dur": round((end - start) * 1e6),
+             "pid": os.getpid(),
+             "tid": threading.get_native_id(),
+             "args": {**ATTRIBUTES, **_parent(), **args}}
+
+    line = json.dumps(event, separators=(",", ":")) + ",\n"
+
+    os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+
+    # several processes can append at once: the file is locked for each event
+    with open(TRACE_PATH, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            if f.tell() == 0:
+                f.write("[\n")
+            f.write(line)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def span(name, **args):
+    """Time a block of code and record it as a span (see record)
+
+    Yields the attributes of the span, which the block can add to
+    (e.g. whether the result was cached). Spans opened in the block
+    inherit these attributes
+    """
+    args = {**_parent(), **args}
+
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    _local.stack.append(args)
+
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        end = time.perf_counter()
+        _local.stack.pop()
+        record(name, start, end, **args)
+
+
+def read_trace(path=None):
+    """Return the events of a trace file, oldest first
+
+    The file is a JSON array which is never closed (Chrome accepts that), and
+    a line which is still being written is skipped
+    """
+    path = path or TRACE_PATH
+
+    events = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if line in ("", "[", "]"):
+                continue
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    return events
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) of sorted values, interpolated between the closest ranks"""
+    if not values:
+        return None
+
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(events, *, prefix=None, task=None):
+    """Duration statistics of each span name across the runs of a trace
+
+    Kwargs:
+        prefix: Only keep the spans whose name starts with this (e.g. 'sim')
+        task: Only keep the spans of this task
+
+    Returns a list of rows sorted by total time, with durations in milliseconds
+    """
+    durations = {}
+    cached = {}
+
+    for event in events:
+        if event.get("ph") != "X":
+            continue
+        if prefix is not None and not event["name"].startswith(prefix):
+            continue
+        if task is not None and event.get("args", {}).get("task") != task:
+            continue
+
+        durations.setdefault(event["name"], []).append(event["dur"] / 1000)
+        cached[event["name"]] = cached.get(event["name"], 0) + bool(event.get("args", {}).get("cached"))
+
+    rows = []
+    for name, values in durations.items():
+        values.sort()
+        rows.append({"stage": name,
+                     "count": len(values),
+                     "cached": cached[name],
+                     "p50_ms": round(percentile(values, 50), 3),
+                     "p95_ms": round(percentile(values, 95), 3),
+                     "max_ms": round(values[-1], 3),
+                     "total_s": round(sum(values) / 1000, 3)})
+
+    return sorted(rows, key=lambda row: row["total_s"], reverse=True)
@@ -0,0 +1,172 @@
+from dataclasses import dataclass, field, asdict
+
+
+@dataclass
+class StageResult:
+    """Outcome of one tool of the evaluation flow (sim, synth or power)
+
+    The string shown to the LLM is rendered from this object with str()
+    """
+    passed: bool
+    metric: float = None
+    error: str = None
+    output: str = ""
+    log_path: str = None
+    wall_time: float = 0.0
+    cached: bool = False
+
+    # the tool was killed because it ran past its time budget (such results aren't cached)
+    timed_out: bool = False
+
+    # the tool process died without reporting an error (e.g. docker isn't running, OOM),
+    # so the failure says nothing about the design (such results aren't cached either)
+    crashed: bool = False
+
+    # set by the subclasses
+    stage = None
+    success = None
+
+    def format_metric(self):
+        return f"{self.metric:g}"
+
+    def __str__(self):
+        if self.passed:
+            return self.success.format(metric=self.format_metric())
+
+        if self.output:
+            return f"{self.error}\n{self.output}"
+
+        return self.error
+
+    def details(self):
+        """Other values of the result than the metric, which the ledger records"""
+        return {}
+
+    def to_dict(self):
+        return {"stage": self.stage, **asdict(self)}
+
+    @staticmethod
+    def from_dict(d):
+        d = dict(d)
+        return RESULT_TYPES[d.pop("stage")](**d)
+
+
+@dataclass
+class PrescreenResult(StageResult):
+    stage = "prescreen"
+    success = "The pre-screen checks passed (port list, parsing and elaboration)"
+
+    def format_metric(self):
+        return ""
+
+
+@dataclass
+class SimResult(StageResult):
+    stage = "sim"
+    success = "The simulation passed successfully\nExecution time (ns) == {metric}"
+
+    def format_metric(self):
+        return f"{self.metric:.0f}"
+
+
+@dataclass
+class SynthResult(StageResult):
+    stage = "synth"
+    success = "The synthesis completed successfully\nArea (number of cells) == {metric}"
+
+    # 'fast' results come from the generic synthesis only (see synth.FIDELITIES)
+    fidelity: str = "signoff"
+
+    def format_metric(self):
+        return f"{self.metric:.0f}"
+
+    def __str__(self):
+        if self.passed and self.fidelity == "fast":
+            return super().__str__() + " (fast tier, the design wasn't mapped to the cell library)"
+
+        return super().__str__()
+
+
+@dataclass
+class PowerResult(StageResult):
+    stage = "power"
+    success = "The power analysis completed successfully\nPower (mW) == {metric}"
+
+    # timing of the same OpenSTA run: worst setup slack (ns) at the clock period (ns),
+    # and the max frequency (MHz) it allows (None if the design has no register to register path)
+    slack: float = None
+    fmax: float = None
+    clock_period: float = None
+
+    # simulator processes whose VCDs gave the switching activity. With more than one, each shard
+    # repeats the reset and starts from its own state, so the power is an approximation of the serial run
+    shards: int = 1
+
+    def format_metric(self):
+        return f"{self.metric:.4f}"
+
+    def __str__(self):
+        if not self.passed or self.fmax is None:
+            return super().__str__()
+
+        return (f"{super().__str__()}\n"
+                f"Worst slack (ns) == {self.slack:.4f} with a {self.clock_period:g} ns clock\n"
+                f"Max frequency (MHz) == {self.fmax:.1f}")
+
+    def details(self):
+        return {"slack": self.slack, "fmax": self.fmax, "shards": self.shards}
+
+
+RESULT_TYPES = {cls.stage: cls for cls in (PrescreenResult, SimResult, SynthResult, PowerResult)}
+
+
+@dataclass
+class Evaluation:
+    """Results of the complete flow on one design"""
+    task: int
+    design_hash: str
+    results: dict = field(default_factory=dict)
+    work_dir: str = None
+
+    # 'fast' evaluations (the screening tier) have no power analysis (see pipeline.evaluate)
+    fidelity: str = "signoff"
+
+    @property
+    def passed(self):
+        return all(result.passed for result in self.results.values())
+
+    def metric(self, stage):
+        """Metric reported by a stage, or None if it failed"""
+        result = self.results.get(stage)
+        return result.metric if result is not None and result.passed else None
+
+    def time_at_fmax(self):
+        """Execution time (ns) of the simulated cycles when clocked at the max frequency of the design
+
+        The simulation runs at the clock period of power analysis, so its number of cycles
+        is rescaled to the critical path. None if sim or power failed or there is no fmax
+        """
+        sim, power = self.results.get("sim"), self.results.get("power")
+        if sim is None or power is None or not (sim.passed and power.passed) or power.fmax is None:
+            return None
+
+        return sim.metric / power.clock_period * 1000 / power.fmax
+
+    def __str__(self):
+        return "\n\n".join(str(result) for result in self.results.values())
+
+    def to_dict(self):
+        return {"task": self.task,
+                "design_hash": self.design_hash,
+                "work_dir": self.work_dir,
+                "fidelity": self.fidelity,
+                "results": {stage: result.to_dict() for stage, result in self.results.items()}}
+
+    @staticmethod
+    def from_dict(d):
+        return Evaluation(task=d["task"],
+                          design_hash=d["design_hash"],
+                          work_dir=d.get("work_dir"),
+                          fidelity=d.get("fidelity", "signoff"),
+                          results={stage: StageResult.from_dict(result)
+                                   for stage, result in d["results"].items()})
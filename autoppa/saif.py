@@ -0,0 +1,66 @@
+import time
+from .activity import analyze, merge
+
+
+def _escape(name):
+    return name.replace("[", "\\[").replace("]", "\\]")
+
+
+def write_saif(report, saif_path):
+    """Write switching activity (an ActivityReport) to a SAIF file"""
+
+    # group the bits by instance so that the hierarchy can be written out
+    tree = {}
+    for path, activity in report.signals.items():
+        node = tree
+        for scope in path[:-1]:
+            node = node.setdefault(scope, {})
+        node.setdefault(None, {})[path[-1]] = activity
+
+    lines = ["(SAIFILE",
+             '(SAIFVERSION "2.0")',
+             '(DIRECTION "backward")',
+             '(DESIGN )',
+             f'(DATE "{time.strftime("%c")}")',
+             '(VENDOR "autoppa")',
+             '(PROGRAM_NAME "autoppa")',
+             '(DIVIDER / )',
+             f"(TIMESCALE {report.timescale[0]} {report.timescale[1]})",
+             f"(DURATION {report.duration})"]
+
+    def instance(name, node, indent):
+        pad = "  " * indent
+        lines.append(f"{pad}(INSTANCE {name}")
+
+        nets = node.get(None, {})
+        if nets:
+            lines.append(f"{pad}  (NET")
+            for net, activity in nets.items():
+                lines.append(f"{pad}    ({_escape(net)} (T0 {activity.t0}) (T1 {activity.t1}) "
+                             f"(TX {activity.tx}) (TC {activity.tc}) (IG 0))")
+            lines.append(f"{pad}  )")
+
+        for child, subtree in node.items():
+            if child is not None:
+                instance(child, subtree, indent + 1)
+
+        lines.append(f"{pad})")
+
+    for name, node in tree.items():
+        if name is not None:
+            instance(name, node, 0)
+
+    lines.append(")")
+
+    with open(saif_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def vcd_to_saif(vcd_path, saif_path):
+    """Convert a VCD into a (much smaller) SAIF file of toggle counts and durations"""
+    write_saif(analyze(vcd_path), saif_path)
+
+
+def vcds_to_saif(vcd_paths, saif_path):
+    """Convert the VCDs of the shards of a simulation into one SAIF of their combined activity"""
+    write_saif(merge(analyze(vcd_path) for vcd_path in vcd_paths), saif_path)
@@ -1,8 +1,18 @@
-import subprocess
+import glob
 import os
-from .utils import extract_module_name
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .utils import extract_module_name, design_hash, new_work_dir, write_atomic
+from .process import BUDGETS, run_streamed
+from .simulators import get_simulator
+from .results import SimResult
+from . import artifacts, cache, profiling, simulators
 import re
 
+# a failed test (or the testbench timeout) decides the outcome, so the simulation is stopped there
+FAILED_RE = re.compile(r"\bFAIL(ED)?\b")
+
 def extract_perf(string):
     """Parse the Icarus Verilog sim output to get time (performance) metric"""
     time_re = re.compile(r"TIME:\s*(\d+)")
@@ -28,68 +38,202 @@ def extract_failed_sim(string):
         
     raise Exception("Sim result could not be extracted from output")
     
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
     
-def sim(code: str, *, task:int=1, debug:bool=False) -> str:
-    """Runs Icarus Verilog simulation on input code string
+    
+def shard_vcds(build_dir, dut_name):
+    """VCDs left by the shards of a sharded simulation, in the order of the shards"""
+    paths = glob.glob(f"{build_dir}/{dut_name}.shard*.vcd")
+    return sorted(paths, key=lambda path: int(path.rsplit(".shard", 1)[1][:-len(".vcd")]))
+
+
+def sim_key(code, task, simulator, shards):
+    """Content address of the simulation of a design (result cache and artifact store)"""
+    return cache.cache_key("sim", code, files=[f"benchmark/task{task}.v"], extra=[simulator, shards])
+
+
+def sim(code: str, *, task:int=1, debug:bool=False, use_cache:bool=True,
+        work_dir:str=None, dump_dut:bool=False, simulator:str=None, shards:int=None) -> SimResult:
+    """Runs the simulation of the testbench on input code string
     
     Args:
         code: A string representing the Verilog code to simulate
         
     Kwargs:
         task: Which benchmark optimization task to run
-        debug: Output additional information from Icarus Verilog
+        debug: Output additional information from the simulator
+        use_cache: Return the stored result if this design was already simulated
+        work_dir: Directory for the build files and the VCD (defaults to a new one, see utils.new_work_dir)
+        dump_dut: Also dump the nets inside of the DUT in the VCD (not only its ports)
+        simulator: Simulator backend, 'icarus' or 'verilator' (defaults to simulators.DEFAULT_SIMULATOR)
+        shards: Number of simulator processes which run the operations of the testbench in parallel
+                (defaults to simulators.DEFAULT_SHARDS). Each one writes its own VCD
         
-    Returns a string indicating either success with
+    The VCD(s) and the log of a successful simulation are moved to the artifact store,
+    where power analysis finds them by design hash (except for a full dump, which
+    stays in the work directory)
+    
+    Returns a SimResult indicating either success with
     performance estimation (time in nanoseconds),
-    or failure with an error message
-    """    
+    or failure with an error message (str() gives the message for the LLM)
+    """
+    simulator = simulator or simulators.DEFAULT_SIMULATOR
+    shards = shards or simulators.DEFAULT_SHARDS
+    
+    key = sim_key(code, task, simulator, shards)
+    code_hash = design_hash(code)
+    
+    def reuse(result):
+        # a passed result is only reused along with its VCD (which may have been evicted),
+        # and its log is the one in the artifact store since the work directory may be gone
+        if not result.passed:
+            return result
+        
+        path = artifacts.get(code_hash, "sim", key)
+        if path is None:
+            return None
+        
+        result.log_path = os.path.join(path, "sim.log")
+        return result
+    
+    def run():
+        result = _sim(code, task=task, debug=debug, work_dir=work_dir, dump_dut=dump_dut,
+                      simulator=simulator, shards=shards)
+        
+        # a full dump is left in the work directory, it isn't the VCD which power analysis reads
+        if result.passed and not dump_dut:
+            build_dir = os.path.dirname(result.log_path)
+            dut_name = extract_module_name(code)
+            
+            if shards == 1:
+                files = {"sim.vcd": f"{build_dir}/{dut_name}.vcd"}
+            else:
+                files = {f"shard{i}.vcd": path for i, path in enumerate(shard_vcds(build_dir, dut_name))}
+            
+            # the files are moved to the store
+            path = artifacts.put(code_hash, "sim", key, {**files, "sim.log": result.log_path})
+            result.log_path = os.path.join(path, "sim.log")
+        
+        return result
+    
+    with profiling.span("sim", task=task, design_hash=code_hash) as span:
+        # the point of a full dump is the VCD, which a cached result doesn't produce
+        return cache.cached_stage(key, "sim", run, span=span, debug=debug,
+                                  use_cache=use_cache and not dump_dut, reuse=reuse)
+
+
+def _sim(code: str, *, task:int=1, debug:bool=False, work_dir:str=None,
+         dump_dut:bool=False, simulator:str=None, shards:int=1) -> SimResult:
+    """Runs the compilation and simulation (uncached)"""
     dut_name = extract_module_name(code)
+    simulator = get_simulator(simulator)
     
-    build_dir = os.path.join("build", f"task{task}")
+    # a directory of its own, so that concurrent runs of the CLI don't overwrite each other's files
+    build_dir = work_dir if work_dir else new_work_dir(task, dut_name)
     
     os.makedirs(build_dir, exist_ok=True)
     
-    with open(f"{build_dir}/{dut_name}.v", "w") as f:
-        f.write(code)
+    # synth may be reading the same source file concurrently
+    write_atomic(f"{build_dir}/{dut_name}.v", code)
     
-    try:
-        command = ["iverilog", "-o", f"{build_dir}/{dut_name}",
-                                 f"-DDUT_NAME={dut_name}", f"{build_dir}/{dut_name}.v",
-                                 f"benchmark/task{task}.v"]
-        if debug:
-            print(" ".join(command))
-        
-        # no output if compilation passes successfully
-        subprocess.run(command,
-                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                       check=True, encoding="utf-8")
-        
-    except subprocess.CalledProcessError as e:
-        return f"Icarus Verilog gave an error during compilation. Please investigate and fix:\n{e.stdout}"
+    log_path = f"{build_dir}/{dut_name}.sim.log"
+    vcd_path = f"{build_dir}/{dut_name}.vcd"
     
-    else:
+    # a VCD left by an earlier run must not be mistaken for the output of this one
+    _remove(vcd_path)
+    for path in shard_vcds(build_dir, dut_name):
+        _remove(path)
+    
+    # compilation and simulation share the budget of the stage
+    deadline = time.monotonic() + BUDGETS["sim"]
+    
+    with profiling.span("sim.compile", simulator=simulator.label):
+        compiled = simulator.compile(dut_name, f"{build_dir}/{dut_name}.v", task=task, build_dir=build_dir,
+                                     log_path=log_path, budget=deadline - time.monotonic(), debug=debug)
+    
+    if compiled.timed_out:
+        return SimResult(passed=False, output=compiled.tail, log_path=log_path, timed_out=True,
+                         error=f"{simulator.label} exceeded the time budget of {BUDGETS['sim']} s during compilation:")
+    
+    if compiled.returncode != 0:
+        return SimResult(passed=False, output=compiled.tail, log_path=log_path,
+                         error=f"{simulator.label} gave an error during compilation. Please investigate and fix:")
+    
+    # the output is streamed to the log (the DEBUG $monitor output can be huge),
+    # and a failing design is stopped at its first failed test rather than at the testbench timeout
+    with profiling.span("sim.run", simulator=simulator.label, shards=shards):
+        if shards == 1:
+            command = simulator.command(dut_name, build_dir=build_dir, vcd_path=vcd_path, dump_dut=dump_dut)
+            runs = [run_streamed(command, log_path, budget=deadline - time.monotonic(),
+                                 abort=FAILED_RE, debug=debug)]
+        else:
+            runs = _run_shards(simulator, dut_name, build_dir=build_dir, log_path=log_path, shards=shards,
+                               budget=deadline - time.monotonic(), dump_dut=dump_dut, debug=debug)
+    
+    timed_out = [simulated for simulated in runs if simulated.timed_out]
+    failed = []
+    perf = 0
+    
+    for simulated in [] if timed_out else runs:
         try:
-            command = ["vvp", f"{build_dir}/{dut_name}"]
-            
-            if debug:
-                print(" ".join(command))
-            
-            sim_result = subprocess.run(command,
-                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                                    check=True, encoding="utf-8")
-            
-            # because we can only output error with $fatal, but that outputs
-            # additional information from verilog testbench which is superfluous
-            sim_fail = extract_failed_sim(sim_result.stdout)
-            if sim_fail: 
-                raise subprocess.CalledProcessError(1, command, sim_result.stdout)
-            
-            perf = extract_perf(sim_result.stdout)
-            
-            return (f"The simulation passed successfully\n"
-                    f"Execution time (ns) == {perf}")
-            
-        except subprocess.CalledProcessError as e:
-            return f"Icarus Verilog simulator gave an error during simulation. Please investigate and fix:\n{e.stdout}"
+            if simulated.aborted or simulated.returncode != 0 or extract_failed_sim(simulated.tail):
+                failed.append(simulated)
+            else:
+                # each shard counts the cycles of its own operations, so the sum is the time of the serial run
+                perf += float(extract_perf(simulated.tail))
+        except Exception:
+            # the testbench of this run (e.g. a shard) didn't print its outcome
+            failed.append(simulated)
+    
+    # because we can only output error with $fatal, but that outputs
+    # additional information from verilog testbench which is superfluous
+    if timed_out:
+        result = SimResult(passed=False, output=timed_out[0].tail, log_path=log_path, timed_out=True,
+                           error=f"The simulation exceeded its time budget of {BUDGETS['sim']} s and was stopped. "
+                                 "The design may never assert its outputs or contain a combinational loop:")
+    
+    elif failed:
+        result = SimResult(passed=False, output=failed[0].tail, log_path=log_path,
+                           error=f"{simulator.label} simulator gave an error during simulation. Please investigate and fix:")
+    
+    else:
+        return SimResult(passed=True, metric=perf, log_path=log_path)
+    
+    # the VCD of a failed simulation is partial
+    _remove(vcd_path)
+    for path in shard_vcds(build_dir, dut_name):
+        _remove(path)
+    
+    return result
+
+
+def _run_shards(simulator, dut_name, *, build_dir, log_path, shards, budget, dump_dut=False, debug=False):
+    """Run the shards of the testbench in parallel on the same build, each with its own VCD and log
+    
+    The logs of the shards are then appended to log_path one after the other
+    
+    Returns the process.Streamed of each shard
+    """
+    def run(i):
+        command = simulator.command(dut_name, build_dir=build_dir, vcd_path=f"{build_dir}/{dut_name}.shard{i}.vcd",
+                                    dump_dut=dump_dut, shard=(i, shards))
+        return run_streamed(command, f"{log_path}.shard{i}", budget=budget, abort=FAILED_RE, debug=debug)
+    
+    # the simulators are separate processes, so threads are enough to run them at once
+    with ThreadPoolExecutor(max_workers=shards) as pool:
+        runs = list(pool.map(run, range(shards)))
+    
+    with open(log_path, "w") as log:
+        for i in range(shards):
+            log.write(f"# shard {i} of {shards}\n")
+            with open(f"{log_path}.shard{i}", "r") as f:
+                shutil.copyfileobj(f, log)
+            os.remove(f"{log_path}.shard{i}")
     
-            
\ No newline at end of file
+    return runs
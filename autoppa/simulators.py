@@ -0,0 +1,186 @@
+import fcntl
+import glob
+import os
+import shutil
+import subprocess
+import time
+from .process import run_streamed
+from .utils import extract_module_name
+
+# backend used when sim() isn't given one (can be changed from the command line with --simulator)
+DEFAULT_SIMULATOR = "icarus"
+
+# number of processes which share the operations of a testbench (can be changed with --shards)
+DEFAULT_SHARDS = 1
+
+
+class Simulator:
+    """Compiles a design together with the testbench of a task, and runs the result
+
+    Backends must keep the contract of the testbenches: the output of a run
+    contains PASSED/FAILED and 'TIME: <ns>', +VCD=<path> sets the dump file, and
+    +SHARD=<i> +NSHARDS=<n> restricts the run to one shard of the operations
+    """
+
+    # name in the error messages which are shown to the LLM
+    label = None
+
+    def compile(self, dut_name, source, *, task, build_dir, log_path, budget=None, debug=False):
+        """Build the simulation of a design, returns a process.Streamed"""
+        raise NotImplementedError
+
+    def command(self, dut_name, *, build_dir, vcd_path, dump_dut=False, shard=None):
+        """Command line which runs the simulation built by compile()
+
+        Kwargs:
+            shard: (i, n) to only run the shard i of n of the operations of the testbench
+        """
+        raise NotImplementedError
+
+    def plusargs(self, *, vcd_path, dump_dut=False, shard=None):
+        """Plusargs of the testbench, which are the same for every backend"""
+        plusargs = [f"+VCD={vcd_path}"]
+        if dump_dut:
+            plusargs.append("+DUMP_DUT")
+        if shard is not None:
+            plusargs += [f"+SHARD={shard[0]}", f"+NSHARDS={shard[1]}"]
+        return plusargs
+
+
+class Icarus(Simulator):
+    """Icarus Verilog: the design and testbench are compiled with iverilog and interpreted by vvp"""
+
+    label = "Icarus Verilog"
+
+    def compile(self, dut_name, source, *, task, build_dir, log_path, budget=None, debug=False):
+        command = ["iverilog", "-o", f"{build_dir}/{dut_name}",
+                   f"-DDUT_NAME={dut_name}", source, f"benchmark/task{task}.v"]
+
+        # no output if compilation passes successfully
+        return run_streamed(command, log_path, budget=budget, debug=debug)
+
+    def command(self, dut_name, *, build_dir, vcd_path, dump_dut=False, shard=None):
+        return ["vvp", f"{build_dir}/{dut_name}",
+                *self.plusargs(vcd_path=vcd_path, dump_dut=dump_dut, shard=shard)]
+
+
+class Verilator(Simulator):
+    """Verilator: the design and testbench are translated to C++ and compiled to a binary
+
+    The testbenches use delays and event controls, so Verilator 5 (--timing) is needed.
+    Verilator models the whole hierarchy at once, so the testbench can't be compiled
+    apart from the DUT. What doesn't depend on the DUT is the Verilator runtime (the
+    largest part of the C++ build), which is compiled once per task in HARNESS_DIR
+    and copied into the build of each design, so that only the model is rebuilt.
+    If ccache is installed, it also caches the objects of the model between designs.
+    """
+
+    label = "Verilator"
+
+    HARNESS_DIR = os.path.join("build", "verilator")
+
+    # the testbenches aren't lint clean and the LLM designs even less so
+    FLAGS = ["--cc", "--exe", "--main", "--timing", "--trace", "-Wno-fatal", "-Wno-lint", "-Wno-style",
+             "--x-assign", "unique", "--x-initial", "unique"]
+
+    def top(self, task):
+        return f"task{task}_tb"
+
+    def verilate(self, dut_name, source, *, task, mdir, log_path, budget=None, debug=False):
+        """Translate a design and the testbench of a task to C++ in mdir, then build it"""
+        command = ["verilator", *self.FLAGS,
+                   "--top-module", self.top(task),
+                   f"-DDUT_NAME={dut_name}",
+                   "--Mdir", mdir,
+                   "-o", "sim",
+                   source, f"benchmark/task{task}.v"]
+
+        start = time.monotonic()
+
+        verilated = run_streamed(command, log_path, budget=budget, debug=debug)
+        if verilated.returncode != 0 or verilated.timed_out:
+            return verilated
+
+        command = ["make", "-s", "-C", mdir, "-f", f"V{self.top(task)}.mk", f"-j{os.cpu_count() or 1}"]
+        if shutil.which("ccache"):
+            command.append("OBJCACHE=ccache")
+
+        # the C++ build gets its own log, next to the one of verilator
+        if budget is not None:
+            budget -= time.monotonic() - start
+        return run_streamed(command, f"{log_path}.make", budget=budget, debug=debug)
+
+    def harness(self, task, *, debug=False):
+        """Directory with the Verilator runtime objects of a task, built on first use
+
+        The reference design is built once and its runtime objects are kept. Several
+        processes can ask for the harness at once, so the build is done under a lock.
+        This one-time build isn't counted in the time budget of the designs.
+        """
+        harness_dir = os.path.join(self.HARNESS_DIR, f"task{task}")
+        stamp = os.path.join(harness_dir, "version")
+
+        version = subprocess.run(["verilator", "--version"], stdout=subprocess.PIPE,
+                                 encoding="utf-8").stdout.strip()
+
+        os.makedirs(self.HARNESS_DIR, exist_ok=True)
+
+        with open(os.path.join(self.HARNESS_DIR, f"task{task}.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.isfile(stamp):
+                    with open(stamp, "r") as f:
+                        if f.read() == version:
+                            return harness_dir
+
+                shutil.rmtree(harness_dir, ignore_errors=True)
+                os.makedirs(harness_dir)
+
+                reference = f"baseline/reference/task{task}.v"
+                with open(reference, "r") as f:
+                    dut_name = extract_module_name(f.read())
+
+                built = self.verilate(dut_name, reference, task=task, mdir=harness_dir,
+                                      log_path=os.path.join(harness_dir, "build.log"),
+                                      debug=debug)
+                if built.returncode != 0 or built.timed_out:
+                    raise Exception(f"The Verilator harness of task {task} could not be built:\n{built.tail}")
+
+                with open(stamp, "w") as f:
+                    f.write(version)
+
+                return harness_dir
+
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def compile(self, dut_name, source, *, task, build_dir, log_path, budget=None, debug=False):
+        mdir = os.path.join(build_dir, "obj_dir")
+        os.makedirs(mdir, exist_ok=True)
+
+        # copy2 keeps the modification times, so make sees the runtime objects as up to date
+        for obj in glob.glob(os.path.join(self.harness(task, debug=debug), "verilated*.o")):
+            shutil.copy2(obj, mdir)
+
+        return self.verilate(dut_name, source, task=task, mdir=mdir, log_path=log_path,
+                             budget=budget, debug=debug)
+
+    def command(self, dut_name, *, build_dir, vcd_path, dump_dut=False, shard=None):
+        return [os.path.join(build_dir, "obj_dir", "sim"),
+                *self.plusargs(vcd_path=vcd_path, dump_dut=dump_dut, shard=shard)]
+
+
+SIMULATORS = {
+    "icarus": Icarus,
+    "verilator": Verilator,
+}
+
+
+def get_simulator(name=None):
+    """Simulator backend by name (DEFAULT_SIMULATOR if not given)"""
+    name = name or DEFAULT_SIMULATOR
+
+    if name not in SIMULATORS:
+        raise ValueError("Invalid simulator", name)
+
+    return SIMULATORS[name]()
@@ -1,8 +1,50 @@
 
 import re
-import subprocess
 import os
-from .utils import extract_module_name
+import time
+import shutil
+import subprocess
+from functools import lru_cache
+from .utils import extract_module_name, design_hash, new_work_dir, write_atomic
+from .results import SynthResult
+from .worker import Worker, WorkerCrashed, WorkerTimeout, ProcessLocal
+from .process import BUDGETS
+from . import artifacts, cache, profiling
+
+LIBERTY = "benchmark/sky130hd_tt.lib"
+
+# Yosys commands, formatted with the build directory and the top-level module name
+YOSYS_SCRIPT = [
+    "read_verilog {build_dir}/{dut_name}.v",
+    "hierarchy -top {dut_name}",
+    "synth",
+    # "proc; opt",
+    # "memory; opt",
+    # "fsm; opt",
+    "techmap; opt",
+    f"dfflibmap -liberty {LIBERTY}",
+    f"abc -liberty {LIBERTY}",
+    "clean",
+    "write_verilog {build_dir}/synth_{dut_name}.v",
+]
+
+# fast tier of the evaluation ladder: generic synthesis only. The area metric is the cell count
+# printed by the 'stat' at the end of 'synth' (the first one of the full script too), and the
+# liberty mapping, which is only needed for the netlist of power analysis, is skipped
+FAST_SCRIPT = [
+    "read_verilog {build_dir}/{dut_name}.v",
+    "hierarchy -top {dut_name}",
+    "synth",
+]
+
+# Yosys script of each fidelity, 'signoff' produces the sky130 netlist
+FIDELITIES = {
+    "fast": FAST_SCRIPT,
+    "signoff": YOSYS_SCRIPT,
+}
+
+# printed by Yosys before each command of the script (see _synth)
+STEP_MARKER = "AUTOPPA_STEP"
 
 
 def extract_area(string):
@@ -16,9 +58,93 @@ def extract_area(string):
         raise Exception("Area could not be extracted from synthesis report")
 
     return area
+
+
+@lru_cache(maxsize=None)
+def has_command(command):
+    """Whether the installed Yosys has this command (e.g. 'libcache', which older versions lack)"""
+    try:
+        output = subprocess.run(["yosys", "-Q", "-p", f"help {command}"], capture_output=True,
+                                encoding="utf-8", timeout=30).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    
+    return "No such command" not in output
+
+
+class YosysWorker(Worker):
+    """Yosys shell which is kept running and synthesizes designs one after the other
+    
+    Each design starts with 'design -reset' so nothing leaks from the previous one.
+    The liberty parsed by dfflibmap is kept in the liberty cache of the shell
+    (libcache, if this Yosys has it), so it is parsed once per process. abc
+    hands the file to ABC which still reads it on every design, Yosys has no
+    way to give it a library which is already loaded.
+    
+    Yosys exits on most errors (e.g. syntax errors), in which case the worker is
+    restarted for the next design
+    """
+    
+    name = "yosys"
+    
+    def __init__(self, debug=False):
+        command = ["yosys", "-Q"]
+        
+        # yosys logs with stdio which is fully buffered on a pipe
+        if shutil.which("stdbuf"):
+            command = ["stdbuf", "-oL"] + command
+        
+        # 'design -reset' doesn't clear the liberty cache
+        setup = f"libcache -enable {LIBERTY}" if has_command("libcache") else ""
+            
+        super().__init__(command, setup=setup, debug=debug)
+        
+    def wrap(self, script, marker):
+        # the quotes are stripped by yosys, so the echo of the command never ends with the marker
+        return f"design -reset\n{script}\nlog \"{marker}\""
+    
+    def reported_error(self, line):
+        return "ERROR:" in line
+
+
+# one Yosys process per Python process, started on first use
+_yosys_worker = ProcessLocal(YosysWorker)
+
+
+def run_yosys(script, *, debug=False, budget=None, log_path=None, on_line=None):
+    """Run a Yosys script in this process' Yosys shell
+    
+    Kwargs:
+        budget: Wall-clock time in seconds after which Yosys is killed (raises WorkerTimeout)
+        log_path: File which receives the output as it is produced
+        on_line: Function called with each line of output as soon as it is read
+    
+    Returns the tail of the output of the script and whether Yosys reported an error. Yosys exits
+    on most errors of the design, but if it exited without printing one, it crashed
+    (e.g. killed when out of memory) and WorkerCrashed is raised
+    """
+    worker = _yosys_worker.get()
+    worker.debug = debug
+    
+    try:
+        return worker.run(script, timeout=budget, log_path=log_path, on_line=on_line)
+    
+    except WorkerTimeout:
+        raise
+        
+    except WorkerCrashed as e:
+        if not e.failed:
+            raise
+        return e.output, True
                 
                 
-def synth(code: str, *, debug:bool=False) -> str:
+def synth_key(code, fidelity="signoff"):
+    """Content address of the synthesis of a design (result cache and artifact store)"""
+    return cache.cache_key("synth", code, files=[LIBERTY], extra=FIDELITIES[fidelity])
+
+
+def synth(code: str, *, debug:bool=False, use_cache:bool=True, work_dir:str=None,
+          fidelity:str="signoff") -> SynthResult:
     """Runs Yosys Verilog synthesis on input code string
     
     Args:
@@ -26,49 +152,115 @@ def synth(code: str, *, debug:bool=False) -> str:
     
     Kwargs:
         debug: Output additional information from Yosys
+        use_cache: Return the stored result if this design was already synthesized
+        work_dir: Directory for the netlist and the Yosys log (defaults to a new one, see utils.new_work_dir)
+        fidelity: 'signoff' maps to the sky130 liberty and writes the netlist, 'fast' only runs
+                  the generic synthesis to count the cells (to rank candidates cheaply)
+    
+    The netlist and the Yosys log of a successful signoff synthesis are moved to the
+    artifact store, where power analysis finds them by design hash
+    
+    Returns a SynthResult indicating either success with area estimation (number of cells),
+    or failure with an error message (str() gives the message for the LLM)
+    """
+    if fidelity not in FIDELITIES:
+        raise ValueError("Invalid fidelity", fidelity)
+    
+    key = synth_key(code, fidelity)
+    code_hash = design_hash(code)
+    
+    # only the signoff tier produces a netlist
+    keep_netlist = fidelity == "signoff"
+    
+    def reuse(result):
+        # a passed signoff result is only reused along with its netlist (which may have been
+        # evicted), and its log is the one in the artifact store since the work directory may be gone
+        if not result.passed or not keep_netlist:
+            return result
+        
+        path = artifacts.get(code_hash, "synth", key)
+        if path is None:
+            return None
+        
+        result.log_path = os.path.join(path, "synth.log")
+        return result
+    
+    def run():
+        result = _synth(code, debug=debug, work_dir=work_dir, fidelity=fidelity)
+        result.fidelity = fidelity
+        
+        if result.passed and keep_netlist:
+            build_dir = os.path.dirname(result.log_path)
+            
+            # the files are moved to the store
+            path = artifacts.put(code_hash, "synth", key,
+                                 {"netlist.v": f"{build_dir}/synth_{extract_module_name(code)}.v",
+                                  "synth.log": result.log_path})
+            result.log_path = os.path.join(path, "synth.log")
+        
+        return result
     
-    Returns a string indicating either success with area estimation (number of cells),
-    or failure with an error message
-    """ 
+    with profiling.span("synth", design_hash=code_hash, fidelity=fidelity) as span:
+        return cache.cached_stage(key, "synth", run, span=span, debug=debug,
+                                  use_cache=use_cache, reuse=reuse)
+
+
+def _synth(code: str, *, debug:bool=False, work_dir:str=None, fidelity:str="signoff") -> SynthResult:
+    """Runs the Yosys synthesis flow (uncached)"""
     
     dut_name = extract_module_name(code)
     
-    build_dir = "build/synth"
+    # a directory of its own, so that concurrent runs of the CLI don't overwrite each other's files
+    build_dir = work_dir if work_dir else new_work_dir(None, dut_name)
     
     os.makedirs(build_dir, exist_ok=True)
     
-    with open(f"{build_dir}/{dut_name}.v", "w") as f:
-        f.write(code)
+    # sim may be reading the same source file concurrently
+    write_atomic(f"{build_dir}/{dut_name}.v", code)
 
+    # each command is preceded by a line which marks its start, so that it gets its own profiling span
+    script = []
+    for step in FIDELITIES[fidelity]:
+        script.append(f"log \"{STEP_MARKER} {step.split()[0]}\"")
+        script.append(step.format(build_dir=build_dir, dut_name=dut_name))
+    script = "\n".join(script)
+    
+    log_path = f"{build_dir}/{dut_name}.synth.log"
+    
+    steps = []
+    
+    # the cell count of 'stat' can be far from the end of the output, which is only kept as a tail
+    stats = []
+    
+    def on_line(line):
+        if line.startswith(STEP_MARKER):
+            steps.append((line.split()[1], time.perf_counter()))
+        elif "Number of cells" in line:
+            stats.append(line)
+    
     try:
-        command = ["yosys",
-                   "-p", f"read_verilog {build_dir}/{dut_name}.v",
-                   "-p", f"hierarchy -top {dut_name}",
-                   "-p", "synth",
-                #    "-p", "proc; opt",
-                #    "-p", "memory; opt",
-                #    "-p", "fsm; opt",
-                   "-p", "techmap; opt",
-                   "-p", "dfflibmap -liberty benchmark/sky130hd_tt.lib",
-                   "-p", "abc -liberty benchmark/sky130hd_tt.lib",
-                   "-p", "clean",
-                   "-p", f"write_verilog {build_dir}/synth_{dut_name}.v",
-                   "-l", f"{build_dir}/{dut_name}.log"]
-             
-
-        
-        if debug:
-            print(" ".join(command))
-            
-        synthesis_result = subprocess.run(command,
-                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                           check=True, encoding="utf-8")
+        output, failed = run_yosys(script, debug=debug, budget=BUDGETS["synth"], log_path=log_path,
+                                   on_line=on_line)
         
-        area = extract_area(synthesis_result.stdout)
-        
-        return (f"The synthesis completed successfully\n"
-                f"Area (number of cells) == {area}")
-        
-    except subprocess.CalledProcessError as e:
-        return f"Yosys gave an error during synthesis. Please investigate and fix:\n{e.stdout}"
-          
\ No newline at end of file
+    except WorkerTimeout as e:
+        return SynthResult(passed=False, output=e.output, log_path=log_path, timed_out=True,
+                           error=f"Yosys exceeded the synthesis time budget of {BUDGETS['synth']} s and was stopped. "
+                                 "Please simplify the design:")
+    
+    except WorkerCrashed as e:
+        return SynthResult(passed=False, output=e.output, log_path=log_path, crashed=True,
+                           error="Yosys exited unexpectedly during synthesis:")
+    
+    finally:
+        # a step ends where the next one starts (the last one, where the output ends)
+        end = time.perf_counter()
+        for (step, start), (_, stop) in zip(steps, steps[1:] + [(None, end)]):
+            profiling.record(f"synth.{step}", start, stop)
+    
+    if failed:
+        return SynthResult(passed=False, output=output, log_path=log_path,
+                           error="Yosys gave an error during synthesis. Please investigate and fix:")
+    
+    area = extract_area("".join(stats))
+    
+    return SynthResult(passed=True, metric=float(area), log_path=log_path)
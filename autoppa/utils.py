@@ -1,4 +1,14 @@
 import re
+import os
+import uuid
+import shutil
+import hashlib
+
+# every evaluation of a design gets a directory in here (see new_work_dir)
+RUNS_DIR = os.path.join("build", "runs")
+
+# upper bound on the on-disk size of the work directories, least recently used ones are evicted first
+MAX_RUN_BYTES = 256 * 1024 * 1024
 
 def extract_module_name(code):
     """Parse Verilog module code to get the module name"""
@@ -10,3 +20,122 @@ def extract_module_name(code):
         raise Exception("Module name could not be extracted from code")
     
     return result.strip()
+
+
+def normalize_verilog(code):
+    """Strip comments and collapse whitespace so that cosmetic edits hash the same"""
+
+    # block comments first so that a '//' inside of one doesn't confuse us
+    code = re.sub(r"/\*.*?\*/", " ", code, flags=re.DOTALL)
+    code = re.sub(r"//[^\n]*", " ", code)
+
+    return " ".join(code.split())
+
+
+def design_hash(code):
+    """Hash of the normalized Verilog code (content address of a design)"""
+    return hashlib.sha256(normalize_verilog(code).encode("utf-8")).hexdigest()
+
+
+def write_atomic(path, content):
+    """Write a file through a temporary file and a rename, so readers never see it half written"""
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    
+    with open(tmp_path, "w") as f:
+        f.write(content)
+        
+    os.replace(tmp_path, path)
+
+
+def touch(path):
+    """Mark a file or directory as just used, its mtime is the last access time of the LRU evictions
+
+    Returns False if it doesn't exist (anymore)
+    """
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+
+    return True
+
+
+def _tree_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                continue
+    return size
+
+
+def evict_dirs(root, max_bytes):
+    """Remove the least recently used directories of root/<group>/ until they fit in max_bytes
+
+    Used by the artifact store (grouped by design hash) and the work directories
+    (grouped by task). The directories of a group are ordered by their mtime (see touch),
+    and a group is removed once it is empty
+    """
+    entries = []
+    total = 0
+
+    if not os.path.isdir(root):
+        return
+
+    for group in os.listdir(root):
+        group_dir = os.path.join(root, group)
+        try:
+            names = os.listdir(group_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+        for name in names:
+            # directories being written
+            if name.endswith(".tmp"):
+                continue
+
+            path = os.path.join(group_dir, name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            size = _tree_size(path)
+            entries.append((mtime, size, path))
+            total += size
+
+    if total <= max_bytes:
+        return
+
+    for _, size, path in sorted(entries):
+        shutil.rmtree(path, ignore_errors=True)
+
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+        total -= size
+        if total <= max_bytes:
+            break
+
+
+def new_work_dir(task, dut_name):
+    """Create a unique build directory for one evaluation of a design
+    
+    Args:
+        task: Benchmark task of the evaluation, or None for a stage which doesn't depend on it (synth)
+        dut_name: Name of the module of the design
+    
+    Every file produced while evaluating a design (compiled sim, VCD, netlist,
+    logs, OpenSTA script) goes in here so that evaluations can run concurrently.
+    The files which are needed later are moved to the artifact store, and the
+    least recently used work directories are evicted past MAX_RUN_BYTES
+    """
+    evict_dirs(RUNS_DIR, MAX_RUN_BYTES)
+    
+    group = f"task{task}" if task is not None else "any"
+    work_dir = os.path.join(RUNS_DIR, group, f"{dut_name}-{uuid.uuid4().hex[:12]}")
+    os.makedirs(work_dir)
+    return work_dir
@@ -0,0 +1,225 @@
+import atexit
+import collections
+import os
+import subprocess
+import threading
+import uuid
+from .process import TAIL_LINES
+from . import profiling
+
+
+class WorkerCrashed(Exception):
+    """The tool process exited before finishing a batch of commands
+
+    The tail of the output printed by the tool before it exited is kept in
+    'output', and whether it reported an error in 'failed'
+    """
+
+    def __init__(self, message, output="", failed=False):
+        super().__init__(message)
+        self.output = output
+        self.failed = failed
+
+
+class WorkerTimeout(WorkerCrashed):
+    """The batch ran past its time budget and the tool process was killed"""
+
+
+class Worker:
+    """Long-lived interactive tool process which is fed batches of commands over stdin
+
+    Starting a tool (and loading its libraries) is paid once, and then each
+    call to run() sends a batch of commands followed by a marker command. The
+    output up to the marker is the output of the batch. If the process dies,
+    a new one is started on the next call.
+
+    Subclasses define how a batch is wrapped so that it prints the marker.
+    """
+
+    # prefix of the profiling spans of the process (startup and batches)
+    name = "worker"
+
+    def __init__(self, command, *, setup="", debug=False):
+        """
+        Args:
+            command: Command line which starts the tool in interactive mode
+
+        Kwargs:
+            setup: Commands which are ran once when the process starts (e.g. loading a liberty)
+            debug: Print the commands which are sent to the tool
+        """
+        self.command = command
+        self.setup = setup
+        self.debug = debug
+
+        self.process = None
+
+        # the pipeline runs tools from several threads, but a batch must not be interleaved
+        self.lock = threading.Lock()
+
+        atexit.register(self.stop)
+
+    def wrap(self, script, marker):
+        """Return the text to send so that the tool runs 'script' and then prints 'marker'"""
+        raise NotImplementedError
+
+    def reported_error(self, line):
+        """Whether the tool reported an error in this line of the output of a batch"""
+        raise NotImplementedError
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Start the tool process and run the setup commands"""
+        if self.debug:
+            print(" ".join(self.command))
+
+        # for the OpenSTA container this includes starting docker and reading the liberty
+        with profiling.span(f"{self.name}.startup"):
+            self.process = subprocess.Popen(self.command,
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT,
+                                            encoding="utf-8",
+                                            bufsize=1)
+
+            if self.setup:
+                output, failed = self._exchange(self.setup)
+
+                # e.g. the liberty is missing, every batch would then fail the same way
+                if failed:
+                    self.stop()
+                    raise WorkerCrashed(f"{self.command[0]} failed to run its setup commands", output)
+
+    def kill(self):
+        """Kill the tool process right away (e.g. when a batch runs past its budget)"""
+        self.process.kill()
+
+    def stop(self):
+        """Terminate the tool process (a new one is started on the next run)"""
+        if self.process is None:
+            return
+
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.kill()
+                self.process.wait()
+
+        self.process = None
+
+    def run(self, script, *, timeout=None, log_path=None, on_line=None):
+        """Run a batch of commands and return the tail of its output and whether the tool reported an error
+
+        Only the last TAIL_LINES lines of output are kept in memory, the lines which
+        are needed in full (e.g. the metrics of a report) must be picked with 'on_line'
+
+        Kwargs:
+            timeout: Wall-clock budget of the batch in seconds, after which the process is killed
+            log_path: File which receives the complete output of the batch as it is produced
+            on_line: Function called with each line of output as soon as it is read
+
+        Raises WorkerCrashed if the tool exits during the batch (WorkerTimeout if it
+        was killed because of the budget), in which case the worker is restarted on
+        the next call
+        """
+        with self.lock:
+            if not self.alive():
+                self.stop()
+                self.start()
+
+            expired = threading.Event()
+
+            def expire():
+                expired.set()
+                self.kill()
+
+            timer = threading.Timer(timeout, expire) if timeout is not None else None
+            if timer is not None:
+                timer.start()
+
+            try:
+                with profiling.span(f"{self.name}.run"):
+                    return self._exchange(script, log_path, on_line)
+            except WorkerCrashed as e:
+                self.stop()
+                if expired.is_set():
+                    raise WorkerTimeout(f"{self.command[0]} exceeded its time budget of {timeout} s",
+                                        e.output, e.failed)
+                raise
+            finally:
+                if timer is not None:
+                    timer.cancel()
+
+    def _exchange(self, script, log_path=None, on_line=None):
+        """Send a batch to the process and read its output until the marker
+
+        Returns the tail of the output and whether a line of it reported an error
+        """
+        marker = f"AUTOPPA_DONE_{uuid.uuid4().hex}"
+
+        if self.debug:
+            print(script)
+
+        try:
+            self.process.stdin.write(self.wrap(script, marker) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            raise WorkerCrashed(f"{self.command[0]} exited unexpectedly")
+
+        output = collections.deque(maxlen=TAIL_LINES)
+        omitted = 0
+        failed = False
+        log = open(log_path, "w") if log_path else None
+
+        def text():
+            if not omitted:
+                return "".join(output)
+            return f"[... {omitted} lines omitted, see {log_path or 'the log file'}]\n" + "".join(output)
+
+        try:
+            for line in self.process.stdout:
+                if line.rstrip().endswith(marker):
+                    return text(), failed
+
+                if len(output) == output.maxlen:
+                    omitted += 1
+                output.append(line)
+
+                # the error may be far from the end of a long output
+                failed = failed or self.reported_error(line)
+
+                if on_line is not None:
+                    on_line(line)
+                if log is not None:
+                    log.write(line)
+        finally:
+            if log is not None:
+                log.close()
+
+        raise WorkerCrashed(f"{self.command[0]} exited unexpectedly", text(), failed)
+
+
+class ProcessLocal:
+    """Lazily created object which is never shared with child processes
+
+    Process pools fork the parent, and a forked child must not talk to the
+    pipes of its parent's tool process, so each process creates its own
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.pid = None
+        self.value = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.value is None or self.pid != os.getpid():
+                self.value = self.factory()
+                self.pid = os.getpid()
+
+            return self.value
@@ -1,15 +1,23 @@
-read_liberty autoppa/benchmark/sky130hd_tt.lib
-read_verilog autoppa/build/synth/synth_{MODULE_NAME}.v
+# benchmark/sky130hd_tt.lib is read once when the OpenSTA worker starts (see autoppa/power.py)
+read_verilog {NETLIST}
 link_design {MODULE_NAME}
 
-# Define the clock domain
-create_clock -name clk -period 10 {clk}
+# Define the clock domain (the period of the testbench clock)
+create_clock -name clk -period {CLOCK_PERIOD} {clk}
 
 # (Optional) Specify input/output delays relative to the clock
 # set_input_delay 0.5 -clock clk [all_inputs]
 # set_output_delay 0.5 -clock clk [all_outputs]
 
 # Load switching activity from simulation
-read_vcd autoppa/build/task{TASK_NUM}/{MODULE_NAME}.vcd -scope task{TASK_NUM}_tb
+# (read_vcd, or read_saif of a SAIF converted from the VCD, see autoppa/power.py)
+{READ_ACTIVITY} -scope task{TASK_NUM}_tb
 report_power
-report_power > autoppa/build/task{TASK_NUM}/{MODULE_NAME}.rpt
\ No newline at end of file
+report_power > {REPORT}
+
+# Timing of the same loaded design: the critical path and the worst setup slack,
+# from which autoppa/power.py computes the max frequency
+report_checks -path_delay max -digits 4
+report_checks -path_delay max -digits 4 >> {REPORT}
+report_worst_slack -max -digits 4
+report_worst_slack -max -digits 4 >> {REPORT}
@@ -50,22 +50,62 @@ module task2_tb;
     initial any_failures = 0;
 
 
+    // the operations can be split across several simulations with +SHARD=i +NSHARDS=n, in which
+    // case this one only runs the operations i, i+n, i+2n... (autoppa/sim.py sums the TIME of each)
+    integer shard;
+    integer nshards;
+    integer op_index;
+
+    initial begin
+        op_index = 0;
+        if (!$value$plusargs("SHARD=%d", shard))
+            shard = 0;
+        if (!$value$plusargs("NSHARDS=%d", nshards))
+            nshards = 1;
+    end
+
+
+    // the VCD path can be overridden with +VCD=<path> so that evaluations don't clobber each other
+    reg [8*256-1:0] vcd_file;
+
     initial begin
-        $dumpfile(`STRINGIFY("build/task2/%s.vcd", `DUT_NAME));
-        $dumpvars(0, task2_tb);
+        if (!$value$plusargs("VCD=%s", vcd_file))
+            vcd_file = `STRINGIFY("build/task2/%s.vcd", `DUT_NAME);
+        $dumpfile(vcd_file);
+        // only the nets at the DUT ports are dumped: OpenSTA annotates them on the top-level
+        // ports of the netlist (read_vcd -scope task2_tb) and propagates the activity inside
+        $dumpvars(0, clk, resetn, pcpi_valid, pcpi_insn, pcpi_rs1, pcpi_rs2,
+                  pcpi_wr, pcpi_rd, pcpi_wait, pcpi_ready);
+        // +DUMP_DUT also dumps the nets inside of the DUT (to analyze them with autoppa.activity),
+        // OpenSTA ignores them so the power is the same
+        if ($test$plusargs("DUMP_DUT"))
+            $dumpvars(0, dut);
         #1000000; // 1,000,000 ns = 1 ms, adjust as needed
         $display("TIMEOUT: Simulation FAILED due to exceeded maximum time");
         $finish;
     end
 
     //----------------------------------------------------------
-    // Helper task
+    // Helper tasks
     //----------------------------------------------------------
     task do_op(
         input [31:0] rs1,
         input [31:0] rs2,
         input [2:0] funct3,
         input [127:0] name
+    );
+    begin
+        if (op_index % nshards == shard)
+            run_op(rs1, rs2, funct3, name);
+        op_index = op_index + 1;
+    end
+    endtask
+
+    task run_op(
+        input [31:0] rs1,
+        input [31:0] rs2,
+        input [2:0] funct3,
+        input [127:0] name
     );
         reg [63:0] expected;
         reg passed;
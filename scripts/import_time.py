@@ -0,0 +1,71 @@
+"""Import-time regression check of the autoppa CLI
+
+The CLI is called many times by scripts, so its startup must stay cheap: this
+imports autoppa.main with 'python -X importtime' and fails if the cumulative
+import time is over the budget, or if a module of the agent stack is imported.
+
+    python scripts/import_time.py [--budget MS] [--runs N]
+"""
+import argparse
+import subprocess
+import sys
+
+# modules which must only be imported by the agent step
+FORBIDDEN = ["openai", "tiktoken", "dotenv", "streamlit"]
+
+
+def import_times(module):
+    """Cumulative import time (us) of each module imported by 'import module'"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            stderr=subprocess.PIPE, encoding="utf-8", check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the autoppa CLI")
+    parser.add_argument("--budget",
+                        type=float,
+                        default=100,
+                        help="Maximum import time of autoppa.main in milliseconds")
+    parser.add_argument("--runs",
+                        type=int,
+                        default=5,
+                        help="Number of imports, the fastest one is compared with the budget")
+    parser.add_argument("--module",
+                        default="autoppa.main",
+                        help="Module to import")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    best = min(times[args.module] for times in runs) / 1000
+
+    print(f"{args.module}: {best:.1f} ms (budget {args.budget:.0f} ms)")
+
+    failed = False
+
+    if best > args.budget:
+        slowest = sorted(runs[0].items(), key=lambda item: item[1], reverse=True)[1:11]
+        print("Slowest imports:")
+        for name, cumulative in slowest:
+            print(f"  {name:<40} {cumulative / 1000:.1f} ms")
+        failed = True
+
+    forbidden = [name for name in runs[0]
+                 if name.split(".")[0] in FORBIDDEN]
+    if forbidden:
+        print(f"Modules of the agent stack are imported at startup: {', '.join(sorted(forbidden))}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
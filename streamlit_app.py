@@ -1,16 +1,14 @@
 import streamlit as st
-from autoppa.agent import Agent, Role, Message
+from autoppa.agent import Role
+from autoppa.jobs import JobServer, QueueFull
 import time
 import json
 
 
-@st.cache_resource(show_spinner="Initializing AI agent...")
-def init_agent(task_num, system_prompt=None, max_context_len=100000):
-    agent = Agent(task_num,
-                  system_prompt=system_prompt,
-                  max_context_len=max_context_len)
-    
-    return agent
+@st.cache_resource(show_spinner="Starting the agent workers...")
+def job_server():
+    # shared by all the sessions, each run gets its own agent in a worker process
+    return JobServer()
 
 def role_to_emoji(role):
     if role == Role.SYSTEM:
@@ -30,72 +28,142 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 
 
+# the last messages of the history are shown in full, older ones are collapsed
+# and only rendered when they are expanded
+RECENT_MESSAGES = 4
+
+# streamed LLM output is re-rendered at most this often (seconds) ...
+RENDER_INTERVAL = 0.1
+
+# ... or every this many deltas, whichever comes first
+RENDER_DELTAS = 50
+
+
+def render(role, content):
+    with st.container(height=500):
+        if role == Role.ASSISTANT:
+            st.code(content, language="verilog", wrap_lines=True)
+        else:
+            st.text(content)
+
+
 # --- Display chat history ---
-for message in st.session_state.messages:
+history = st.session_state.messages
+for i, message in enumerate(history):
     with st.chat_message(message["role"].value,
                          avatar=role_to_emoji(message["role"])):
         
-        with st.container(height=500):
-            if message["role"] == Role.ASSISTANT:
-                st.code(message["content"], language="verilog", wrap_lines=True)
-            else:
-                st.text(message["content"])
+        if i >= len(history) - RECENT_MESSAGES:
+            render(message["role"], message["content"])
+            continue
+        
+        # a collapsed message costs one line until it is expanded
+        first_line = message["content"].strip().split("\n", 1)[0]
+        if st.toggle(f"{first_line[:80]} ({len(message['content'])} characters)", key=f"expand-{i}"):
+            render(message["role"], message["content"])
 
 
 with open('benchmark/metadata.json') as f:
     task_info = json.load(f)
 
+server = job_server()
+
 with st.sidebar:
-    run_agent = st.button("Run Agent")
+    run_agent = st.button("Run Agent", disabled="job_id" in st.session_state)
+    stop_agent = st.button("Stop Agent", disabled="job_id" not in st.session_state)
     task_num = st.number_input("Task number", min_value=1, max_value=5, value=1)
+    max_iters = st.number_input("Iterations", min_value=1, max_value=50, value=5)
+    st.caption(f"{server.pending()} agent runs queued or running")
     st.write(task_info[task_num-1])
-    
 
-agent = init_agent(task_num)
 
 # --- Trigger button ---
 if run_agent:
-    new_messages = []
+    try:
+        st.session_state.job_id = server.submit(task_num, max_iters=max_iters).id
+    except QueueFull as e:
+        st.warning(str(e))
+    else:
+        # the buttons were rendered before the job existed, so that Stop is enabled during the run
+        st.rerun()
+
+job = server.get(st.session_state.get("job_id"))
+
+if stop_agent and job is not None:
+    # the run stops after its current iteration, its messages are still shown
+    job.cancel()
+
+if job is None:
+    st.session_state.pop("job_id", None)
+    
+else:
+    if job.status == "queued":
+        st.info("Waiting for a free agent worker...")
     
+    new_messages = []
+
     chat = None
     current_role = None
-    buffer = ""
-    
-    # Stream results
-    for message in agent(): 
-    # for message in dummy(): 
+    buffer = []
+
+    # time and number of deltas since the streamed output was last rendered
+    last_render = 0.0
+    pending = 0
+
+    def flush():
+        """Record the message of the role which just finished"""
+        if current_role is not None:
+            new_messages.append({"role": current_role,
+                                 "content": "".join(buffer)})
+
+    # Stream results (the page of a session which reloads during a run shows the run again from the start)
+    for message in job.stream(): 
 
         if message.role != current_role:
-            if current_role != None:
-                # Record each message for later
-                new_messages.append({"role": current_role,
-                                    "content": buffer}) 
-            
+            if current_role == Role.ASSISTANT:
+                # the last deltas which weren't rendered yet
+                chat.code("".join(buffer), language="verilog", wrap_lines=True)
+        
+            # Record each message for later
+            flush()
+        
             current_role = message.role 
-            
-            # empty otherwise we will create new chatboxes everytime
+        
             chat = st.chat_message(current_role.value, avatar=role_to_emoji(current_role))
-            chat = chat.empty()
-            buffer = ""
-            
-
-        buffer += message.content
+            chat = chat.container(height=500)
+        
+            # the streamed code is re-rendered in place, the tool output is appended
+            if current_role == Role.ASSISTANT:
+                chat = chat.empty()
         
-        with chat:
+            buffer = []
+            last_render = 0.0
+            pending = 0
+        
+        buffer.append(message.content)
+    
+        if current_role == Role.ASSISTANT:
+            # re-rendering the whole design for every delta is quadratic, so updates are throttled
+            pending += 1
+            now = time.monotonic()
+            if now - last_render >= RENDER_INTERVAL or pending >= RENDER_DELTAS:
+                chat.code("".join(buffer), language="verilog", wrap_lines=True)
+                last_render = now
+                pending = 0
+        else:
+            chat.text(message.content)
             
-            with st.container(height=500):
-                if current_role == Role.ASSISTANT:
-                    st.code(buffer, language="verilog", height=500, wrap_lines=True)
-                else:
-                    st.text(buffer)
-                
     # last role 
-    new_messages.append({"role": current_role,
-                         "content": buffer})  
+    if current_role == Role.ASSISTANT:
+        chat.code("".join(buffer), language="verilog", wrap_lines=True)
+    flush()
 
 
+    if job.status == "failed":
+        st.error(f"The agent run failed: {job.future.exception()}")
+
     # Once streaming finishes, persist the conversation
     st.session_state.messages.extend(new_messages)
     
-
-
+    server.forget(job.id)
+    del st.session_state.job_id
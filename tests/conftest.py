@@ -0,0 +1,18 @@
+import pytest
+
+from autoppa.results import Evaluation, PowerResult, SimResult, SynthResult
+
+
+@pytest.fixture(autouse=True)
+def build_dir(tmp_path, monkeypatch):
+    """Run each test in an empty directory, since the build/ paths of autoppa are relative"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def make_evaluation(design_hash, performance, area, power, *, task=1, fmax=None):
+    """Evaluation which passed every stage with these metrics"""
+    return Evaluation(task=task, design_hash=design_hash,
+                      results={"sim": SimResult(passed=True, metric=performance),
+                               "synth": SynthResult(passed=True, metric=area),
+                               "power": PowerResult(passed=True, metric=power, fmax=fmax, clock_period=10)})
@@ -0,0 +1,97 @@
+import pytest
+
+from autoppa.activity import analyze, merge, read_summary, write_summary
+
+# clk rises at 5 and 15, d[0] toggles once, g toggles three times within one clock period
+VCD = """$timescale 1ns $end
+$scope module tb $end
+$var wire 1 ! clk $end
+$var wire 2 " d [1:0] $end
+$var wire 1 # g $end
+$upscope $end
+$enddefinitions $end
+#0
+0!
+b0 "
+0#
+#5
+1!
+#6
+1#
+#7
+0#
+#8
+1#
+#10
+0!
+b1 "
+#15
+1!
+#20
+0!
+"""
+
+
+def write_vcd(path="sim.vcd", content=VCD):
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+def test_analyze():
+    report = analyze(write_vcd())
+
+    assert report.timescale == (1, "ns")
+    assert report.duration == 20
+    assert report.clock_cycles == 2
+
+    clk = report.signals[("tb", "clk")]
+    assert (clk.t0, clk.t1, clk.tc) == (10, 10, 4)
+
+    d0, d1 = report.signals[("tb", "d[0]")], report.signals[("tb", "d[1]")]
+    assert (d0.t0, d0.t1, d0.tc) == (10, 10, 1)
+    assert (d1.t0, d1.t1, d1.tc) == (20, 0, 0)
+    assert d0.static_probability == 0.5
+
+    g = report.signals[("tb", "g")]
+    assert (g.t0, g.t1, g.tc, g.glitches) == (7, 13, 3, 2)
+
+    assert report.toggles == 8
+    assert report.glitches == 2
+    assert report.score() == 4.0
+    assert report.top(1)[0][0] == ("tb", "clk")
+
+
+def test_analyze_empty_file():
+    report = analyze(write_vcd(content=""))
+
+    assert report.signals == {}
+    assert report.duration == 0
+
+
+def test_summary_round_trip():
+    report = analyze(write_vcd())
+
+    write_summary(report, "activity.bin")
+
+    assert read_summary("activity.bin") == report
+
+
+def test_merge_adds_up():
+    report = analyze(write_vcd())
+
+    merged = merge([report, analyze(write_vcd())])
+
+    assert merged.duration == 2 * report.duration
+    assert merged.clock_cycles == 2 * report.clock_cycles
+    for name, activity in report.signals.items():
+        total = merged.signals[name]
+        assert (total.t0, total.t1, total.tx, total.tc, total.glitches) == \
+            (2 * activity.t0, 2 * activity.t1, 2 * activity.tx, 2 * activity.tc, 2 * activity.glitches)
+
+
+def test_merge_rejects_different_timescales():
+    ps = write_vcd("ps.vcd", VCD.replace("1ns", "1ps"))
+
+    with pytest.raises(ValueError):
+        merge([analyze(write_vcd()), analyze(ps)])
@@ -0,0 +1,69 @@
+import os
+
+from autoppa import artifacts
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_put_moves_the_files_into_the_store():
+    write("work/m.vcd", "#0")
+    write("work/m.sim.log", "PASSED")
+
+    path = artifacts.put("h" * 64, "sim", "k" * 64, {"sim.vcd": "work/m.vcd", "sim.log": "work/m.sim.log"})
+
+    assert artifacts.get("h" * 64, "sim", "k" * 64) == path
+    assert sorted(os.listdir(path)) == ["sim.log", "sim.vcd"]
+    assert os.listdir("work") == []
+
+    with open(os.path.join(path, "sim.log")) as f:
+        assert f.read() == "PASSED"
+
+
+def test_get_missing():
+    assert artifacts.get("h" * 64, "synth", "k" * 64) is None
+
+
+def test_put_keeps_the_artifact_stored_first():
+    write("a/netlist.v", "first")
+    write("b/netlist.v", "second")
+
+    path = artifacts.put("h" * 64, "synth", "k" * 64, {"netlist.v": "a/netlist.v"})
+    artifacts.put("h" * 64, "synth", "k" * 64, {"netlist.v": "b/netlist.v"})
+
+    with open(os.path.join(path, "netlist.v")) as f:
+        assert f.read() == "first"
+    assert not any(name.endswith(".tmp") for name in os.listdir(os.path.dirname(path)))
+
+
+def test_evict_least_recently_used(monkeypatch):
+    paths = []
+    for i in range(3):
+        write(f"work/{i}.v", "x" * 100)
+        paths.append(artifacts.put(f"design{i}", "synth", "k" * 64, {"netlist.v": f"work/{i}.v"}))
+        os.utime(paths[-1], (i, i))
+
+    # a lookup marks the artifact as used
+    artifacts.get("design0", "synth", "k" * 64)
+
+    artifacts.evict(max_bytes=250)
+
+    assert artifacts.get("design1", "synth", "k" * 64) is None
+    assert artifacts.get("design0", "synth", "k" * 64) is not None
+    assert artifacts.get("design2", "synth", "k" * 64) is not None
+
+    # the directory of a design goes along with its last artifact
+    assert not os.path.exists(os.path.dirname(paths[1]))
+
+
+def test_clear():
+    write("work/m.v", "x")
+    artifacts.put("h" * 64, "synth", "k" * 64, {"netlist.v": "work/m.v"})
+
+    artifacts.clear()
+
+    assert artifacts.get("h" * 64, "synth", "k" * 64) is None
+
@@ -0,0 +1,54 @@
+import csv
+import json
+import os
+
+import pytest
+
+from autoppa.benchmark import COLUMNS, PROXY_METRICS, _ranks, benchmark_cell, spearman, write_table
+
+
+def test_missing_design():
+    os.makedirs("benchmark")
+    with open("benchmark/metadata.json", "w") as f:
+        json.dump([{"metric": "performance", "baseline": "3100"}], f)
+
+    row = benchmark_cell(1, "baseline/mine/")
+
+    assert row["status"] == "missing"
+    assert row["baseline"] == "mine"
+    assert row["reference"] == 3100.0
+    assert list(row) == COLUMNS
+
+
+def test_write_table():
+    rows = [dict.fromkeys(COLUMNS) | {"task": 1, "status": "passed", "delta_pct": -2.5}]
+
+    write_table(rows, fmt="csv", file="matrix.csv")
+    write_table(rows, fmt="json", file="matrix.json")
+
+    with open("matrix.csv", newline="") as f:
+        assert list(csv.DictReader(f)) == [{column: str(value) if value is not None else ""
+                                            for column, value in rows[0].items()}]
+    with open("matrix.json") as f:
+        assert json.load(f) == rows
+
+
+def test_ranks_average_ties():
+    assert _ranks([30, 10, 20]) == [3.0, 1.0, 2.0]
+    assert _ranks([5, 1, 5, 5]) == [3.0, 1.0, 3.0, 3.0]
+    assert _ranks([]) == []
+
+
+def test_spearman():
+    assert spearman([1, 2, 3, 4], [10, 20, 30, 40]) == pytest.approx(1.0)
+    assert spearman([1, 2, 3, 4], [4, 3, 2, 1]) == pytest.approx(-1.0)
+    assert spearman([1, 2, 3, 4, 5], [2, 1, 4, 3, 5]) == pytest.approx(0.8)
+
+
+def test_spearman_undefined():
+    assert spearman([1], [1]) is None
+    assert spearman([1, 1, 1], [1, 2, 3]) is None
+
+
+def test_fidelity_report_only_covers_stand_in_metrics():
+    assert PROXY_METRICS == ["power"]
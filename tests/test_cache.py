@@ -0,0 +1,128 @@
+import os
+
+from autoppa import cache
+from autoppa.results import SimResult
+
+
+def test_cache_key_ignores_comments_and_whitespace():
+    code = "module m(input a, output b);\n  assign b = a; // copy\nendmodule\n"
+    cosmetic = "module m(input a,   output b);\n/* copy */ assign b = a;\nendmodule"
+
+    assert cache.cache_key("sim", code) == cache.cache_key("sim", cosmetic)
+    assert cache.cache_key("sim", code) != cache.cache_key("synth", code)
+    assert cache.cache_key("sim", code) != cache.cache_key("sim", code, extra=["verilator"])
+
+
+def test_cache_key_depends_on_input_files():
+    code = "module m; endmodule"
+    with open("tb.v", "w") as f:
+        f.write("module tb; endmodule")
+    before = cache.cache_key("sim", code, files=["tb.v"])
+
+    with open("tb.v", "w") as f:
+        f.write("module tb; initial $finish; endmodule")
+    after = cache.cache_key("sim", code, files=["tb.v"])
+
+    assert before != after
+    assert cache.cache_key("sim", code, files=["missing.v"]) != before
+
+
+def test_put_then_get():
+    key = cache.cache_key("sim", "module m; endmodule")
+
+    assert cache.get(key) is None
+
+    cache.put(key, {"passed": True}, stage="sim")
+
+    assert cache.get(key) == {"passed": True}
+
+
+def test_evict_removes_least_recently_used():
+    keys = [cache.cache_key("sim", f"module m{i}; endmodule") for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, {"i": i})
+        os.utime(cache._entry_path(key), (i, i))
+
+    # reading an entry makes it the most recently used
+    cache.get(keys[0])
+
+    size = os.path.getsize(cache._entry_path(keys[0]))
+    cache.evict(max_bytes=2 * size)
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == {"i": 0}
+    assert cache.get(keys[2]) == {"i": 2}
+
+
+def test_clear():
+    key = cache.cache_key("sim", "module m; endmodule")
+    cache.put(key, {"passed": True})
+
+    cache.clear()
+
+    assert cache.get(key) is None
+
+
+class Counter:
+    def __init__(self, **result):
+        self.calls = 0
+        self.result = result
+
+    def __call__(self):
+        self.calls += 1
+        return SimResult(**self.result)
+
+
+def test_cached_stage_hit():
+    key = cache.cache_key("sim", "module m; endmodule")
+    run = Counter(passed=True, metric=3100.0)
+
+    span = {}
+    first = cache.cached_stage(key, "sim", run, span=span)
+    assert not first.cached and "cached" not in span
+
+    second = cache.cached_stage(key, "sim", run, span=span)
+    assert run.calls == 1
+    assert second.cached and span["cached"]
+    assert second.metric == 3100.0
+
+
+def test_cached_stage_without_cache_still_stores():
+    key = cache.cache_key("sim", "module m; endmodule")
+    run = Counter(passed=True, metric=1.0)
+
+    cache.cached_stage(key, "sim", run, span={}, use_cache=False)
+    cache.cached_stage(key, "sim", run, span={}, use_cache=False)
+
+    assert run.calls == 2
+    assert cache.get(key) is not None
+
+
+def test_cached_stage_doesnt_store_timeouts_and_crashes():
+    for result in ({"timed_out": True}, {"crashed": True}):
+        key = cache.cache_key("sim", f"module m; endmodule // {result}", extra=[result])
+        run = Counter(passed=False, error="stopped", **result)
+
+        cache.cached_stage(key, "sim", run, span={})
+        cache.cached_stage(key, "sim", run, span={})
+
+        assert run.calls == 2
+        assert cache.get(key) is None
+
+
+def test_cached_stage_reuse():
+    key = cache.cache_key("sim", "module m; endmodule")
+    run = Counter(passed=True, metric=1.0, log_path="build/runs/gone/m.sim.log")
+    cache.cached_stage(key, "sim", run, span={})
+
+    # the files of the stored result are gone: the stage runs again
+    cache.cached_stage(key, "sim", run, span={}, reuse=lambda result: None)
+    assert run.calls == 2
+
+    def reuse(result):
+        result.log_path = "build/artifacts/m/sim.log"
+        return result
+
+    result = cache.cached_stage(key, "sim", run, span={}, reuse=reuse)
+    assert run.calls == 2
+    assert result.cached and result.log_path == "build/artifacts/m/sim.log"
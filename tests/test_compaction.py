@@ -0,0 +1,60 @@
+from autoppa.compaction import Compactor, clip_log, feedback, summarize
+from autoppa.results import Evaluation, SimResult
+
+from conftest import make_evaluation
+
+
+def test_clip_log_keeps_relevant_lines_once():
+    log = "\n".join(["compiling...", "task1.v:3: syntax error", "task1.v:3: syntax error",
+                     "Warning: unused wire", "done"])
+
+    assert clip_log(log) == "task1.v:3: syntax error [repeated 2 times]\nWarning: unused wire"
+
+
+def test_clip_log_without_relevant_lines_keeps_the_end():
+    log = "\n".join(f"line {i}" for i in range(10))
+
+    assert clip_log(log, max_lines=3) == "line 7\nline 8\nline 9"
+
+
+def test_clip_log_caps_the_diagnostics():
+    log = "\n".join(f"error {i}" for i in range(5))
+
+    assert clip_log(log, max_lines=2) == "error 0\nerror 1\n[... 3 more diagnostics omitted]"
+
+
+def test_feedback_and_summarize():
+    failed = SimResult(passed=False, error="Simulation failed:", output="ok\nFAILED test 3")
+    evaluation = Evaluation(task=1, design_hash="a" * 64, results={"sim": failed})
+
+    assert feedback(failed) == "Simulation failed:\nFAILED test 3"
+    assert summarize(evaluation) == "failed at sim: Simulation failed:"
+    assert summarize(make_evaluation("b" * 64, 3100.0, 7147.0, 0.5)) == \
+        "performance 3100 ns, area 7147 cells, power 0.5 mW"
+
+
+class FakeModel:
+    def __init__(self):
+        self.rewritten = {}
+
+    def rewrite(self, entry, message):
+        self.rewritten[entry] = message
+
+
+def test_compactor_keeps_the_best_and_the_latest_design():
+    model = FakeModel()
+    compactor = Compactor(model)
+
+    for i, design_hash in enumerate(["a" * 64, "b" * 64, "c" * 64]):
+        compactor.add_design(f"design{i}", make_evaluation(design_hash, 1.0, 1.0, 1.0))
+        compactor.add_feedback(f"feedback{i}", f"summary {i}")
+
+    compactor.compact(best_hash="a" * 64)
+
+    assert set(model.rewritten) == {"design1", "feedback0", "feedback1"}
+    assert model.rewritten["design1"].startswith("[Earlier design bbbbbbbbbbbb removed to save space:")
+    assert model.rewritten["feedback0"] == "[Earlier tool feedback removed to save space: summary 0]"
+
+    # what was kept can be compacted at the next iteration
+    assert [entry for entry, _, _ in compactor.designs] == ["design0", "design2"]
+    assert [entry for entry, _ in compactor.feedback] == ["feedback2"]
@@ -0,0 +1,57 @@
+import asyncio
+
+from autoppa.engine import KeepGoing, QueuePolicy, find_module_end, iterate
+
+
+def test_find_module_end():
+    text = "module a(); endmodule\nmodule b(); endmodule"
+
+    assert text[:find_module_end(text)] == "module a(); endmodule"
+
+    # not a complete keyword yet, or part of another identifier
+    assert find_module_end("module a(); endmod") is None
+    assert find_module_end("wire endmodule_x;") is None
+
+
+def test_iterate():
+    closed = []
+
+    async def numbers():
+        try:
+            for i in range(3):
+                await asyncio.sleep(0)
+                yield i
+        finally:
+            closed.append(True)
+
+    assert list(iterate(numbers())) == [0, 1, 2]
+    assert closed == [True]
+
+
+def test_iterate_closes_generator_when_stopped_early():
+    closed = []
+
+    async def forever():
+        try:
+            while True:
+                yield None
+        finally:
+            closed.append(True)
+
+    for _ in iterate(forever()):
+        break
+
+    assert closed == [True]
+
+
+def test_keep_going():
+    assert asyncio.run(KeepGoing()(None, 0, None))
+
+
+def test_queue_policy():
+    async def decide():
+        policy = QueuePolicy()
+        policy.decisions.put_nowait(False)
+        return await policy(None, 0, None)
+
+    assert asyncio.run(decide()) is False
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+
+import pytest
+
+from autoppa.engine import KeepGoing
+from autoppa.jobs import CancelPolicy, JobServer, QueueFull
+
+
+@pytest.fixture
+def server():
+    # no worker, so that the jobs stay queued (and no agent is ever started)
+    server = JobServer(max_workers=0, max_queued=2)
+    yield server
+    server.shutdown()
+
+
+def test_queue_full(server):
+    first = server.submit(1)
+    server.submit(2)
+
+    assert first.status == "queued"
+    assert server.pending() == 2
+
+    with pytest.raises(QueueFull):
+        server.submit(3)
+
+
+def test_cancel_queued_job(server):
+    job = server.submit(1)
+    server.submit(2)
+
+    job.cancel()
+
+    assert job.status == "cancelled"
+    assert job.cancelled.is_set()
+
+    # the stream of a job which never started ends
+    assert list(job.stream()) == []
+
+    # its place in the queue is free again
+    server.submit(3)
+
+    server.forget(job.id)
+    assert server.get(job.id) is None
+
+
+def test_cancel_policy():
+    cancelled = threading.Event()
+    policy = CancelPolicy(cancelled, KeepGoing())
+
+    assert asyncio.run(policy(None, 0, None))
+
+    cancelled.set()
+    assert not asyncio.run(policy(None, 1, None))
@@ -0,0 +1,70 @@
+import os
+
+from autoppa import cache, ledger
+from autoppa.results import Evaluation, SimResult
+
+from conftest import make_evaluation
+
+
+def test_record():
+    evaluation = make_evaluation("a" * 64, 3100.0, 7147.0, 0.5, fmax=100.0)
+
+    record = ledger.record(evaluation, iteration=2)
+
+    assert record["task"] == 1
+    assert record["iteration"] == 2
+    assert record["stages"]["sim"]["metric"] == 3100.0
+    assert record["stages"]["power"]["fmax"] == 100.0
+    assert "output" not in record["stages"]["sim"]
+
+
+def test_lookup_by_task_and_design():
+    ledger.append(make_evaluation("a" * 64, 1.0, 1.0, 1.0, task=1))
+    ledger.append(make_evaluation("b" * 64, 2.0, 2.0, 2.0, task=2))
+    ledger.append(make_evaluation("a" * 64, 3.0, 3.0, 3.0, task=2))
+
+    assert [r["stages"]["sim"]["metric"] for r in ledger.lookup(task=2)] == [2.0, 3.0]
+    assert [r["stages"]["sim"]["metric"] for r in ledger.lookup(design_hash="a" * 64)] == [1.0, 3.0]
+    assert [r["stages"]["sim"]["metric"] for r in ledger.lookup(task=2, design_hash="a" * 64)] == [3.0]
+    assert len(ledger.lookup()) == 3
+    assert ledger.lookup(task=5) == []
+
+
+def test_index_is_updated_incrementally():
+    ledger.append(make_evaluation("a" * 64, 1.0, 1.0, 1.0))
+    assert len(ledger.lookup(task=1)) == 1
+
+    ledger.append(Evaluation(task=1, design_hash="b" * 64,
+                             results={"sim": SimResult(passed=False, error="FAILED")}))
+    records = ledger.lookup(task=1)
+
+    assert len(records) == 2
+    assert records[1]["stages"]["sim"]["passed"] is False
+
+
+def test_recreated_ledger_is_reindexed():
+    ledger.append(make_evaluation("a" * 64, 1.0, 1.0, 1.0))
+    ledger.append(make_evaluation("b" * 64, 1.0, 1.0, 1.0))
+    ledger.lookup()
+
+    os.remove(ledger.LEDGER_PATH)
+    ledger.append(make_evaluation("c" * 64, 1.0, 1.0, 1.0))
+
+    assert [r["design_hash"] for r in ledger.lookup()] == ["c" * 64]
+
+
+def test_lookup_without_ledger():
+    assert ledger.lookup(task=1) == []
+
+
+def test_cache_hit_is_recorded_with_the_time_of_the_lookup():
+    key = cache.cache_key("sim", "module m; endmodule")
+    cache.put(key, SimResult(passed=True, metric=3100.0, wall_time=42.0).to_dict(), stage="sim")
+
+    result = cache.cached_stage(key, "sim", lambda: None, span={})
+    evaluation = Evaluation(task=1, design_hash="a" * 64, results={"sim": result})
+
+    stage = ledger.record(evaluation)["stages"]["sim"]
+
+    assert stage["cached"] is True
+    assert stage["wall_time"] < 1.0
@@ -0,0 +1,82 @@
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+from autoppa.agent import LLM
+
+
+class WordEncoding:
+    """Stand-in for the tiktoken encoding: one token per word"""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+def make_llm(max_context_len):
+    llm = LLM(system_prompt="you are helpful", max_context_len=max_context_len)
+    llm._enc = WordEncoding()
+    return llm
+
+
+def test_context_counts_tokens_per_message():
+    llm = make_llm(100)
+
+    llm.add_to_context("a b c")
+    llm.add_to_context("d e", "assistant")
+    llm.add_to_context("f", "assistant", tokens=10)
+
+    assert llm.curr_context_len == 3 + 3 + 2 + 10
+    assert [m["role"] for m in llm.messages] == ["system", "user", "assistant", "assistant"]
+
+
+def test_oldest_turns_are_dropped_whole():
+    llm = make_llm(12)
+
+    llm.add_to_context("one two three")
+    llm.add_to_context("four five", "assistant")
+    llm.add_to_context("six seven eight")
+    llm.add_to_context("nine ten eleven", "assistant")
+
+    assert llm.dropped_turns == 1
+    assert [m["content"] for m in llm.messages[1:]] == ["six seven eight", "nine ten eleven"]
+    assert llm.curr_context_len == 3 + 6
+
+
+def test_latest_turn_is_chopped_if_it_doesnt_fit():
+    llm = make_llm(8)
+
+    llm.add_to_context("1 2 3 4 5 6 7 8")
+
+    assert llm.messages[1]["content"] == "4 5 6 7 8"
+    assert llm.curr_context_len == 8
+
+
+def test_rewrite():
+    llm = make_llm(100)
+
+    entry = llm.add_to_context("a long design of many words")
+    llm.rewrite(entry, "summary")
+
+    assert llm.messages[1]["content"] == "summary"
+    assert llm.curr_context_len == 3 + 1
+
+
+def test_pinned_design_comes_back_once_its_turn_is_dropped():
+    llm = make_llm(16)
+
+    llm.add_to_context("make it faster")
+    llm.add_to_context("module best", "assistant")
+    llm.pin("module best")
+
+    assert llm.messages[1]["content"] == "make it faster"
+
+    llm.add_to_context("one two three four five six")
+    llm.add_to_context("seven eight nine", "assistant")
+
+    assert llm.dropped_turns == 1
+    assert llm.messages[1]["content"].startswith("CURRENT BEST DESIGN")
+    assert llm.curr_context_len <= 16
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+
+from autoppa.engine import StopCriteria
+from autoppa.pareto import ParetoFront
+from autoppa.results import Evaluation, SimResult
+
+from conftest import make_evaluation
+
+
+def test_front_keeps_non_dominated_designs():
+    front = ParetoFront()
+
+    assert front.add("a", make_evaluation("a" * 64, 100.0, 50.0, 1.0))
+    assert front.add("b", make_evaluation("b" * 64, 50.0, 100.0, 1.0))
+
+    # dominated by a
+    assert not front.add("c", make_evaluation("c" * 64, 100.0, 60.0, 1.0))
+
+    # dominates a
+    assert front.add("d", make_evaluation("d" * 64, 90.0, 50.0, 1.0))
+
+    assert sorted(candidate.design for candidate in front.candidates) == ["b", "d"]
+    assert front.best("performance").design == "b"
+    assert front.best("area").design == "d"
+
+
+def test_front_ignores_failed_and_repeated_designs():
+    front = ParetoFront()
+
+    failed = Evaluation(task=1, design_hash="a" * 64, results={"sim": SimResult(passed=False, error="FAILED")})
+    assert not front.add("a", failed)
+
+    assert front.add("b", make_evaluation("b" * 64, 1.0, 1.0, 1.0))
+    assert not front.add("b", make_evaluation("b" * 64, 1.0, 1.0, 1.0))
+
+    assert len(front) == 1
+    assert ParetoFront().best("power") is None
+
+
+def test_front_write():
+    front = ParetoFront()
+    front.add("module a; endmodule", make_evaluation("a" * 64, 100.0, 50.0, 1.0, fmax=200.0), iteration=1)
+    front.add("module b; endmodule", make_evaluation("b" * 64, 50.0, 100.0, 1.0), iteration=2)
+    front.write("front")
+
+    front.add("module c; endmodule", make_evaluation("c" * 64, 40.0, 40.0, 1.0), iteration=3)
+    front.write("front")
+
+    assert sorted(os.listdir("front")) == ["cccccccccccc.v", "front.json"]
+
+    with open("front/front.json") as f:
+        entries = json.load(f)
+    assert entries == [{"file": "cccccccccccc.v", "design_hash": "c" * 64, "iteration": 3,
+                        "performance": 40.0, "area": 40.0, "power": 1.0,
+                        "fmax": None, "time_at_fmax": None}]
+
+
+class FakeAgent:
+    def __init__(self):
+        self.improvements = []
+        self.used_tokens = 0
+
+    @property
+    def model(self):
+        return self
+
+    def improvement(self):
+        return self.improvements[-1] if self.improvements else None
+
+
+def decisions(policy, agent, improvements, tokens=0):
+    result = []
+    for i, improvement in enumerate(improvements):
+        agent.improvements.append(improvement)
+        agent.used_tokens += tokens
+        result.append(asyncio.run(policy(agent, i, None)))
+    return result
+
+
+def test_stop_at_target():
+    policy = StopCriteria(target=10)
+
+    assert decisions(policy, FakeAgent(), [None, 5.0, 12.0]) == [True, True, False]
+    assert policy.reason.startswith("target improvement reached")
+
+
+def test_stop_without_improvement():
+    policy = StopCriteria(patience=2)
+
+    assert decisions(policy, FakeAgent(), [1.0, 2.0, 2.0, 1.5]) == [True, True, True, False]
+    assert policy.reason == "no improvement in the last 2 iterations"
+
+
+def test_stop_at_token_budget():
+    policy = StopCriteria(token_budget=250)
+
+    assert decisions(policy, FakeAgent(), [1.0, 2.0, 3.0], tokens=100) == [True, True, False]
+    assert policy.reason.startswith("token budget reached")
+
+
+def test_stop_at_time_limit():
+    policy = StopCriteria(time_limit=0)
+
+    assert decisions(policy, FakeAgent(), [1.0]) == [False]
+
+
+def test_no_criteria_keeps_going():
+    assert decisions(StopCriteria(), FakeAgent(), [1.0, 1.0, 0.5]) == [True, True, True]
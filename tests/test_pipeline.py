@@ -0,0 +1,43 @@
+from autoppa.pipeline import not_promoted, rank, screen
+from autoppa.results import Evaluation, SimResult
+
+from conftest import make_evaluation
+
+
+def test_rank_by_task_metric():
+    evaluations = [make_evaluation("a" * 64, 10.0, 300.0, 3.0),
+                   make_evaluation("b" * 64, 20.0, 100.0, 1.0),
+                   make_evaluation("c" * 64, 30.0, 200.0, 2.0)]
+
+    assert rank(evaluations, "performance") == [0, 1, 2]
+    assert rank(evaluations, "area") == [1, 2, 0]
+    assert rank(evaluations, "power") == [1, 2, 0]
+
+
+def test_rank_puts_failed_designs_last():
+    failed = Evaluation(task=1, design_hash="f" * 64, results={"sim": SimResult(passed=False, error="FAILED")})
+    evaluations = [failed, make_evaluation("a" * 64, 20.0, 1.0, 1.0), make_evaluation("b" * 64, 10.0, 1.0, 1.0)]
+
+    assert rank(evaluations, "performance") == [2, 1, 0]
+
+
+def test_screen():
+    failed = Evaluation(task=5, design_hash="f" * 64, results={"sim": SimResult(passed=False, error="FAILED")})
+    evaluations = [make_evaluation("a" * 64, 10.0, 300.0, 3.0),
+                   failed,
+                   make_evaluation("b" * 64, 20.0, 100.0, 1.0),
+                   make_evaluation("c" * 64, 30.0, 200.0, 2.0)]
+
+    # power is screened on the cell count, and a failed design is never promoted
+    assert screen(evaluations, "power", 2) == [2, 3]
+    assert screen([failed], "power", 2) == []
+
+
+def test_not_promoted():
+    evaluation = Evaluation(task=5, design_hash="a" * 64, fidelity="fast",
+                            results={"sim": SimResult(passed=True, metric=1.0)})
+
+    not_promoted(evaluation, 2)
+
+    assert not evaluation.results["power"].passed
+    assert "best 2" in evaluation.results["power"].error
@@ -0,0 +1,97 @@
+import os
+
+from autoppa import artifacts, power
+from autoppa.results import PowerResult, SimResult, SynthResult
+from autoppa.sim import sim_key
+from autoppa.synth import synth_key
+from autoppa.utils import design_hash
+
+CODE = "module mul(input a, output b);\nassign b = a;\nendmodule\n"
+
+
+def store(stage, key, name):
+    os.makedirs("work", exist_ok=True)
+    with open(f"work/{name}", "w") as f:
+        f.write("")
+    artifacts.put(design_hash(CODE), stage, key, {name: f"work/{name}"})
+
+
+def test_resolve_inputs_from_the_store():
+    store("synth", synth_key(CODE), "netlist.v")
+    store("sim", sim_key(CODE, 1, "icarus", 1), "sim.vcd")
+
+    netlist, vcds = power.resolve_inputs(CODE)
+
+    assert netlist.endswith("netlist.v")
+    assert [os.path.basename(vcd) for vcd in vcds] == ["sim.vcd"]
+
+
+def test_resolve_inputs_reruns_without_cache_when_files_are_missing(monkeypatch):
+    calls = []
+
+    # a stored result whose files are gone, the run without the cache stores them again
+    def synth(code, *, use_cache, **kwargs):
+        calls.append(("synth", use_cache))
+        if not use_cache:
+            store("synth", synth_key(CODE), "netlist.v")
+        return SynthResult(passed=True, metric=1)
+
+    def sim(code, *, use_cache, **kwargs):
+        calls.append(("sim", use_cache))
+        if not use_cache:
+            store("sim", sim_key(CODE, 1, "icarus", 1), "sim.vcd")
+        return SimResult(passed=True, metric=1)
+
+    monkeypatch.setattr(power, "synth", synth)
+    monkeypatch.setattr(power, "sim", sim)
+
+    netlist, vcds = power.resolve_inputs(CODE)
+
+    assert calls == [("synth", True), ("synth", False), ("sim", True), ("sim", False)]
+    assert len(vcds) == 1
+
+
+def test_resolve_inputs_without_files(monkeypatch):
+    monkeypatch.setattr(power, "synth", lambda code, **kwargs: SynthResult(passed=True, metric=1))
+
+    result = power.resolve_inputs(CODE)
+
+    # not cached, since it says nothing about the design
+    assert isinstance(result, PowerResult)
+    assert not result.passed and result.crashed
+    assert "netlist" in result.error
+
+
+def test_resolve_inputs_after_failed_sim(monkeypatch):
+    store("synth", synth_key(CODE), "netlist.v")
+    monkeypatch.setattr(power, "sim", lambda code, **kwargs: SimResult(passed=False, error="FAILED"))
+
+    result = power.resolve_inputs(CODE)
+
+    assert not result.passed and not result.crashed
+    assert result.error == "Power analysis was skipped because simulation failed:"
+
+
+def test_extract_slack():
+    assert power.extract_slack("Startpoint: a\nworst slack -1.25\ntns 0") == -1.25
+    assert power.extract_slack("worst slack 3.5") == 3.5
+
+    # no constrained path: nothing printed, or an infinite slack
+    assert power.extract_slack("Total 1 2 3 4.0e-03 100%") is None
+    assert power.extract_slack("worst slack INF") is None
+    assert power.extract_slack("worst slack -inf") is None
+    assert power.extract_slack("worst slack n/a") is None
+
+
+def test_fmax():
+    assert power.fmax(0.0, period=10) == 100
+    assert power.fmax(5.0, period=10) == 200
+    assert power.fmax(-10.0, period=10) == 50
+
+    # no register to register path, or a slack larger than the period
+    assert power.fmax(None) is None
+    assert power.fmax(10.0, period=10) is None
+
+
+def test_extract_power():
+    assert power.extract_power("Group Internal Switching Leakage Total\nTotal 1e-3 2e-3 3e-6 3.5e-03 100.0%") == "3.5000"
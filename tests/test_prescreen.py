@@ -0,0 +1,97 @@
+import pytest
+
+from autoppa.prescreen import _width, check_interface, extract_ports
+
+REFERENCE = """
+module task1_ref #(parameter WIDTH = 32) (
+    input clk, resetn,
+    input [WIDTH-1:0] a,
+    input [31:0] b, // operand
+    output reg [63:0] product,
+    output ready
+);
+endmodule
+"""
+
+
+@pytest.mark.parametrize("range_, width", [
+    (None, 1),
+    ("31:0", 32),
+    ("0:7", 8),
+    (" 7 : 0 ", 8),
+    ("2*(3+1)-1:0", 8),
+    ("-1:0", 2),
+    ("WIDTH-1:0", "WIDTH-1:0"),
+    ("$clog2(N):0", "$clog2(N):0"),
+])
+def test_width(range_, width):
+    assert _width(range_) == width
+
+
+@pytest.mark.parametrize("range_", [
+    "9**9**9**9:0",
+    "2**8:0",
+    "__import__('os').getpid():0",
+    "1e3:0",
+    "99999999999*99999999999:0",
+    "(" * 500 + "1" + ")" * 500 + ":0",
+    "9" * 5000 + ":0",
+])
+def test_width_of_unsafe_or_huge_bounds_is_not_evaluated(range_):
+    assert _width(range_) == range_.replace(" ", "")
+
+
+def test_extract_ports_ansi():
+    ports = extract_ports(REFERENCE)
+
+    assert ports == {"clk": ("input", 1),
+                     "resetn": ("input", 1),
+                     "a": ("input", "WIDTH-1:0"),
+                     "b": ("input", 32),
+                     "product": ("output", 64),
+                     "ready": ("output", 1)}
+
+
+def test_extract_ports_non_ansi():
+    code = """
+    module task1_opt(clk, a, product);
+        input clk;
+        input [15:0] a;
+        output reg [31:0] product;
+    endmodule
+    """
+
+    assert extract_ports(code) == {"clk": ("input", 1),
+                                   "a": ("input", 16),
+                                   "product": ("output", 32)}
+
+
+def test_extract_ports_without_module():
+    with pytest.raises(Exception):
+        extract_ports("assign a = b;")
+
+
+def test_check_interface_matches():
+    design = REFERENCE.replace("task1_ref", "task1_opt").replace("// operand", "")
+
+    assert check_interface(design, REFERENCE) == []
+
+
+def test_check_interface_problems():
+    design = """
+    module task1_opt (
+        input clk, resetn,
+        input [WIDTH-1:0] a,
+        input [15:0] b,
+        input [63:0] product,
+        output done
+    );
+    endmodule
+    """
+
+    problems = check_interface(design, REFERENCE)
+
+    assert "Port 'b' should have a width of 32, not 16" in problems
+    assert "Port 'product' should be an output, not input" in problems
+    assert any(problem.startswith("Port 'ready' is missing") for problem in problems)
+    assert "Port 'done' is not part of the reference port list" in problems
@@ -0,0 +1,49 @@
+import re
+import sys
+import time
+
+from autoppa.process import TAIL_LINES, run_streamed
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_output_is_logged_and_tail_is_bounded():
+    result = run_streamed(python(f"for i in range({TAIL_LINES + 50}): print(i)"), "out.log")
+
+    assert result.returncode == 0
+    assert not result.timed_out and result.aborted is None
+
+    with open("out.log") as f:
+        assert f.read().splitlines() == [str(i) for i in range(TAIL_LINES + 50)]
+
+    lines = result.tail.splitlines()
+    assert lines[0] == "[... 50 lines omitted, see out.log]"
+    assert lines[1:] == [str(i) for i in range(50, TAIL_LINES + 50)]
+
+
+def test_short_output_is_kept_whole():
+    result = run_streamed(python("print('a'); print('b')"), "out.log")
+
+    assert result.tail == "a\nb\n"
+
+
+def test_budget_kills_the_process():
+    start = time.monotonic()
+    result = run_streamed(python("import time; print('start', flush=True); time.sleep(30)"), "out.log",
+                          budget=0.5)
+
+    assert result.timed_out
+    assert result.returncode != 0
+    assert result.tail == "start\n"
+    assert time.monotonic() - start < 10
+
+
+def test_abort_kills_the_process_on_the_first_match():
+    code = "import time\nprint('ok', flush=True)\nprint('ERROR: bad', flush=True)\ntime.sleep(30)\nprint('late')"
+    result = run_streamed(python(code), "out.log", abort=re.compile(r"^ERROR"))
+
+    assert result.aborted == "ERROR: bad"
+    assert not result.timed_out
+    assert "late" not in result.tail
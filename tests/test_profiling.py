@@ -0,0 +1,73 @@
+import pytest
+
+from autoppa import profiling
+
+
+@pytest.fixture
+def trace(monkeypatch):
+    monkeypatch.setattr(profiling, "TRACE_PATH", "trace.json")
+    monkeypatch.setattr(profiling, "ATTRIBUTES", {})
+    return "trace.json"
+
+
+def event(name, dur_ms, **args):
+    return {"name": name, "ph": "X", "dur": dur_ms * 1000, "args": args}
+
+
+def test_percentile():
+    assert profiling.percentile([], 50) is None
+    assert profiling.percentile([4], 95) == 4
+    assert profiling.percentile([1, 2, 3, 4], 50) == 2.5
+    assert profiling.percentile([1, 2, 3, 4], 100) == 4
+    assert profiling.percentile([0, 10], 95) == pytest.approx(9.5)
+
+
+def test_summarize():
+    events = [event("sim", 10, task=1, cached=True),
+              event("sim", 30, task=1),
+              event("synth", 100, task=2),
+              {"name": "meta", "ph": "M"}]
+
+    rows = profiling.summarize(events)
+
+    # the stage with the most total time first
+    assert [row["stage"] for row in rows] == ["synth", "sim"]
+    assert rows[1] == {"stage": "sim", "count": 2, "cached": 1, "p50_ms": 20.0, "p95_ms": 29.0,
+                       "max_ms": 30.0, "total_s": 0.04}
+
+    assert [row["stage"] for row in profiling.summarize(events, prefix="sy")] == ["synth"]
+    assert [row["stage"] for row in profiling.summarize(events, task=1)] == ["sim"]
+
+
+def test_spans_round_trip(trace):
+    profiling.annotate(task=3)
+
+    with profiling.span("sim", design_hash="abc") as args:
+        args["cached"] = True
+        with profiling.span("sim.compile"):
+            pass
+
+    events = profiling.read_trace()
+
+    # the inner span ends, so it is written, first
+    assert [e["name"] for e in events] == ["sim.compile", "sim"]
+    assert events[0]["cat"] == "sim"
+    assert events[0]["args"] == {"task": 3, "design_hash": "abc", "cached": True}
+
+
+def test_read_trace_skips_partial_line(trace):
+    profiling.record("synth", 0.0, 1.0)
+    with open(trace, "a") as f:
+        f.write('{"name":"sy')
+
+    assert [e["name"] for e in profiling.read_trace(trace)] == ["synth"]
+
+
+def test_no_trace(monkeypatch, trace):
+    monkeypatch.setattr(profiling, "TRACE_PATH", None)
+
+    with profiling.span("sim"):
+        pass
+
+    with pytest.raises(FileNotFoundError):
+        profiling.read_trace(trace)
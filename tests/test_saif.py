@@ -0,0 +1,56 @@
+from autoppa.saif import vcd_to_saif, vcds_to_saif
+
+VCD = """$timescale 1ps $end
+$scope module tb $end
+$scope module dut $end
+$var wire 1 ! clk $end
+$var wire 2 " q [1:0] $end
+$upscope $end
+$upscope $end
+$enddefinitions $end
+#0
+0!
+b00 "
+#10
+1!
+b11 "
+#20
+0!
+#40
+"""
+
+
+def write_vcd(path):
+    with open(path, "w") as f:
+        f.write(VCD)
+    return path
+
+
+def test_vcd_to_saif():
+    write_vcd("sim.vcd")
+
+    vcd_to_saif("sim.vcd", "sim.saif")
+
+    with open("sim.saif") as f:
+        saif = f.read()
+
+    assert saif.startswith("(SAIFILE\n")
+    assert "(TIMESCALE 1 ps)" in saif
+    assert "(DURATION 40)" in saif
+
+    # the hierarchy of the VCD scopes, and the bits of a vector with escaped brackets
+    assert saif.index("(INSTANCE tb") < saif.index("(INSTANCE dut")
+    assert "(clk (T0 30) (T1 10) (TX 0) (TC 2) (IG 0))" in saif
+    assert "(q\\[1\\] (T0 10) (T1 30) (TX 0) (TC 1) (IG 0))" in saif
+    assert saif.count("(") == saif.count(")")
+
+
+def test_shards_to_saif():
+    vcds_to_saif([write_vcd("shard0.vcd"), write_vcd("shard1.vcd")], "sim.saif")
+
+    with open("sim.saif") as f:
+        saif = f.read()
+
+    # the durations and toggle counts of the shards add up
+    assert "(DURATION 80)" in saif
+    assert "(clk (T0 60) (T1 20) (TX 0) (TC 4) (IG 0))" in saif
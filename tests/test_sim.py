@@ -0,0 +1,62 @@
+import sys
+
+import pytest
+
+from autoppa import sim
+from autoppa.process import Streamed
+from autoppa.simulators import Simulator
+
+CODE = "module mul(input a, output b);\nassign b = a;\nendmodule\n"
+
+
+class FakeSimulator(Simulator):
+    """Prints the output of each shard given by 'outputs' instead of simulating"""
+
+    label = "Fake"
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def compile(self, dut_name, source, *, task, build_dir, log_path, budget=None, debug=False):
+        return Streamed(returncode=0, tail="")
+
+    def command(self, dut_name, *, build_dir, vcd_path, dump_dut=False, shard=None):
+        # the plusargs reach the testbench of each shard
+        assert self.plusargs(vcd_path=vcd_path, shard=shard)[1:] == [f"+SHARD={shard[0]}", f"+NSHARDS={shard[1]}"]
+        return [sys.executable, "-c", f"print({self.outputs[shard[0]]!r})"]
+
+
+@pytest.fixture
+def simulate(monkeypatch):
+    def simulate(outputs):
+        monkeypatch.setattr(sim, "get_simulator", lambda name: FakeSimulator(outputs))
+        return sim._sim(CODE, work_dir="work", shards=len(outputs))
+    return simulate
+
+
+def test_shard_times_add_up(simulate):
+    result = simulate(["PASSED\nTIME: 120", "PASSED\nTIME: 80", "PASSED\nTIME: 100"])
+
+    assert result.passed
+    assert result.metric == 300
+
+    # the logs of the shards are merged in order
+    with open(result.log_path) as f:
+        assert f.read() == ("# shard 0 of 3\nPASSED\nTIME: 120\n"
+                            "# shard 1 of 3\nPASSED\nTIME: 80\n"
+                            "# shard 2 of 3\nPASSED\nTIME: 100\n")
+
+
+def test_failed_shard(simulate):
+    result = simulate(["PASSED\nTIME: 120", "FAILED at operation 7"])
+
+    assert not result.passed
+    assert result.output == "FAILED at operation 7\n"
+
+
+def test_shard_without_outcome(simulate):
+    # e.g. a testbench which $finish-ed early: no PASSED/FAILED or no TIME
+    result = simulate(["PASSED\nTIME: 120", "PASSED", "garbage"])
+
+    assert not result.passed
+    assert result.output == "PASSED\n"
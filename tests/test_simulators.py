@@ -0,0 +1,30 @@
+import pytest
+
+from autoppa.simulators import Icarus, Verilator, get_simulator
+
+
+def test_plusargs():
+    simulator = Icarus()
+
+    assert simulator.plusargs(vcd_path="a.vcd") == ["+VCD=a.vcd"]
+    assert simulator.plusargs(vcd_path="a.vcd", dump_dut=True) == ["+VCD=a.vcd", "+DUMP_DUT"]
+
+
+def test_icarus_command():
+    command = Icarus().command("mul", build_dir="build/x", vcd_path="build/x/mul.vcd", dump_dut=True)
+
+    assert command == ["vvp", "build/x/mul", "+VCD=build/x/mul.vcd", "+DUMP_DUT"]
+
+
+def test_verilator_command():
+    command = Verilator().command("mul", build_dir="build/x", vcd_path="build/x/mul.vcd")
+
+    # the testbench plusargs are the same for every backend
+    assert command == ["build/x/obj_dir/sim", "+VCD=build/x/mul.vcd"]
+
+
+def test_get_simulator():
+    assert isinstance(get_simulator("verilator"), Verilator)
+
+    with pytest.raises(ValueError):
+        get_simulator("xcelium")
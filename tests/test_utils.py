@@ -0,0 +1,46 @@
+import os
+
+from autoppa import utils
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_new_work_dir_is_unique_per_call():
+    first = utils.new_work_dir(1, "task1")
+    second = utils.new_work_dir(1, "task1")
+
+    assert first != second
+    assert os.path.isdir(first) and os.path.isdir(second)
+    assert os.path.dirname(first) == os.path.join(utils.RUNS_DIR, "task1")
+
+
+def test_new_work_dir_without_task():
+    work_dir = utils.new_work_dir(None, "task1")
+
+    assert os.path.dirname(work_dir) == os.path.join(utils.RUNS_DIR, "any")
+
+
+def test_new_work_dir_evicts_old_runs(monkeypatch):
+    monkeypatch.setattr(utils, "MAX_RUN_BYTES", 250)
+
+    runs = []
+    for i in range(3):
+        runs.append(utils.new_work_dir(1, "task1"))
+        write(os.path.join(runs[-1], "obj_dir", "sim"), "x" * 100)
+        os.utime(runs[-1], (i, i))
+
+    assert all(os.path.isdir(run) for run in runs)
+
+    latest = utils.new_work_dir(1, "task1")
+
+    # the nested files count towards the size of a run
+    assert not os.path.exists(runs[0])
+    assert all(os.path.isdir(run) for run in runs[1:] + [latest])
+
+
+def test_design_hash_ignores_comments():
+    assert utils.design_hash("module m; // a\nendmodule") == utils.design_hash("module m;\n/* b */ endmodule")
@@ -0,0 +1,73 @@
+import pytest
+
+from autoppa.process import TAIL_LINES
+from autoppa.worker import Worker, WorkerCrashed, WorkerTimeout
+
+
+class ShellWorker(Worker):
+    """POSIX shell, which doesn't echo the commands it reads"""
+
+    name = "sh"
+
+    def __init__(self):
+        super().__init__(["sh"])
+
+    def wrap(self, script, marker):
+        return f"{script}\necho {marker}"
+
+    def reported_error(self, line):
+        return "ERROR:" in line
+
+
+@pytest.fixture
+def worker():
+    worker = ShellWorker()
+    yield worker
+    worker.stop()
+
+
+def test_run(worker):
+    output, failed = worker.run("echo a; echo b")
+
+    assert output == "a\nb\n"
+    assert not failed
+
+    # the same process runs the next batch
+    pid = worker.process.pid
+    worker.run("true")
+    assert worker.process.pid == pid
+
+
+def test_tail_is_bounded_and_lines_are_passed_on(worker):
+    lines = []
+    output, failed = worker.run(f"echo 'ERROR: early'; seq {TAIL_LINES + 10}", log_path="sh.log",
+                                on_line=lines.append)
+
+    # the error is out of the tail but still reported
+    assert failed
+    assert output.splitlines()[0] == "[... 11 lines omitted, see sh.log]"
+    assert output.splitlines()[1:] == [str(i) for i in range(11, TAIL_LINES + 11)]
+
+    assert len(lines) == TAIL_LINES + 11
+    with open("sh.log") as f:
+        assert f.read() == "".join(lines)
+
+
+def test_crash_restarts_the_process(worker):
+    with pytest.raises(WorkerCrashed) as e:
+        worker.run("echo 'ERROR: fatal'; exit 1")
+
+    assert e.value.output == "ERROR: fatal\n"
+    assert e.value.failed
+
+    output, _ = worker.run("echo again")
+    assert output == "again\n"
+
+
+def test_timeout(worker):
+    # exec, otherwise the sleep would keep the pipe open after the shell is killed
+    with pytest.raises(WorkerTimeout) as e:
+        worker.run("echo start; exec sleep 30", timeout=0.5)
+
+    assert e.value.output == "start\n"
+    assert not worker.alive()